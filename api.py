@@ -1,16 +1,21 @@
 # === Updated api.py ===
+import time
+startup_begin = time.perf_counter()
+
 import multiprocessing
 import requests
 import warnings
 import json
-import time
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from app_batch import AppBatch
 from app_imaging import AppImaging
 from app_llm import AppLLM
+from app_llm_cache import AppLLMCache
 from app_logger import AppLogger
 from app_code_fixer import AppCodeFixer
+from app_http import AppHttpTransport
 from app_mongo import AppMongoDb
 from app_mq import AppMessageQueue
 from config import Config
@@ -20,15 +25,27 @@ from urllib3.exceptions import InsecureRequestWarning
 
 requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
 
+# Startup timing breakdown, in seconds (the Mongo client and the token encoding are only created on first use)
+startup_timings = {"imports": time.perf_counter() - startup_begin}
+
 app = Flask(__name__)
 CORS(app)
 app.config.from_object(Config)
 
+step_begin = time.perf_counter()
 mongo_db = AppMongoDb(app.config)
 app_logger = AppLogger(mongo_db)
-ai_model = AppLLM(app_logger, app.config)
-imaging = AppImaging(app_logger, app.config)
-code_fixer = AppCodeFixer(app_logger, mongo_db, ai_model, imaging)
+transport = AppHttpTransport(app.config)
+startup_timings["clients"] = time.perf_counter() - step_begin
+
+step_begin = time.perf_counter()
+llm_cache = AppLLMCache(mongo_db, app.config)
+ai_model = AppLLM(app_logger, app.config, transport, llm_cache)
+imaging = AppImaging(app_logger, app.config, transport)
+batch_runner = AppBatch(app_logger, app.config, transport, mongo_db)
+code_fixer = AppCodeFixer(app_logger, mongo_db, ai_model, imaging, app.config, batch_runner)
+startup_timings["components"] = time.perf_counter() - step_begin
+startup_timings["total"] = time.perf_counter() - startup_begin
 
 def reset_processing_to_queued():
     try:
@@ -52,7 +69,8 @@ def request_worker():
 
     while True:
         try:
-            doc = queue.get("status_queue", filter_by={"status": "queued"})
+            # A request in batch mode is re-queued with "not_before" while its batch job runs
+            doc = queue.get("status_queue", filter_by={"status": "queued", "$or": [{"not_before": {"$exists": False}}, {"not_before": {"$lte": time.time()}}]})
             if doc:
                 request_id = doc.get("request_id")
                 # retry_count = int(doc.get("retry_count", 0)) + 1
@@ -67,7 +85,6 @@ def request_worker():
                 start_datetime = get_timestamp()
 
                 result = code_fixer.process_request_logic(request_id, mongo_db)
-                status = "completed" if result.get("status") == "success" else "failed"
 
                 end_datetime = get_timestamp()
 
@@ -75,7 +92,14 @@ def request_worker():
                 collection = mongo_db.get_collection("status_queue")
                 doc = collection.find_one({"request_id": request_id})
 
-                if doc:
+                if doc and result.get("status") == "batch_pending":
+                    # The worker is released while the batch job runs: the request is polled again after the interval
+                    collection.update_one(
+                        {"request_id": request_id},
+                        {"$set": {"status": "queued", "not_before": time.time() + batch_runner.poll_interval}}
+                    )
+                elif doc:
+                    status = "completed" if result.get("status") == "success" else "failed"
                     #Update the document in MongoDB
                     result = collection.update_one(
                         {"request_id": request_id},
@@ -103,6 +127,59 @@ def check_mongodb_connection():
     except Exception as e:
         return {"status": 500, "error": str(e)}, 500
 
+# Stats providers by name, served by /Stats: each one returns the JSON-serializable counters of a component
+stats_providers = {
+    "startup": lambda: {
+        "startup_timings_in_seconds": {step: round(duration, 3) for step, duration in startup_timings.items()},
+        "tokenizer": ai_model.encoding.stats(),
+    },
+    "http_transport": transport.stats,
+    "model_rate_limiter": ai_model.rate_limiter.stats,
+    "model_routing": ai_model.router.stats,
+    "model_endpoints": lambda: {route.name: route.pool.stats() for route in ai_model.router.routes},
+    "model_streaming": ai_model.stream_stats,
+    "model_json_repair": ai_model.json_repair.stats,
+    "model_cache": llm_cache.stats,
+    "token_counter": ai_model.token_counter.stats,
+    "prompt_packer": code_fixer.prompt_packer.stats,
+    "cleanup": code_fixer.cleanup_stats,
+    "syntax_validation": code_fixer.syntax_validator.stats,
+    "pipeline": code_fixer.pipeline_stats,
+    "imaging_cache": imaging.cache_stats,
+}
+
+def collect_stats(names):
+    # A failing provider reports its error without failing the others
+    stats = {}
+    for name in names:
+        try:
+            stats[name] = stats_providers[name]()
+        except Exception as e:
+            stats[name] = {"error": str(e)}
+    return stats
+
+@app.route("/api-python/v1/Stats")
+@app.route("/api-python/v1/Stats/<string:name>")
+def get_stats(name=None):
+    # Every provider, one of them (/Stats/<name>), or a comma-separated list of them (?names=a,b)
+    try:
+        names = [name] if name else [item.strip() for item in request.args.get("names", "").split(",") if item.strip()]
+        unknown = [item for item in names if item not in stats_providers]
+        if unknown:
+            return {"status": 404, "error": f"Unknown stats: {', '.join(unknown)}", "available": list(stats_providers)}, 404
+        return {"status": 200, "stats": collect_stats(names or list(stats_providers))}, 200
+    except Exception as e:
+        return {"status": 500, "error": str(e)}, 500
+
+@app.route("/api-python/v1/InvalidateImagingCache/<string:tenant>/<string:application>", methods=["POST"])
+def invalidate_imaging_cache(tenant, application):
+    # To be called whenever a new Imaging analysis of the application is published
+    try:
+        invalidated = imaging.invalidate(tenant, application)
+        return {"status": 200, "tenant": tenant, "application": application, "invalidated_entries": invalidated}, 200
+    except Exception as e:
+        return {"status": 500, "error": str(e)}, 500
+
 @app.route("/api-python/v1/ProcessRequest/<string:request_id>")
 def process_request(request_id):
     try:
@@ -165,6 +242,7 @@ def list_pending_requests():
         return {"status": "error", "message": str(e), "code": 500}, 500
 
 if __name__ == "__main__":
+    ai_model.encoding.preload()  # in the background, the server does not wait for it
     reset_processing_to_queued()  # run only once on startup
 
     worker_threads = []
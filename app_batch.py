@@ -0,0 +1,194 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from flask import Config as FlaskConfig
+from app_batch_local import LocalFileBatch
+from app_batch_openai import OpenAIBatch
+from app_http import AppHttpTransport
+from app_logger import AppLogger
+from app_mongo import AppMongoDb
+
+class AppLLMBatch:
+    """
+    Model calls of one request in batch mode.
+
+    A request is processed in rounds: every model call of a round either finds its answer in
+    the batch results of the previous rounds, or is recorded as pending and its pipeline item is
+    parked. The pending calls are then submitted as one provider batch job; once it completes,
+    only the parked items resume, with the results, until a round ends without any pending call.
+
+    The job and the answers are also kept in Mongo (BatchJobs, BatchAnswers), so that any worker,
+    or the same one after a restart, resumes the request without submitting its job again.
+    """
+    PENDING = "Pending in batch job."  # message of a model call recorded for the next batch job
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.answers = {}  # custom id -> completion body, or {"error": message}
+        self.pending = {}  # custom id -> request body
+        self.rounds = 0
+        self.job_id = None  # provider job of the current round
+        self.submitted_at = None  # wall clock, the job may be polled by another worker
+        self.lock = threading.Lock()
+
+    def lookup(self, custom_id):
+        with self.lock:
+            return self.answers.get(custom_id)
+
+    def add(self, custom_id, body):
+        with self.lock:
+            self.pending[custom_id] = body
+
+    def merge(self, answers):
+        with self.lock:
+            self.answers.update(answers)
+            self.pending = {}
+            self.job_id = None
+            self.rounds += 1
+
+class AppBatch:
+    def __init__(self, app_logger: AppLogger, config: FlaskConfig, transport: AppHttpTransport, mongo_db: AppMongoDb = None):
+        self.config = config
+        self.mongo_db = mongo_db
+        self.app_logger = app_logger
+        self.transport = transport
+        self.vendor = config["BATCH_VENDOR"]
+        # Independent of the working directory of the process
+        self.batch_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), config["BATCH_DIR"])
+        self.poll_interval = float(config["BATCH_POLL_INTERVAL_IN_SECONDS"])
+        self.timeout = float(config["BATCH_TIMEOUT_IN_SECONDS"])
+        self.max_rounds = int(config["BATCH_MAX_ROUNDS"])
+        self.min_objects = int(config["BATCH_MIN_OBJECTS"])
+        self.backend = self.open() if self.vendor else None
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"  # owner of the jobs this worker polls
+
+    def open(self):
+        if self.vendor == 'openai':
+            return OpenAIBatch(self.config, self.transport)
+        elif self.vendor == 'local':
+            return LocalFileBatch(self.config, self.transport)
+        else:
+            raise NotImplementedError(f"Unsupported batch vendor: {self.vendor}")
+
+    def is_batch_request(self, request, object_count):
+        # Explicit "batchmode" flag of the request, or a request large enough to be latency-insensitive
+        if self.backend is None:
+            return False
+        return bool(request.get("batchmode", False)) or (self.min_objects > 0 and object_count >= self.min_objects)
+
+    def exhausted(self, batch: AppLLMBatch):
+        return batch.rounds >= self.max_rounds
+
+    def record(self, request_id):
+        """
+        Stored batch job of the request ({"owner", "job_id", "submitted_at", "rounds", "pending"}), or None.
+        """
+        if self.backend is None or self.mongo_db is None:
+            return None
+        return self.mongo_db.get_collection("BatchJobs").find_one({"request_id": request_id})
+
+    def restore(self, record):
+        """
+        Rebuilds the batch of a stored job record, with the answers of its completed rounds.
+        """
+        batch = AppLLMBatch(record["request_id"])
+        batch.job_id = record.get("job_id")
+        batch.submitted_at = record.get("submitted_at")
+        batch.rounds = int(record.get("rounds", 0))
+        if batch.job_id is not None:
+            # The bodies are only needed to submit a job, a stored job is polled
+            batch.pending = {custom_id: None for custom_id in record.get("pending", [])}
+        for answer in self.mongo_db.get_collection("BatchAnswers").find({"request_id": batch.request_id}):
+            batch.answers[answer["custom_id"]] = answer["answer"]
+        return batch
+
+    def save(self, batch: AppLLMBatch):
+        # Also takes the job over: only its owner keeps the request in memory
+        if self.mongo_db is None:
+            return
+        with batch.lock:
+            pending = list(batch.pending)
+        self.mongo_db.get_collection("BatchJobs").update_one(
+            {"request_id": batch.request_id},
+            {"$set": {"owner": self.worker_id, "job_id": batch.job_id, "submitted_at": batch.submitted_at,
+                      "rounds": batch.rounds, "pending": pending}},
+            upsert=True)
+
+    def forget(self, request_id):
+        if self.mongo_db is None:
+            return
+        self.mongo_db.get_collection("BatchJobs").delete_one({"request_id": request_id})
+        self.mongo_db.get_collection("BatchAnswers").delete_many({"request_id": request_id})
+
+    def submit(self, batch: AppLLMBatch):
+        """
+        Submits the pending calls of the batch as one job (JSONL in, JSONL out), without waiting for it.
+        """
+        if self.exhausted(batch):
+            raise RuntimeError(f"Batch of request {batch.request_id} still pending after {batch.rounds} rounds")
+
+        os.makedirs(self.batch_dir, exist_ok=True)
+        input_path = os.path.join(self.batch_dir, f"{batch.request_id}-{batch.rounds + 1}-input.jsonl")
+        with batch.lock:
+            pending = dict(batch.pending)
+        with open(input_path, "w", encoding="utf-8") as input_file:
+            for custom_id, body in pending.items():
+                line = {"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}
+                input_file.write(json.dumps(line) + "\n")
+
+        batch.job_id = self.backend.submit(input_path)
+        batch.submitted_at = time.time()
+        print(f"Batch job {batch.job_id} submitted for requestid - {batch.request_id} ({len(pending)} calls, round {batch.rounds + 1}).")
+        self.save(batch)
+        return batch.job_id
+
+    def poll(self, batch: AppLLMBatch):
+        """
+        Checks the job of the batch once. Returns False while it runs; otherwise merges its results and returns True.
+        A job that failed, expired or timed out answers each of its calls with an error. An error of the provider is
+        raised within the timeout, to poll again later; past it the job is given up as unreachable.
+        """
+        job_id = batch.job_id
+        try:
+            status = self.backend.poll(job_id)
+        except Exception as e:
+            if time.time() - batch.submitted_at <= self.timeout:
+                raise
+            status = f"unreachable: {e}"
+        if status not in ("completed", "failed", "expired", "cancelled") and not status.startswith("unreachable"):
+            if time.time() - batch.submitted_at <= self.timeout:
+                return False
+            try:
+                self.backend.cancel(job_id)
+            except Exception as e:
+                self.app_logger.log_error("batch_run", f"Batch job {job_id} could not be cancelled: {e}", batch.request_id)
+            status = f"timed out after {self.timeout} seconds"
+
+        with batch.lock:
+            pending = dict(batch.pending)
+        answers = {}
+        if status == "completed":
+            for line in self.backend.results(job_id):
+                response = line.get("response") or {}
+                if response.get("status_code") == 200:
+                    answers[line["custom_id"]] = response["body"]
+                else:
+                    error = line.get("error") or response.get("body")
+                    answers[line["custom_id"]] = {"error": f"Batch call failed: {error}"}
+                    self.app_logger.log_error("batch_run", f"Batch call {line['custom_id']} of job {job_id} failed: {error}", batch.request_id)
+        else:
+            self.app_logger.log_error("batch_run", f"Batch job {job_id} ended with status {status}", batch.request_id)
+        for custom_id in pending:
+            # A call absent from the output would otherwise be submitted again and again
+            answers.setdefault(custom_id, {"error": f"Batch call missing from the output of job {job_id} ({status})"})
+        if self.mongo_db is not None and answers:
+            self.mongo_db.get_collection("BatchAnswers").insert_many(
+                [{"request_id": batch.request_id, "custom_id": custom_id, "answer": answer} for custom_id, answer in answers.items()])
+        batch.merge(answers)
+        self.save(batch)
+        print(f"Batch job {job_id} {status} for requestid - {batch.request_id}.")
+        return True
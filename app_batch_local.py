@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+import uuid
+
+from flask import Config as FlaskConfig
+from app_http import AppHttpTransport
+from app_llm_router import AppLLMRouter
+
+class LocalFileBatch:
+    """
+    File-based stand-in for a provider batch service, for tests and local runs.
+
+    A job is a directory under BATCH_DIR: the JSONL input is copied there, then a background thread
+    sends every line to the endpoint of its model and writes the JSONL output in the provider format.
+    """
+    def __init__(self, config: FlaskConfig, transport: AppHttpTransport):
+        self.batch_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), config["BATCH_DIR"])
+        self.router = AppLLMRouter(config)
+        self.transport = transport
+
+    def __job_path(self, job_id, name):
+        return os.path.join(self.batch_dir, job_id, name)
+
+    def __write_status(self, job_id, status):
+        with open(self.__job_path(job_id, "status"), "w", encoding="utf-8") as status_file:
+            status_file.write(status)
+
+    def __process(self, job_id):
+        try:
+            with open(self.__job_path(job_id, "input.jsonl"), encoding="utf-8") as input_file, \
+                    open(self.__job_path(job_id, "output.jsonl"), "w", encoding="utf-8") as output_file:
+                for line in input_file:
+                    if not line.strip():
+                        continue
+                    if os.path.exists(self.__job_path(job_id, "cancel")):
+                        self.__write_status(job_id, "cancelled")
+                        return
+                    call = json.loads(line)
+                    endpoint = self.router.for_model(call["body"]["model"]).pool.select()
+                    response = self.transport.post(endpoint.url, headers=endpoint.headers, json=call["body"])
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        body = response.text
+                    output = {"id": uuid.uuid4().hex, "custom_id": call["custom_id"], "response": {"status_code": response.status_code, "body": body}, "error": None}
+                    output_file.write(json.dumps(output) + "\n")
+            self.__write_status(job_id, "completed")
+        except Exception as e:
+            print(f"Local batch job {job_id} failed: {e}")
+            self.__write_status(job_id, "failed")
+
+    def submit(self, input_path):
+        job_id = f"batch_{uuid.uuid4().hex}"
+        os.makedirs(os.path.join(self.batch_dir, job_id))
+        with open(input_path, encoding="utf-8") as source, open(self.__job_path(job_id, "input.jsonl"), "w", encoding="utf-8") as target:
+            target.write(source.read())
+        self.__write_status(job_id, "in_progress")
+        threading.Thread(target=self.__process, args=(job_id,), daemon=True).start()
+        return job_id
+
+    def poll(self, job_id):
+        with open(self.__job_path(job_id, "status"), encoding="utf-8") as status_file:
+            return status_file.read().strip()
+
+    def cancel(self, job_id):
+        open(self.__job_path(job_id, "cancel"), "w").close()
+
+    def results(self, job_id):
+        with open(self.__job_path(job_id, "output.jsonl"), encoding="utf-8") as output_file:
+            return [json.loads(line) for line in output_file if line.strip()]
@@ -0,0 +1,52 @@
+import json
+
+from flask import Config as FlaskConfig
+from app_http import AppHttpTransport
+
+class OpenAIBatch:
+    # OpenAI Batch API: upload the JSONL input file, create the batch job, download the JSONL output file
+    def __init__(self, config: FlaskConfig, transport: AppHttpTransport):
+        self.base_url = config["BATCH_URL"].rstrip("/")
+        self.completion_window = config["BATCH_COMPLETION_WINDOW"]
+        self.headers = {"Authorization": f"Bearer {config['MODEL_API_KEY']}"}
+        self.transport = transport
+
+    def submit(self, input_path):
+        with open(input_path, "rb") as input_file:
+            file_response = self.transport.post(
+                f"{self.base_url}/files",
+                headers=self.headers,
+                data={"purpose": "batch"},
+                files={"file": (input_path.replace("\\", "/").split("/")[-1], input_file, "application/jsonl")},
+            )
+        file_response.raise_for_status()
+
+        batch_response = self.transport.post(
+            f"{self.base_url}/batches",
+            headers=self.headers,
+            json={"input_file_id": file_response.json()["id"], "endpoint": "/v1/chat/completions", "completion_window": self.completion_window},
+        )
+        batch_response.raise_for_status()
+        return batch_response.json()["id"]
+
+    def poll(self, job_id):
+        response = self.transport.get(f"{self.base_url}/batches/{job_id}", headers=self.headers)
+        response.raise_for_status()
+        return response.json()["status"]
+
+    def cancel(self, job_id):
+        self.transport.post(f"{self.base_url}/batches/{job_id}/cancel", headers=self.headers)
+
+    def results(self, job_id):
+        response = self.transport.get(f"{self.base_url}/batches/{job_id}", headers=self.headers)
+        response.raise_for_status()
+        job = response.json()
+
+        lines = []
+        for file_id in (job.get("output_file_id"), job.get("error_file_id")):
+            if not file_id:
+                continue
+            content_response = self.transport.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers)
+            content_response.raise_for_status()
+            lines.extend(json.loads(line) for line in content_response.text.splitlines() if line.strip())
+        return lines
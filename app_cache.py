@@ -0,0 +1,63 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+_MISSING = object()
+
+class AppCache:
+    """
+    Thread-safe in-memory cache with capacity-bounded LRU eviction and an optional time-to-live.
+
+    max_size <= 0 means unbounded, ttl <= 0 means entries never expire.
+    """
+    def __init__(self, max_size, ttl=0):
+        self.max_size = int(max_size)
+        self.ttl = float(ttl)
+        self.entries = OrderedDict()  # key -> (value, expiry), least recently used first
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self.lock:
+            value, expiry = self.entries.get(key, (_MISSING, 0))
+            if value is not _MISSING and expiry and expiry <= now:
+                del self.entries[key]
+                self.counters["expirations"] += 1
+                value = _MISSING
+            if value is _MISSING:
+                self.counters["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def set(self, key, value):
+        expiry = time.monotonic() + self.ttl if self.ttl > 0 else 0
+        with self.lock:
+            self.entries[key] = (value, expiry)
+            self.entries.move_to_end(key)
+            while self.max_size > 0 and len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, predicate=None):
+        # Drop every entry whose key matches predicate (all entries when predicate is None)
+        with self.lock:
+            keys = [key for key in self.entries if predicate is None or predicate(key)]
+            for key in keys:
+                del self.entries[key]
+            self.counters["invalidations"] += len(keys)
+            return len(keys)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_size": self.max_size,
+                "ttl_in_seconds": self.ttl,
+            }
@@ -0,0 +1,76 @@
+import re
+
+# Lines of the header section of a source file: package, imports, includes...
+HEADER_LINE = re.compile(r"^\s*(package|import|using|#\s*include|from\s+\S+\s+import|require|use|namespace|module|library)\b")
+REGION_MARKER = "@@@ REGION {number} @@@"
+REGION_MARKER_LINE = re.compile(r"^[ \t]*@@@ REGION (\d+) @@@[ \t]*\r?$", re.MULTILINE)
+
+class AppCleanupRegions:
+    """
+    Regions of a modified file sent to the syntax cleanup instead of the whole file.
+
+    The regions are the changed line ranges, in the coordinates of the modified file, widened by
+    context_lines on each side, plus the header section (package, imports) where missing imports
+    are added. Overlapping or adjacent regions are merged. The regions are sent as one code block,
+    each one introduced by a marker line, and the answer is spliced back region by region.
+    """
+    def __init__(self, lines, changed_ranges, context_lines, header_max_lines):
+        self.lines = lines  # lines of the modified file, with their line breaks
+        line_count = len(lines)
+
+        regions = [(max(start - context_lines, 1), min(end + context_lines, line_count)) for start, end in changed_ranges]
+
+        header_end = 0
+        for number, line in enumerate(lines[:header_max_lines], 1):
+            if HEADER_LINE.match(line):
+                header_end = number
+        if header_end:
+            regions.append((1, header_end))
+
+        self.regions = []
+        for start, end in sorted(regions):
+            if start > end:
+                continue
+            if self.regions and start <= self.regions[-1][1] + 1:
+                self.regions[-1] = (self.regions[-1][0], max(self.regions[-1][1], end))
+            else:
+                self.regions.append((start, end))
+
+    # private methods
+    def __region_text(self, start, end):
+        return "".join(self.lines[start - 1:end])
+
+    # public methods
+    def line_count(self):
+        return sum(end - start + 1 for start, end in self.regions)
+
+    def coverage(self):
+        # Part of the file covered by the regions
+        return self.line_count() / len(self.lines) if self.lines else 1.0
+
+    def render(self):
+        blocks = []
+        for number, (start, end) in enumerate(self.regions, 1):
+            text = self.__region_text(start, end)
+            blocks.append(f"{REGION_MARKER.format(number=number)}\n{text[:-1] if text.endswith(chr(10)) else text}")
+        return "\n".join(blocks)
+
+    def splice(self, code):
+        """
+        Returns the text of the file with the regions replaced by the ones of the cleaned code,
+        or None when the markers of the answer do not match the regions that were sent.
+        """
+        parts = REGION_MARKER_LINE.split(code)
+        numbers = parts[1::2]
+        if numbers != [str(number) for number in range(1, len(self.regions) + 1)]:
+            return None
+
+        lines = list(self.lines)
+        for (start, end), body in reversed(list(zip(self.regions, parts[2::2]))):
+            # The body runs from the line break ending the marker line to the one starting the next marker line
+            body = body[1:] if body.startswith("\n") else body
+            body = body[:-1] if body.endswith("\n") else body
+            if self.__region_text(start, end).endswith("\n"):
+                body += "\n"
+            lines[start - 1:end] = [body]
+        return "".join(lines)
@@ -1,250 +1,288 @@
-import ast
-import json
 import logging
-import pandas as pd
-
+import re
+import threading
+import time
+
+from flask import Config as FlaskConfig
+from app_batch import AppBatch, AppLLMBatch
+from app_cleanup_regions import AppCleanupRegions
+from app_context_records import AppExceptionTable, AppImpactRecord
+from app_dependent_checks import AppDependentCheck, AppDependentChecks
+from app_file_edits import AppEditAccumulator, AppFileBarrier
 from app_imaging import AppImaging
+from app_line_splice import AppLineSplice
 from app_llm import AppLLM
+from app_llm_schema import DEPENDENT_RESPONSE_SCHEMA, FIX_RESPONSE_SCHEMA, FULLFILE_RESPONSE_SCHEMA
 from app_logger import AppLogger
 from app_mongo import AppMongoDb
-from utils import generate_unique_alphanumeric, get_timestamp, replace_lines
+from app_pipeline import AppPipeline, AppPipelineStage, AppPipelineStats
+from app_prefetch import AppImagingPrefetcher
+from app_prompt_packer import AppPromptItem, AppPromptPacker
+from app_syntax_validator import AppSyntaxValidator
+from utils import generate_unique_alphanumeric, get_timestamp
+
+class AppObjectJob:
+    # One object of a request, carried through the object stages of the request pipeline
+    def __init__(self, index, object_id, prompt_content, request):
+        self.index = index  # input order of the object in the request
+        self.object_id = object_id
+        self.prompt_content = prompt_content
+        self.request = request  # state shared by the objects of the request
+        self.output = {"objects": [], "edits": AppEditAccumulator()}
+        self.object_dictionary = {"objectid": object_id, "status": "", "message": ""}
+        self.done = False  # set when the object leaves the fix path early, the next object stages skip it
+        self.context = None
+        self.object_type = None
+        self.object_signature = None
+        self.object_technology = ""
+        self.exceptions = AppExceptionTable()
+        self.impacts = []
+        self.prompt = None
+        self.prompt_tokens = 0
+        self.target_response_size = 0
+        self.response_content = None
+        self.file_path = None
+        self.check_dependents = False
 
 class AppCodeFixer:
-    def __init__(self, app_logger: AppLogger, mongo_db: AppMongoDb, ai_model: AppLLM, imaging: AppImaging):
+    def __init__(self, app_logger: AppLogger, mongo_db: AppMongoDb, ai_model: AppLLM, imaging: AppImaging, config: FlaskConfig, batch_runner: AppBatch = None):
         self.app_logger = app_logger
         self.mongo_db = mongo_db
         self.llm = ai_model
         self.imaging = imaging
-        self.first_prompt = True
+        self.prefetch_max_objects = int(config["PREFETCH_MAX_OBJECTS"])
+        self.batch_runner = batch_runner
+        self.batch_requests = {}  # request_id -> pipeline state of the requests waiting for their batch job
+        self.batch_lock = threading.Lock()
+        self.pipeline_queue_size = int(config["PIPELINE_QUEUE_SIZE"])
+        self.pipeline_workers = {
+            "fetch-context": int(config["PIPELINE_FETCH_CONTEXT_WORKERS"]),
+            "build-prompt": int(config["PIPELINE_BUILD_PROMPT_WORKERS"]),
+            "fix": int(config["PIPELINE_FIX_WORKERS"]),
+            "dependent-check": int(config["PIPELINE_DEPENDENT_CHECK_WORKERS"]),
+            "assemble-file": int(config["PIPELINE_ASSEMBLE_FILE_WORKERS"]),
+            "cleanup": int(config["PIPELINE_CLEANUP_WORKERS"]),
+            "persist": int(config["PIPELINE_PERSIST_WORKERS"]),
+        }
+        self.pipeline_metrics = AppPipelineStats()  # shared by the pipelines of all requests
+        self.prompt_packer = AppPromptPacker(ai_model.token_counter)
+        self.status_lock = threading.Lock()  # objects_list of status_queue is updated by concurrent object tasks
+        self.cleanup_mode = config["CLEANUP_MODE"]
+        self.cleanup_context_lines = int(config["CLEANUP_CONTEXT_LINES"])
+        self.cleanup_header_max_lines = int(config["CLEANUP_HEADER_MAX_LINES"])
+        self.cleanup_max_coverage = float(config["CLEANUP_MAX_COVERAGE"])
+        self.cleanup_counters = {"full_files": 0, "region_files": 0, "regions": 0, "lines_sent": 0, "lines_total": 0, "splice_failures": 0, "too_long": 0, "validated_files": 0}
+        self.syntax_validator = AppSyntaxValidator(config)
 
     # private methods
-    def __gen_code_connected_json(
-        self,
-        ApplicationName,
-        TenantName,
-        RepoName,
-        ObjectID,
-        PromptContent,
-        json_resp,
-        engine_output,
-        request_id,
-        mongo_db
-    ):
+    def __stage_fetch_context(self, job: AppObjectJob):
+        # Imaging context of the object, resolved by the request prefetch stage
+        request = job.request
+        object_dictionary = job.object_dictionary
         try:
-
-            object_dictionary = {"objectid": ObjectID, "status": "", "message": ""}
-            content_info_dictionary = {"filefullname": "", "objects":[], "originalfilecontent": ""}
-
-            object_id = ObjectID
+            object_id = job.object_id
             logging.info("---------------------------------------------------------------------------------------------------------------------------------------")
             logging.info(f"\n Processing object_id -> {object_id}.....")
 
-            # Initialize DataFrames to store exceptions and impacts
-            exceptions = pd.DataFrame(columns=["link_type", "exception"])
-            impacts = pd.DataFrame(columns=["object_type", "object_signature", "object_link_type", "object_code"])
-
-            # Construct URL to fetch object details
-            object_response, object_url = self.imaging.get_source_locations(TenantName, ApplicationName, object_id)
+            context = job.context = request["prefetcher"].get_context(object_id)
 
-            # Check if object details were fetched successfully
-            if object_response.status_code == 200:
-                object_data = object_response.json()  # Parse object data
-                object_type = object_data["typeId"]  # Get object type
-                object_signature = object_data["mangling"]  # Get object signature
-                object_technology = object_data.get("programmingLanguage", {}).get("name", "")
-
-                source_locations = object_data.get("sourceLocations")
-                if not source_locations:
-                    object_dictionary["status"] = "failure"
-                    object_dictionary["message"] = f"failed because of reason: sourceLocations not available for this object from Imaging API -> {object_url}"
-                    print(object_dictionary["message"])
-                    engine_output["objects"].append(object_dictionary)
-                    return engine_output
-                
-                if object_data["external"] == "true":
-                    object_dictionary["status"] = "failure"
-                    object_dictionary["message"] = f"failed because of reason: It is an external object and it does not contains sourceLocations."
-                    print(object_dictionary["message"])
-                    engine_output["objects"].append(object_dictionary)
-                    return engine_output
-
-                source_location = object_data["sourceLocations"][0]  # Extract source location
-                object_source_path = source_location["filePath"]  # Get source file path
-                object_field_id = source_location["fileId"]  # Get file ID
-                object_start_line = source_location["startLine"]  # Get start line number
-                object_end_line = source_location["endLine"]  # Get end line number
-
-                # fetch object code
-                obj_code = self.imaging.get_source('object', TenantName, ApplicationName, object_field_id, object_start_line, object_end_line, request_id)
-                if obj_code is None:
+            object_data = context["object_data"]
+            if object_data is None or context["failure"]:
+                object_dictionary["status"] = "failure"
+                object_dictionary["message"] = context["failure"] or f"Failed to fetch object {object_id} using Imaging API."
+                print(object_dictionary["message"])
+                job.output["objects"].append(object_dictionary)
+                job.done = True
+                return [job]
+
+            job.object_type = object_data["typeId"]  # Get object type
+            job.object_signature = object_data["mangling"]  # Get object signature
+            job.object_technology = object_data.get("programmingLanguage", {}).get("name", "")
+
+            # Process each exception for the current object
+            for object_exception in context["callees"]:
+                link_type = object_exception.get("linkType", "").lower()  # Get link type
+                if link_type in ["raise","throw","catch"]:  # Check for relevant link types
+                    job.exceptions.append(object_exception.get("linkType", ""), object_exception.get("name", ""))
+
+            # Process each impact object, in the original caller order
+            for impact_status, impact_result in context["impacts"]:
+                if impact_status != "success":
                     object_dictionary["status"] = "failure"
-                    object_dictionary["message"] = f"Failed to fetch object code using Imaging API for fileId={object_field_id}, startLine={object_start_line}, endLine={object_end_line}."
+                    object_dictionary["message"] = impact_result
                     print(object_dictionary["message"])
-                    engine_output["objects"].append(object_dictionary)
-                    return engine_output
-
-                # Fetch callees for the current object
-                object_callees_response, object_callees_url = self.imaging.get_callees(TenantName, ApplicationName, object_id)
-
-                # Check if callees were fetched successfully
-                if object_callees_response.status_code == 200:
-                    object_exceptions = object_callees_response.json()  # Parse exceptions data
-                    # Process each exception for the current object
-                    for object_exception in object_exceptions:
-                        link_type = object_exception.get("linkType", "").lower()  # Get link type
-                        if link_type in ["raise","throw","catch"]:  # Check for relevant link types
-                            new_row = pd.DataFrame( { "link_type": [object_exception.get("linkType", "")],"exception": [object_exception.get("name", "")],})
-                            exceptions = pd.concat([exceptions, new_row], ignore_index=True)  # Append to exceptions DataFrame
-                else:
-                    logging.error(f"Failed to fetch callees using {object_callees_url}. Status code: {object_callees_response.status_code}")
-
-                # Fetch callers for the current object
-                object_callers_response, object_callers_url = self.imaging.get_callers(TenantName, ApplicationName, object_id)
-
-                # Check if callers were fetched successfully
-                if object_callers_response.status_code == 200:
-                    impact_objects = object_callers_response.json()  # Parse impact objects data
-                    # Process each impact object
-                    for impact_object in impact_objects:
-                        impact_object_id = impact_object.get("id")  # Get impact object ID
-                        impact_object_response, impact_object_url = self.imaging.get_source_locations(TenantName, ApplicationName, impact_object_id)
-
-                        # Check if impact object data was fetched successfully
-                        if impact_object_response.status_code == 200:
-                            impact_object_data = (impact_object_response.json())  # Parse impact object data
-                            impact_object_type = impact_object_data.get("typeId", "")  # Get impact object type
-                            impact_object_signature = impact_object_data.get("mangling", "")  # Get impact object signature
-                            impact_object_source_locations = impact_object_data.get("sourceLocations")
-                            if not impact_object_source_locations:
-                                object_dictionary["status"] = "failure"
-                                object_dictionary["message"] = f"failed because of reason: sourceLocations not available for impact object from Imaging API -> {impact_object_url}"
-                                print(object_dictionary["message"])
-                                engine_output["objects"].append(object_dictionary)
-                                continue  # Skip this impact object
-                            impact_object_source_location = impact_object_source_locations[0]  # Extract source location
-                            impact_object_source_path = impact_object_source_location["filePath"]  # Get source file path
-                            impact_object_field_id = int(impact_object_source_location["fileId"])  # Get file ID
-                            impact_object_start_line = int(impact_object_source_location["startLine"])  # Get start line number
-                            impact_object_end_line = int(impact_object_source_location["endLine"])  # Get end line number
-
-                            if impact_object_data["external"] == "true":
-                                object_dictionary["status"] = "failure"
-                                object_dictionary["message"] = f"failed because of reason: It is an external object and it does not contains sourceLocations."
-                                print(object_dictionary["message"])
-                                engine_output["objects"].append(object_dictionary)
-                                return engine_output
-
-                            impact_object_full_code = self.imaging.get_source('impact object', TenantName, ApplicationName, impact_object_field_id, impact_object_start_line, impact_object_end_line, request_id)
-                            if impact_object_full_code is None:
-                                logging.error(f"Failed to fetch impact object code using {impact_object_url}. Status code: 404 or not found.")
-                                impact_object_full_code = ""  # Or handle as needed
-
-                        else:
-                            impact_object_type = ""
-                            impact_object_signature = ""
-                            logging.error(f"Failed to fetch impact object data using {impact_object_url}. Status code: {impact_object_response.status_code}")
-
-                        impact_object_link_type = impact_object.get("linkType", "")  # Get link type for impact object
-
-                        # Handle bookmarks associated with the impact object
-                        bookmarks = impact_object.get("bookmarks")
-                        if not bookmarks:
-                            impact_object_bookmark_code = ""
-                        else:
-                            bookmark = bookmarks[0]
-                            impact_object_bookmark_field_id = bookmark.get("fileId", "")  # Get file ID from bookmark
-                            # Calculate start and end lines for impact object code
-                            impact_object_bookmark_start_line = max(int(bookmark.get("startLine", 1)) - 1, 0)
-                            impact_object_bookmark_end_line = max(int(bookmark.get("endLine", 1)) - 1, 0)
-                            impact_object_bookmark_code = self.imaging.get_source('impact object bookmark', TenantName, ApplicationName,impact_object_bookmark_field_id,impact_object_bookmark_start_line,impact_object_bookmark_end_line, request_id)
-
-                        # Append the impact object data to the impacts DataFrame
-                        new_impact_row = pd.DataFrame(
-                            {
-                                "object_id": [impact_object_id],
-                                "object_type": [impact_object_type],
-                                "object_signature": [impact_object_signature],
-                                "object_link_type": [impact_object_link_type],
-                                "object_bookmark_code": [impact_object_bookmark_code],
-                                "object_source_path": [impact_object_source_path],
-                                "object_file_id":[int(impact_object_field_id)],
-                                "object_start_line": [int(impact_object_start_line)],
-                                "object_end_line": [int(impact_object_end_line)],
-                                "object_full_code": [impact_object_full_code],
-                            }
-                        )
-                        impacts = pd.concat([impacts, new_impact_row], ignore_index=True)
-                else:
-                    logging.error(f"Failed to fetch callers using {object_callers_url}. Status code: {object_callers_response.status_code}")
-            else:
-                logging.error(f"Failed to fetch object data using {object_url}. Status code: {object_response.status_code}")  # Skip to the next object if there is an error
+                    job.output["objects"].append(object_dictionary)
+                    if impact_status == "external":
+                        job.done = True
+                        return [job]
+                    continue  # Skip this impact object
+
+                job.impacts.append(AppImpactRecord(**impact_result))
 
-            if not exceptions.empty:
+            return [job]
+        except Exception as e:
+            # Catch and print any errors that occur.
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("fetch_context", e, request["request_id"])
+            job.done = True
+            return [job]
+        finally:
+            # Files the object and its dependent checks may change
+            files = {job.context["object_source_path"]} if job.context and job.context.get("object_source_path") else set()
+            files.update(row["object_source_path"] for row in job.impacts if row["object_source_path"])
+            request["barrier"].register(job.index, files)
+            request["dependents"].register(job.index, [row for row in job.impacts if row["object_source_path"]], request)
+
+    def __stage_build_prompt(self, job: AppObjectJob):
+        if job.done:
+            return [job]
+        request = job.request
+        request_id = request["request_id"]
+        try:
+            object_id = job.object_id
+            object_dictionary = job.object_dictionary
+            object_type = job.object_type
+            object_signature = job.object_signature
+            exceptions = job.exceptions
+            impacts = job.impacts
+            PromptContent = job.prompt_content
+            obj_code = job.context["obj_code"]
+
+            json_resp = request["json_resp"]
+
+            if exceptions:
                 # Group exceptions by link type and aggregate unique exceptions
-                grouped_exceptions = exceptions.groupby("link_type")["exception"].unique()
+                grouped_exceptions = exceptions.grouped()
 
                 # Construct exception text
                 exception_text = (
                     f"Take into account that {object_type} <{object_signature}>: "
                     + "; ".join(
-                        [ f"{link_type} {', '.join(exc)}" for link_type, exc in grouped_exceptions.items() ]
+                        [ f"{link_type} {', '.join(exc)}" for link_type, exc in grouped_exceptions ]
                     )
                 )
                 logging.info(f"exception_text = {exception_text}")
             else:
                 exception_text = ""  # No exceptions found
 
-            def generate_text(impacts):
-                # Generate impact analysis text from impacts DataFrame
+            # Impact analysis context, trimmed from its lowest-value items when the prompt exceeds the budget:
+            # callers sharing the same bookmark code are merged, callers whose code shows the object rank higher,
+            # the exceptions rank highest
+            context_items = []
+            exception_item = None
+            if impacts:
                 base_method = f"{object_type} <{object_signature}>"
-                text = f"Take into account that {base_method} is used by:\n"
-                for i, row in impacts.iterrows():
-                    text += f" {i + 1}. {row['object_type']} <{row['object_signature']}> has a <{row['object_link_type']}> dependency as found in code:\n"
-                    text += f"````\n\t{row['object_bookmark_code']}\n````\n"
-                return text
-
-            if not impacts.empty:
-                impact_text = generate_text(impacts)  # Generate impact analysis text
-                logging.info(f"impact_text = {impact_text}")
-            else:
-                impact_text = ""  # No impacts found
-
-            # Construct the prompt for the AI model
-            prompt_content = (
-                f"{PromptContent}\n"
-                f"\n\nTASK:\n1/ Generate a version without the pattern occurrence(s) of the following code, "
-                f"'''\n{obj_code}\n'''\n"
-                f"2/ Provide an analysis of the transformation: detail what you did in the 'comment' field, forecast "
-                f"impacts on code signature, exception management, enclosed objects or other areas in the "
-                f"'signature_impact', 'exception_impact', 'enclosed_impact, and 'other_impact' fields respectively, "
-                f"with some comments on your prognostics in the 'impact_comment' field.\n"
-                f"\nGUIDELINES:\nUse the following JSON structure to respond:\n'''\n{json_resp}\n'''\n"
-                + (
-                    f"\nIMPACT ANALYSIS CONTEXT:\n{impact_text}\n{exception_text}\n"
-                    if impact_text or exception_text
-                    else ""
+                short_name = re.split(r"[.:#/\\]", object_signature.split("(")[0])[-1]
+                callers = {}
+                for i, row in enumerate(impacts):
+                    bookmark_code = AppPromptPacker.normalize(row["object_bookmark_code"])
+                    callers.setdefault(bookmark_code, []).append((f" {i + 1}. {row['object_type']} <{row['object_signature']}> has a <{row['object_link_type']}> dependency", row["object_signature"]))
+                for bookmark_code, caller_lines in callers.items():
+                    rank = 1 if short_name and short_name in bookmark_code else 0
+                    context_items.append(AppPromptItem(
+                        ", ".join(signature for _, signature in caller_lines),
+                        rank,
+                        [
+                            "".join(f"{line} as found in code:\n" for line, _ in caller_lines) + f"````\n\t{bookmark_code}\n````\n",
+                            "".join(f"{line}.\n" for line, _ in caller_lines),
+                        ],
+                    ))
+            if exception_text:
+                exception_item = AppPromptItem("exceptions", 2, [exception_text])
+                context_items.append(exception_item)
+            caller_count = len(context_items) - (exception_item is not None)
+
+            # Construct the prompt for the AI model (the answer structure is only described when the endpoint does not enforce it)
+            response_guidelines = self.llm.response_guidelines(json_resp)
+
+            def render(kept):
+                caller_texts = [text for item, text in kept if item is not exception_item]
+                impact_text = ""
+                if caller_texts:
+                    impact_text = f"Take into account that {base_method} is used by:\n" + "".join(caller_texts)
+                    if len(caller_texts) < caller_count:
+                        impact_text += f" ... and {caller_count - len(caller_texts)} other caller(s), not detailed here.\n"
+                kept_exception_text = exception_text if any(item is exception_item for item, _ in kept) else ""
+                return (
+                    f"{PromptContent}\n"
+                    f"\n\nTASK:\n1/ Generate a version without the pattern occurrence(s) of the following code, "
+                    f"'''\n{obj_code}\n'''\n"
+                    f"2/ Provide an analysis of the transformation: detail what you did in the 'comment' field, forecast "
+                    f"impacts on code signature, exception management, enclosed objects or other areas in the "
+                    f"'signature_impact', 'exception_impact', 'enclosed_impact, and 'other_impact' fields respectively, "
+                    f"with some comments on your prognostics in the 'impact_comment' field.\n"
+                    f"\n{response_guidelines}"
+                    + (
+                        f"\nIMPACT ANALYSIS CONTEXT:\n{impact_text}\n{kept_exception_text}\n"
+                        if impact_text or kept_exception_text
+                        else ""
+                    )
+                    + f"\n{self.llm.response_closing()}"
                 )
-                + "\nMake sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string. "
-                "Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n"
+
+            # Count tokens for the AI model's input (code segments and static templates are counted from the memo)
+            code_token = self.llm.count_tokens(str(obj_code), request_id)
+
+            # Determine target response size
+            target_response_size = int(code_token * 1.2 + 500)
+
+            prompt_content, prompt_token, trimmed_context = self.prompt_packer.pack(
+                context_items,
+                render,
+                self.llm.router.prompt_budget("fix", target_response_size),
+                (str(obj_code), PromptContent),
+                (response_guidelines, self.llm.response_closing()),
             )
+            if trimmed_context:
+                logging.info(f"Impact analysis context of objectID-{object_id} trimmed to fit the prompt: {trimmed_context}")
+                object_dictionary["trimmed_context"] = trimmed_context
 
             # Clean up prompt content for formatting issues
             # prompt_content = (prompt_content.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\"))
 
             logging.info(f"Prompt Content: {prompt_content}")
 
-            # Prepare messages for the AI model
-            messages = [{"role": "user", "content": prompt_content}]
-
-            # Count tokens for the AI model's input
-            code_token = self.llm.count_tokens(str(obj_code), request_id)
-            prompt_token = self.llm.count_tokens("\n".join([json.dumps(m) for m in messages]), request_id)
-
-            # Determine target response size
-            target_response_size = int(code_token * 1.2 + 500)
+            job.prompt = prompt_content
+            job.prompt_tokens = prompt_token
+            job.target_response_size = target_response_size
+            return [job]
+        except Exception as e:
+            # Catch and print any errors that occur.
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("build_prompt", e, request_id)
+            job.done = True
+            return [job]
+
+    def __stage_fix(self, job: AppObjectJob):
+        if not job.done and self.__fix_object(job):
+            return self.__park(job.request, "fix", job)
+        # The checks of callers whose parents are all fixed, and the objects left with nothing to check
+        ready, completed = job.request["dependents"].fixed(job.index, self.__parent_infos(job))
+        return ready + [job.request["jobs"][index] for index in completed]
+
+    def __fix_object(self, job: AppObjectJob):
+        # Returns True when the fix call is pending in the batch job of the request
+        request = job.request
+        request_id = request["request_id"]
+        try:
+            object_id = ObjectID = job.object_id
+            object_dictionary = job.object_dictionary
+            object_technology = job.object_technology
+            object_source_path = job.context["object_source_path"]  # Get source file path
+            object_field_id = job.context["object_field_id"]  # Get file ID
+            object_start_line = job.context["object_start_line"]  # Get start line number
+            object_end_line = job.context["object_end_line"]  # Get end line number
+            prompt_content = job.prompt
+            prompt_token = job.prompt_tokens
+            target_response_size = job.target_response_size
+            json_resp = request["json_resp"]
+            use_cache = request["use_cache"]
+            batch = request["batch"]
+            files = request["prefetcher"].files
+            engine_output = job.output
 
             # Check if the prompt length is within acceptable limits
-            if prompt_token < (self.llm.model_max_input_tokens - target_response_size) and target_response_size < self.llm.model_max_output_tokens:
+            if self.llm.router.accepts("fix", prompt_token, target_response_size):
             # if True:
                 # Ask the AI model for a response
                 response_content, ai_msg, tokens = self.llm.ask_ai_model(
@@ -252,9 +290,15 @@ class AppCodeFixer:
                     prompt_content,
                     json_resp,
                     target_response_size,
-                    ObjectID
+                    ObjectID,
+                    use_cache,
+                    prompt_token,
+                    batch,
+                    "fix"
                 )
                 logging.info(f"Response Content: {response_content}")
+                if response_content is None and ai_msg == AppLLMBatch.PENDING:
+                    return True
 
                 object_dictionary["prompt_tokens"] = tokens["prompt_tokens"]
                 object_dictionary["completion_tokens"] = tokens["completion_tokens"]
@@ -283,10 +327,8 @@ class AppCodeFixer:
                         start_line = object_start_line
                         end_line = object_end_line
 
-                        # fetch object code
-                        file_content = self.imaging.get_file('object', TenantName, ApplicationName, object_field_id, request_id)
-
-                        file_content = file_content.splitlines(keepends=True)
+                        # file, served from the request file snapshot
+                        file_snapshot = files.get('object', object_field_id)
                         # file_path = RepoName + object_source_path.split(RepoName)[-1]
                         file_path = object_source_path
 
@@ -296,30 +338,47 @@ class AppCodeFixer:
                         # file_fullname = RepoName + object_source_path.split(RepoName)[-1]
                         file_fullname = object_source_path
 
-                        file_flag = False
-                        if len(engine_output["contentinfo"]) > 0:
-                            for i, file in enumerate(engine_output["contentinfo"]):
-                                if file["filefullname"] == file_fullname:
-                                    file_flag = True
-                                    engine_output["contentinfo"][i]["objects"].append(object_id)
-                                    engine_output["contentinfo"][i]["originalfilecontent"][1][0][f"({start_line},{end_line})"] = comment + readable_code + end_comment
-
-                        if not file_flag:
-                            content_info_dictionary["filefullname"] = file_fullname
-                            content_info_dictionary["objects"].append(object_id)
-                            content_info_dictionary["originalfilecontent"] = [file_content, [{f"({start_line},{end_line})" : comment + readable_code + end_comment}]]
+                        conflict = engine_output["edits"].add(file_fullname, file_snapshot, start_line, end_line, comment + readable_code + end_comment, object_id, object_technology)
+                        if conflict is not None:
+                            self.__reject_edit(object_dictionary, conflict)
 
-                        if (content_info_dictionary["filefullname"] or content_info_dictionary["originalfilecontent"]):
-                            engine_output["contentinfo"].append(content_info_dictionary)
-
-                        if (response_content["signature_impact"].upper() == "YES"
+                        # The callers are checked by the dependent-check stage
+                        job.check_dependents = (response_content["signature_impact"].upper() == "YES"
                             or response_content["exception_impact"].upper() == "YES"
                             or response_content["enclosed_impact"].upper() == "YES"
-                            or response_content["other_impact"].upper() == "YES"):
+                            or response_content["other_impact"].upper() == "YES")
+                        job.response_content = response_content
+                        job.file_path = file_path
+
+                    else:
+                        object_dictionary["status"] = "Unmodified"
+                        object_dictionary["message"] = response_content["comment"]
 
-                            if not impacts.empty:
-                                for i, row in impacts.iterrows():
-                                    parent_info = f"""The {row['object_type']} <{row['object_signature']}> source code is the following:
+            else:
+                logging.warning("Prompt too long; skipping.")  # Warn if the prompt exceeds limits
+
+                object_dictionary["status"] = "failure"
+                object_dictionary["message"] = "failed because of reason: prompt too long"
+        except Exception as e:
+            # Catch and print any errors that occur.
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("fix", e, request_id)
+            job.done = True
+
+    def __parent_infos(self, job: AppObjectJob):
+        # {dependent object id: what the change of the object means for it}, empty when the change has no impact
+        parent_infos = {}
+        if job.done or not job.check_dependents:
+            return parent_infos
+        try:
+            object_type = job.object_type
+            file_path = job.file_path
+            response_content = job.response_content
+            for row in job.impacts:
+                if not row["object_source_path"] or str(row["object_id"]) in parent_infos:
+                    continue  # source location of this dependent object is unknown, or already described
+
+                parent_info = f"""The {row['object_type']} <{row['object_signature']}> source code is the following:
                                                     ```
                                                     {row['object_full_code']}
                                                     ```
@@ -332,81 +391,111 @@ class AppCodeFixer:
                                                     * other: {response_content['other_impact']}
                                                     for the following reason: [{response_content['comment'] if response_content['impact_comment'] == 'NA' else response_content['impact_comment']}]."""
 
-                                    # fetch object code
-                                    dep_object_file_content = self.imaging.get_file('dep object', TenantName, ApplicationName, int(row["object_file_id"]), request_id)
-
-                                    dep_object_file_content = dep_object_file_content.splitlines(keepends=True)
-                                    # dep_object_file_path = RepoName + object_source_path.split(RepoName)[-1]
-                                    dep_object_file_path = object_source_path
-
-                                    object_data, contentinfo_data, engine_output = self.__check_dependent_code_json(
-                                        ObjectID,
-                                        row["object_type"],
-                                        row["object_signature"],
-                                        row["object_full_code"],
-                                        parent_info,
-                                        row["object_start_line"],
-                                        row["object_end_line"],
-                                        row["object_id"],
-                                        row["object_source_path"],
-                                        RepoName,
-                                        dep_object_file_content,
-                                        dep_object_file_path,
-                                        engine_output,
-                                        request_id,
-                                        mongo_db
-                                    )
-
-                                    engine_output["objects"].append(object_data)
-
-                                    if (contentinfo_data["filefullname"] or contentinfo_data["originalfilecontent"]):
-                                        engine_output["contentinfo"].append(contentinfo_data)
-
-                    else:
-                        object_dictionary["status"] = "Unmodified"
-                        object_dictionary["message"] = response_content["comment"]
-
-            else:
-                logging.warning("Prompt too long; skipping.")  # Warn if the prompt exceeds limits
+                parent_infos[str(row["object_id"])] = parent_info
+        except Exception as e:
+            # Catch and print any errors that occur.
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("parent_infos", e, job.request["request_id"])
+        return parent_infos
+
+    def __stage_dependent_check(self, item):
+        if isinstance(item, AppObjectJob):
+            return self.__complete_object(item)
+
+        # One check per dependent object, with the changes of all its parents in its prompt
+        check: AppDependentCheck = item
+        request = check.request
+        request_id = request["request_id"]
+        row = check.row
+        try:
+            owner = request["jobs"][check.owner]
+            parent_info = "\n\n".join(info for _, info in check.parent_infos)
+
+            # Edits of the check apart, merged in the order of the callers once its owner is complete
+            check.output["edits"] = AppEditAccumulator()
+
+            # dependent file, served from the request file snapshot
+            dep_object_file_snapshot = request["prefetcher"].files.get('dep object', int(row["object_file_id"]))
+            # dep_object_file_path = RepoName + object_source_path.split(RepoName)[-1]
+            dep_object_file_path = owner.context["object_source_path"]
+
+            object_data, _ = self.__check_dependent_code_json(
+                [request["jobs"][index].object_id for index, _ in check.parent_infos],
+                row["object_type"],
+                row["object_signature"],
+                row["object_full_code"],
+                parent_info,
+                row["object_start_line"],
+                row["object_end_line"],
+                row["object_id"],
+                row["object_source_path"],
+                request["repo_name"],
+                dep_object_file_snapshot,
+                dep_object_file_path,
+                check.output,
+                request_id,
+                request["mongo_db"],
+                request["use_cache"],
+                request["batch"]
+            )
 
-                object_dictionary["status"] = "failure"
-                object_dictionary["message"] = "failed because of reason: prompt too long"
+            if object_data is None:
+                return self.__park(request, "dependent-check", check)
+            check.output["objects"].append(object_data)
+        except Exception as e:
+            # Catch and print any errors that occur.
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("dependent_check", e, request_id)
 
-            engine_output["objects"].append(object_dictionary)
+        files = []
+        for index in request["dependents"].checked(check):
+            files.extend(self.__complete_object(request["jobs"][index]))
+        return files
 
-            return engine_output
+    def __complete_object(self, job: AppObjectJob):
+        # The object and the checks of its callers are done
+        request = job.request
+        try:
+            if not job.done:
+                # The object first, then the callers it reports, so that the output follows the input order
+                job.output["objects"].append(job.object_dictionary)
+                for check in request["dependents"].owned(job.index):
+                    job.output["objects"].extend(check.output["objects"])
+                    if check.output["edits"] is not None:
+                        self.__merge_edits(job.output["edits"], check.output)
         except Exception as e:
             # Catch and print any errors that occur.
             print(f"An error occurred: {e}")
-            self.app_logger.log_error("gen_code_connected_json", e, request_id)
-            return engine_output
+            self.app_logger.log_error("dependent_check", e, request["request_id"])
         finally:
-            collection = mongo_db.get_collection("status_queue")
-            # Step 2: Inputs
-            new_object_id = object_dictionary['objectid']
-            new_status = object_dictionary['status']
-
-            # Step 3: Fetch the document
-            doc = collection.find_one({"request_id": request_id})
-
-            if doc:
-                # Step 4: Get or initialize objects_list
-                objects_list = doc.get("objects_list", {})
-                
-                # Step 5: Append or update object_id with status
-                objects_list[new_object_id] = new_status
-
-                # Step 6: Update the document in MongoDB
-                result = collection.update_one(
-                    {"request_id": request_id},
-                    {"$set": {"objects_list": objects_list}}
-                )
-
-                print(f"Updated document. Modified count: {result.modified_count}")
+            self.__update_object_status(request["request_id"], request["mongo_db"], job.object_dictionary)
+
+        # The files no pending object can change any more go to the file stages
+        barrier = request["barrier"]
+        files = [
+            self.__release_file(request, filefullname, indexes)
+            for filefullname, indexes in barrier.complete(job.index, job.output["edits"])
+        ]
+        for filefullname in barrier.late_files(job.index):
+            self.__reject_late_file(request, job, filefullname)
+        return files
+
+    def __reject_late_file(self, request, job: AppObjectJob, filefullname):
+        # The file was released before the object was done: its edits there are not applied, their objects fail
+        message = f"failed because of reason: {filefullname} was already released to the file stages"
+        print(f"An error occurred: {message}")
+        self.app_logger.log_error("file_barrier", f"ObjectID-{job.object_id} {message}", request["request_id"])
+        for edit in job.output["edits"].files[filefullname].edits:
+            for object_dictionary in reversed(job.output["objects"]):
+                if object_dictionary["objectid"] == edit.object_id and object_dictionary["status"] == "success":
+                    object_dictionary["status"] = "failure"
+                    object_dictionary["message"] = message
+                    self.__update_object_status(request["request_id"], request["mongo_db"], object_dictionary)
+                    break
 
     def __check_dependent_code_json(
         self,
-        ObjectID,
+        ObjectIDs,
         dep_object_type,
         dep_object_signature,
         dep_obj_code,
@@ -416,41 +505,30 @@ class AppCodeFixer:
         dep_object_id,
         object_source_path,
         RepoName,
-        dep_object_file_content,
+        dep_object_file_snapshot,
         dep_object_file_path,
         engine_output,
         request_id,
-        mongo_db
+        mongo_db,
+        use_cache=True,
+        batch: AppLLMBatch = None
     ):
+        pending = False
         try:
-            object_dictionary = {"objectid": dep_object_id, "status": "", "message": "", "dependent_info":f"this object is depenedent on ObjectID-{ObjectID}"}
-            content_info_dictionary = {"filefullname": "", "objects":[], "originalfilecontent": ""}
-
-            json_dep_resp = """
-            {
-            "updated":"<YES/NO to state if you updated the dependent code or not (if you believe it did not need updating)>",
-            "comment":"<explain here what you updated (or NA if the dependent code does not need to be updated)>",
-            "missing_information":"<list here information needed to finalize the dependent code (or NA if nothing is needed or if the dependent code was not updated)>",
-            "signature_impact":"<YES/NO/UNKNOWN, to state here if the signature of the dependent code will be updated as a consequence of changed parameter list, types, return type, etc.>",
-            "exception_impact":"<YES/NO/UNKNOWN, to state here if the exception handling related to the dependent code will be update, as a consequence of changed exception thrown or caugth, etc.>",
-            "enclosed_impact":"<YES/NO/UNKNOWN, to state here if the dependent code update could impact further code enclosed in it in the same source file, such as methods defined in updated class, etc.>",
-            "other_impact":"<YES/NO/UNKNOWN, to state here if the dependent code update could impact any other code referencing this code>",
-            "impact_comment":"<comment here on signature, exception, enclosed, other impacts on any other code calling this one (or NA if not applicable)>",
-            "code":"<the updated dependent code goes here (or original dependent code if the dependent code was not updated)>"
-            }"""
+            object_dictionary = {"objectid": dep_object_id, "status": "", "message": "", "dependent_info":"this object is depenedent on " + ", ".join(f"ObjectID-{ObjectID}" for ObjectID in ObjectIDs)}
+
+            json_dep_resp = DEPENDENT_RESPONSE_SCHEMA
 
             # Construct the prompt for the AI model
+            response_guidelines = self.llm.response_guidelines(json_dep_resp)
             prompt_content = (
                             f"CONTEXT: {dep_object_type} <{dep_object_signature}> is dependent on code that was modified by an AI: \n"
                             f"{parent_info if parent_info else ''} \n"
                             f"TASK:\n"
                             f"Check and update if needed the following code: \n"
                             f"'''\n{dep_obj_code}\n'''"
-                            f"GUIDELINES: \n"
-                            f"Use the following JSON structure to respond: \n"
-                            f"'''\n{json_dep_resp}\n'''\n"
-                            f"\nMake sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string. "
-                            f"Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n"
+                            f"{response_guidelines}"
+                            f"\n{self.llm.response_closing()}"
             )
             
             # Clean up prompt content for formatting issues
@@ -458,18 +536,15 @@ class AppCodeFixer:
 
             logging.info(f"Prompt Content: {prompt_content}")
 
-            # Prepare messages for the AI model
-            messages = [{"role": "user", "content": prompt_content}]
-
             # Count tokens for the AI model's input
             code_token = self.llm.count_tokens(str(dep_obj_code), request_id)
-            prompt_token = self.llm.count_tokens("\n".join([json.dumps(m) for m in messages]), request_id)
+            prompt_token = self.llm.count_tokens(prompt_content, request_id, (str(dep_obj_code), parent_info), (response_guidelines, self.llm.response_closing()))
 
             # Determine target response size
             target_response_size = int(code_token * 1.2 + 500)
 
             # Check if the prompt length is within acceptable limits
-            if prompt_token < (self.llm.model_max_input_tokens - target_response_size) and target_response_size < self.llm.model_max_output_tokens:
+            if self.llm.router.accepts("dependent", prompt_token, target_response_size):
             # if True:
                 # Ask the AI model for a response
                 response_content, ai_msg, tokens = self.llm.ask_ai_model(
@@ -477,9 +552,16 @@ class AppCodeFixer:
                     prompt_content,
                     json_dep_resp,
                     target_response_size,
-                    dep_object_id
+                    dep_object_id,
+                    use_cache,
+                    prompt_token,
+                    batch,
+                    "dependent"
                 )
                 logging.info(f"Response Content: {response_content}")
+                if response_content is None and ai_msg == AppLLMBatch.PENDING:
+                    pending = True
+                    return None, engine_output  # answered by the next batch job
 
                 object_dictionary["prompt_tokens"] = tokens["prompt_tokens"]
                 object_dictionary["completion_tokens"] = tokens["completion_tokens"]
@@ -490,7 +572,7 @@ class AppCodeFixer:
                     object_dictionary["message"] = ai_msg
 
                     # Append the response to the result list
-                    return object_dictionary, content_info_dictionary, engine_output
+                    return object_dictionary, engine_output
 
                 else:
                     # Check if the response indicates an update was made
@@ -512,25 +594,16 @@ class AppCodeFixer:
                         # file_fullname = RepoName + object_source_path.split(RepoName)[-1]
                         file_fullname = object_source_path
 
-                        file_flag = False
-                        if len(engine_output["contentinfo"]) > 0:
-                            for i, file in enumerate(engine_output["contentinfo"]):
-                                if file["filefullname"] == file_fullname:
-                                    file_flag = True
-                                    engine_output["contentinfo"][i]["objects"].append(dep_object_id)
-                                    engine_output["contentinfo"][i]["originalfilecontent"][1][0][f"({start_line},{end_line})"] = comment + readable_code + end_comment
-
-                        if not file_flag:
-                            content_info_dictionary["filefullname"] = file_fullname
-                            content_info_dictionary["objects"].append(dep_object_id)
-                            content_info_dictionary["originalfilecontent"] = [dep_object_file_content, [{f"({start_line},{end_line})" : comment + readable_code + end_comment}]]
+                        conflict = engine_output["edits"].add(file_fullname, dep_object_file_snapshot, start_line, end_line, comment + readable_code + end_comment, dep_object_id)
+                        if conflict is not None:
+                            self.__reject_edit(object_dictionary, conflict)
 
                     else:
                         object_dictionary["status"] = "Unmodified"
                         object_dictionary["message"] = response_content["comment"]
 
                     # Append the response to the result list
-                    return object_dictionary, content_info_dictionary, engine_output
+                    return object_dictionary, engine_output
 
             else:
                 logging.warning("Prompt too long; skipping.")  # Warn if the prompt exceeds limits
@@ -538,25 +611,36 @@ class AppCodeFixer:
                 object_dictionary["status"] = "failure"
                 object_dictionary["message"] = "failed because of reason: prompt too long"
 
-                return object_dictionary, content_info_dictionary, engine_output
+                return object_dictionary, engine_output
         except Exception as e:
             # Catch and print any errors that occur.
             print(f"An error occurred: {e}")
             self.app_logger.log_error(e, "check_dependent_code_json", request_id)
-            return object_dictionary, content_info_dictionary, engine_output
+            return object_dictionary, engine_output
         finally:
-            collection = mongo_db.get_collection("status_queue")
-            # Step 2: Inputs
-            new_object_id = object_dictionary['objectid']
-            new_status = object_dictionary['status']
-
+            # A pending check has no status yet
+            if not pending:
+                self.__update_object_status(request_id, mongo_db, object_dictionary)
+
+    def __reject_edit(self, object_dictionary, conflict):
+        # The edit of the object overlaps an edit already accumulated for its file: it is not applied
+        object_dictionary["status"] = "failure"
+        object_dictionary["message"] = f"failed because of reason: the change overlaps lines {conflict.start}-{conflict.end} changed for ObjectID-{conflict.object_id}"
+
+    def __update_object_status(self, request_id, mongo_db, object_dictionary):
+        collection = mongo_db.get_collection("status_queue")
+        # Step 2: Inputs
+        new_object_id = object_dictionary['objectid']
+        new_status = object_dictionary['status']
+
+        with self.status_lock:
             # Step 3: Fetch the document
             doc = collection.find_one({"request_id": request_id})
 
             if doc:
                 # Step 4: Get or initialize objects_list
                 objects_list = doc.get("objects_list", {})
-                
+
                 # Step 5: Append or update object_id with status
                 objects_list[new_object_id] = new_status
 
@@ -568,30 +652,97 @@ class AppCodeFixer:
 
                 print(f"Updated document. Modified count: {result.modified_count}")
 
-    def __resend_fullfile_to_ai(self, full_code, request_id):
+    def __park(self, request, stage, item):
+        # The model call of the item is pending in the batch job of the request: the item resumes at this stage in the next round
+        with request["lock"]:
+            request["parked"].append((stage, item))
+        return []
+
+    def __merge_edits(self, edits: AppEditAccumulator, output, filefullname=None):
+        # Merges the edits of an output; an edit overlapping the edits already merged fails its object
+        for edit, conflict in edits.merge(output["edits"], filefullname):
+            for object_dictionary in reversed(output["objects"]):
+                if object_dictionary["objectid"] == edit.object_id and object_dictionary["status"] == "success":
+                    self.__reject_edit(object_dictionary, conflict)
+                    break
+
+    def __release_file(self, request, filefullname, indexes):
+        # Merges the edits of a file in the input order of the objects; an edit overlapping the edits already merged fails its object
+        edits = request["edits"]
+        for index in indexes:
+            self.__merge_edits(edits, request["jobs"][index].output, filefullname)
+        return {"request": request, "file": edits.files[filefullname]}
+
+    def __stage_assemble_file(self, item):
+        # Splice the edits into the original file, in one pass over its text
+        file = item["file"]
+        splice = AppLineSplice(file.snapshot, file.replacements())
+        for conflict in splice.conflicts:
+            logging.warning(f"Edit of {file.filefullname} not applied: {conflict}")
+        item["code"] = splice.text()
+        item["changed_ranges"] = splice.changed_ranges()
+        return [item]
+
+    def __stage_cleanup(self, item):
+        request = item["request"]
+        file = item["file"]
+        code = self.__cleanup_file(item["code"], item["changed_ranges"], request["request_id"], request["use_cache"], request["batch"], file.technology, file.filefullname)
+        if code is None:
+            return self.__park(request, "cleanup", item)
+        item["code"] = code
+        return [item]
+
+    def __stage_persist(self, item):
+        # FilesContent entry of the file, written with the request output once every file is done
+        request = item["request"]
+        file = item["file"]
+        RepoName = request["repo_name"]
+
+        # Generate a unique 24-character alphanumeric string
+        unique_string = generate_unique_alphanumeric(request["request_id"], self.app_logger)
+        file.fileid = unique_string
+
+        file_path = file.filefullname.replace('\\','/')
+
+        if RepoName in file_path:
+            file_path = RepoName + file_path.split(RepoName)[-1]
+
+        item["files_content_data"] = { "fileid":unique_string, "filepath":file_path, "updatedfilecontent": item["code"] }
+        return [item]
+
+    def __resend_fullfile_to_ai(self, full_code, request_id, use_cache=True, batch: AppLLMBatch = None, regions: AppCleanupRegions = None, file_name=None):
+        # Returns the cleaned code, or None when the cleanup call is pending in the batch job of the request
         try:
 
-            json_resp = """
-            {
-            "updated":"<YES/NO to state if you updated the code or not (if you believe it did not need fixing)>",
-            "comment":"<explain here what you updated (or the reason why you did not update it)>",
-            "code":"<the fixed code goes here (or original code if the code was not updated)>"
-            }
-            """
+            json_resp = FULLFILE_RESPONSE_SCHEMA
+
+            # Only the changed regions and the header of the file are sent when regions are given
+            code = regions.render() if regions else full_code
 
             # Construct the prompt for the AI model
+            response_guidelines = self.llm.response_guidelines(json_resp)
             prompt_content = (
                 "TASK:\n"
-                "1) fix syntax errors.\n"
+                + (
+                    "The following code is made of excerpts of a single source file: its header and the regions around recent changes, "
+                    "each excerpt starting with a '@@@ REGION <n> @@@' line. An excerpt can start or end in the middle of a block.\n"
+                    if regions
+                    else ""
+                )
+                + "1) fix syntax errors.\n"
                 "2) add only missing packages.\n"
                 "3) add single line comments saying that this is fixed by Gen AI for the lines only fixed by Gen AI.\n"
                 "4) do not remove already existing comments.\n"
                 "5) indent the code properly.\n"
-                f"'''\n{full_code}\n'''\n"  
-                "GUIDELINES:\n"
-                f"Use the following JSON structure to respond:\n'''\n{json_resp}\n'''\n"
-                "Make sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string.\n"
-                "Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n"
+                + (
+                    "6) keep every '@@@ REGION <n> @@@' line unchanged and in the same order, do not add, remove or merge excerpts, "
+                    "do not complete the blocks cut at the start or end of an excerpt.\n"
+                    if regions
+                    else ""
+                )
+                + f"'''\n{code}\n'''\n"
+                f"{response_guidelines}"
+                f"{self.llm.response_closing()}"
             )
 
             # Clean up prompt content for formatting issues
@@ -602,68 +753,356 @@ class AppCodeFixer:
             # with open("prompt_content.txt", "w") as file:
             #     file.write(prompt_content)
 
-            # Prepare messages for the AI model
-            messages = [{"role": "user", "content": prompt_content}]
-
             # Count tokens for the AI model's input
-            code_token = self.llm.count_tokens(str(full_code), request_id)
-            prompt_token = self.llm.count_tokens("\n".join([json.dumps(m) for m in messages]), request_id)
+            code_token = self.llm.count_tokens(str(code), request_id)
+            prompt_token = self.llm.count_tokens(prompt_content, request_id, (str(code),), (response_guidelines, self.llm.response_closing()))
 
             # Determine target response size
             target_response_size = int(code_token * 1.2 + 500)
 
             # Check if the prompt length is within acceptable limits
             # if True:
-            if prompt_token < (self.llm.model_max_input_tokens - target_response_size) and target_response_size < self.llm.model_max_output_tokens:
+            if self.llm.router.accepts("cleanup", prompt_token, target_response_size):
                 # Ask the AI model for a response
-                response_content, _, tokens = self.llm.ask_ai_model(
+                response_content, ai_msg, tokens = self.llm.ask_ai_model(
                     request_id,
                     prompt_content,
                     json_resp,
-                    max_tokens=target_response_size
+                    max_tokens=target_response_size,
+                    ObjectID=file_name,  # the file is logged in place of an object
+                    use_cache=use_cache,
+                    prompt_tokens=prompt_token,
+                    batch=batch,
+                    task="cleanup"
                 )
                 logging.info(f"Response Content: {response_content}")
                 
                 if response_content == None:
-                    return full_code
+                    return None if ai_msg == AppLLMBatch.PENDING else full_code
+                elif regions:
+                    cleaned_code = regions.splice(response_content["code"])
+                    if cleaned_code is None:
+                        logging.warning("Syntax cleanup answer does not match the regions sent, file left as is.")
+                        self.__count_cleanup("splice_failures")
+                        return full_code
+                    return cleaned_code
                 else:
                     # Check if the response indicates an update was made
                     return response_content["code"]
             else:
+                logging.warning("Prompt too long for the syntax cleanup, file left as is.")
+                self.__count_cleanup("too_long")
                 return full_code
 
         except Exception as e:
             # Catch and print any errors that occur.
             print(f"An error occurred: {e}")
             self.app_logger.log_error(e, "resend_fullfile_to_ai", request_id)
+            return full_code
+
+    def __count_cleanup(self, counter, value=1):
+        with self.status_lock:
+            self.cleanup_counters[counter] += value
+
+    def __cleanup_file(self, full_code, changed_ranges, request_id, use_cache=True, batch: AppLLMBatch = None, technology="", file_name=""):
+        # Syntax cleanup of a modified file: the changed regions only, or the whole file when they cover most of it
+        if self.syntax_validator.enabled:
+            problems = self.syntax_validator.check(full_code, technology, file_name)
+            if problems == []:
+                # Parses locally and no import is missing: nothing for the model to clean
+                self.__count_cleanup("validated_files")
+                return full_code
+            if problems:
+                logging.info(f"Syntax cleanup of {file_name}: {'; '.join(problems[:5])}")
+        modified_lines = full_code.splitlines(keepends=True)
+        if self.cleanup_mode == "regions":
+            regions = AppCleanupRegions(modified_lines, changed_ranges, self.cleanup_context_lines, self.cleanup_header_max_lines)
+            if regions.coverage() <= self.cleanup_max_coverage:
+                self.__count_cleanup("region_files")
+                self.__count_cleanup("regions", len(regions.regions))
+                self.__count_cleanup("lines_sent", regions.line_count())
+                self.__count_cleanup("lines_total", len(modified_lines))
+                return self.__resend_fullfile_to_ai(full_code, request_id, use_cache, batch, regions, file_name)
+        self.__count_cleanup("full_files")
+        self.__count_cleanup("lines_sent", len(modified_lines))
+        self.__count_cleanup("lines_total", len(modified_lines))
+        return self.__resend_fullfile_to_ai(full_code, request_id, use_cache, batch, file_name=file_name)
+
+    def cleanup_stats(self):
+        with self.status_lock:
+            return dict(self.cleanup_counters, mode=self.cleanup_mode)
+
+    def pipeline_stats(self):
+        return self.pipeline_metrics.stats()
+
+    def __pipeline(self, request_id):
+        # Staged pipeline: Imaging waits, fix calls, dependent checks and file cleanups of different objects overlap.
+        # A file enters the file stages as soon as no pending object can change it any more.
+        return AppPipeline(f"request-{request_id}", [
+            AppPipelineStage(name, handler, self.pipeline_workers[name], self.pipeline_queue_size)
+            for name, handler in (
+                ("fetch-context", self.__stage_fetch_context),
+                ("build-prompt", self.__stage_build_prompt),
+                ("fix", self.__stage_fix),
+                ("dependent-check", self.__stage_dependent_check),
+                ("assemble-file", self.__stage_assemble_file),
+                ("cleanup", self.__stage_cleanup),
+                ("persist", self.__stage_persist),
+            )
+        ], self.pipeline_metrics)
+
+    def __recover(self, request_state, failed):
+        """
+        Recovers the items lost by an error in a stage handler: their objects fail without their edits and
+        count as fixed without impact for the checks of their callers, and a file whose cleanup failed is kept
+        as assembled. With nothing else to resume, the objects not complete yet are completed so that the
+        barrier releases their files. Returns the items to resume, as (stage name, item).
+        """
+        request_id = request_state["request_id"]
+        dependents = request_state["dependents"]
+        resumed = []
+        for stage, item, error in failed:
+            self.app_logger.log_error(f"pipeline_{stage}", error, request_id)
+            if isinstance(item, AppObjectJob):
+                object_dictionary = item.object_dictionary
+                object_dictionary["status"] = "failure"
+                object_dictionary["message"] = f"failed because of reason: error in the {stage} stage: {error}"
+                if not any(output is object_dictionary for output in item.output["objects"]):
+                    item.output["objects"].append(object_dictionary)
+                item.output["edits"] = AppEditAccumulator()
+                item.done = True
+                if not dependents.is_fixed(item.index):
+                    ready, completed = dependents.fixed(item.index, {})
+                    resumed.extend(("dependent-check", check) for check in ready)
+                    resumed.extend(("dependent-check", request_state["jobs"][index]) for index in completed)
+            elif isinstance(item, AppDependentCheck):
+                # The dependent object fails, the objects it depends on still complete
+                object_dictionary = {
+                    "objectid": item.row["object_id"],
+                    "status": "failure",
+                    "message": f"failed because of reason: error in the {stage} stage: {error}",
+                    "dependent_info": "this object is depenedent on " + ", ".join(f"ObjectID-{request_state['jobs'][index].object_id}" for index, _ in item.parent_infos),
+                }
+                item.output["objects"].append(object_dictionary)
+                self.__update_object_status(request_id, request_state["mongo_db"], object_dictionary)
+                resumed.extend(("dependent-check", request_state["jobs"][index]) for index in dependents.checked(item))
+            elif stage == "cleanup":
+                resumed.append(("persist", item))
+        if resumed:
+            return resumed
+        for job in request_state["jobs"]:
+            if request_state["barrier"].is_complete(job.index):
+                continue
+            try:
+                resumed.extend(("assemble-file", file_item) for file_item in self.__complete_object(job))
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                self.app_logger.log_error("recover", e, request_id)
+        return resumed
+
+    def __run_request(self, request_state, jobs, resumed=()):
+        """
+        Runs the pipeline of the request: every object from the first stage, or the items parked on the batch
+        job of the previous round. Persists the request output once nothing is parked any more.
+        """
+        request_id = request_state["request_id"]
+        batch = request_state["batch"]
+
+        pipeline = self.__pipeline(request_id)
+        request_state["file_items"].extend(pipeline.run(jobs, resumed))
+        request_state["failed"].extend(pipeline.failed)
+        while True:
+            while not request_state["parked"]:
+                # Nothing is lost silently: the objects and files held by failed items go on through the stages
+                failed, request_state["failed"] = request_state["failed"], []
+                resumed = self.__recover(request_state, failed)
+                if not resumed:
+                    break
+                pipeline = self.__pipeline(request_id)
+                request_state["file_items"].extend(pipeline.run([], resumed))
+                request_state["failed"].extend(pipeline.failed)
+            if not request_state["parked"] or not self.batch_runner.exhausted(batch):
+                break
+            # Out of batch rounds: only the items still waiting for a model call fail
+            parked, request_state["parked"] = request_state["parked"], []
+            error = RuntimeError(f"model call still pending after {batch.rounds} batch rounds")
+            request_state["failed"].extend((stage, item, error) for stage, item in parked)
+
+        if request_state["parked"]:
+            # Batch mode: the pending model calls go to one batch job, the request is re-queued until it completes
+            self.__submit_batch(request_state)
+            request_state["touched_at"] = time.monotonic()
+            with self.batch_lock:
+                self.batch_requests[request_id] = request_state
+            return self.__batch_pending(request_id, batch)
+        with self.batch_lock:
+            self.batch_requests.pop(request_id, None)
+
+        engine_output = request_state["engine_output"]
+        files_content = request_state["files_content"]
+        file_items = request_state["file_items"]
+        jobs = request_state["jobs"]
+        objects_status_list = []
+
+        engine_input_collection = self.mongo_db.get_collection("EngineInput")
+        engine_output_collection = self.mongo_db.get_collection("EngineOutput")
+        files_content_collection = self.mongo_db.get_collection("FilesContent")
+
+        # Output in the input order of the objects, whatever their completion order
+        edits = request_state["edits"]
+        file_order = {}
+        for job in jobs:
+            engine_output["objects"].extend(job.output["objects"])
+            for filefullname in job.output["edits"].files:
+                file_order.setdefault(filefullname, len(file_order))
+        edits.reorder(file_order)
+        file_items.sort(key=lambda item: file_order.get(item["file"].filefullname, len(file_order)))
+        files_content["updatedcontentinfo"] = [item["files_content_data"] for item in file_items]
+        engine_output["contentinfo"] = edits.to_contentinfo()
+
+        for object in engine_output['objects']:
+            objects_status_list.append(object['status'])
+
+        if all(item == "Unmodified" for item in objects_status_list):
+            engine_output["status"] = "Unmodified"
+        elif all(item == "failure" for item in objects_status_list):
+            engine_output["status"] = "failure"
+        elif any(item == "failure" for item in objects_status_list):
+            engine_output["status"] = "partial success"
+        else:
+            engine_output["status"] = "success"
+
+        # Define the filter and update
+        filter = {"request.requestid": f"{request_id}"}  # Match document with requestid
+        update = {"$set": {"request.$[elem].status": f"{engine_output["status"] }"}}  # Update the status for the matched request
+        array_filters = [{"elem.requestid": f"{request_id}"}] # Specify array filters
+        engine_input_status_update = engine_input_collection.update_one(filter, update, array_filters=array_filters) # Perform the update
+
+        # Check if data already exists
+        existing_record = engine_output_collection.find_one({"requestid": engine_output["requestid"]})
+
+        if existing_record:
+            # Delete the existing record
+            engine_output_collection.delete_one({"requestid": engine_output["requestid"]})
+            print(f"Existing requestid - {engine_output['requestid']} deleted in engine_output_collection.")
+
+        # Insert the new data
+        engine_output_result = engine_output_collection.insert_one(engine_output)
+        print(f"Data inserted into engine_output_collection for requestid - {engine_output['requestid']}")
+
+        files_content_exist = files_content_collection.find_one({"requestid": files_content["requestid"]})
+
+        if files_content_exist:
+            # Delete the existing record
+            files_content_collection.delete_one({"requestid": files_content["requestid"]})
+            print(f"Existing requestid - {files_content['requestid']} deleted in files_content_collection.")
+
+        # Insert the new data
+        files_content_result = files_content_collection.insert_one(files_content)
+        print(f"Data inserted into files_content_collection for requestid - {engine_output['requestid']}")
+
+        if batch is not None:
+            self.batch_runner.forget(request_id)
+
+        return ({
+            "Request_Id": request_id,
+            "status": "success",
+            "message" : f"Req -> {request_id} Successful.",
+            "code": 200
+        })
+
+    def __batch_pending(self, request_id, batch: AppLLMBatch):
+        return ({
+            "Request_Id": request_id,
+            "status": "batch_pending",
+            "message" : f"Req -> {request_id} waiting for batch job {batch.job_id or '(not submitted yet)'}.",
+            "code": 202
+        })
+
+    def __submit_batch(self, request_state):
+        batch = request_state["batch"]
+        try:
+            self.batch_runner.submit(batch)
+        except Exception as e:
+            # Submitted again on the next round of the request
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("batch_submit", e, request_state["request_id"])
+            self.batch_runner.save(batch)
+
+    def __poll_batch(self, request_id, batch: AppLLMBatch):
+        # Returns True once the job is over; an error of the provider leaves it running, polled again on the next round
+        try:
+            return self.batch_runner.poll(batch)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            self.app_logger.log_error("batch_poll", e, request_id)
+            return False
+
+    def __resume_batch_request(self, request_state):
+        request_id = request_state["request_id"]
+        batch = request_state["batch"]
+        request_state["touched_at"] = time.monotonic()
+        if batch.job_id is None:
+            self.__submit_batch(request_state)
+            return self.__batch_pending(request_id, batch)
+        if not self.__poll_batch(request_id, batch):
+            return self.__batch_pending(request_id, batch)
+        # Only the items parked on the batch job resume, with its answers
+        resumed, request_state["parked"] = request_state["parked"], []
+        return self.__run_request(request_state, [], resumed)
+
+    def __drop_batch_request(self, request_id):
+        with self.batch_lock:
+            request_state = self.batch_requests.pop(request_id, None)
+        if request_state is not None:
+            request_state["prefetcher"].close()
+
+    def __expire_batch_requests(self):
+        # A request not resumed here for long was taken over by another worker
+        limit = max(20 * self.batch_runner.poll_interval, 600)
+        now = time.monotonic()
+        with self.batch_lock:
+            expired = [request_id for request_id, request_state in self.batch_requests.items() if now - request_state["touched_at"] > limit]
+        for request_id in expired:
+            self.__drop_batch_request(request_id)
 
     # Function containing the original processing logic (refactored for reuse)
     def process_request_logic(self, request_id, mongo_db):
-        # Reset flag to avoid pausing on the first call
-        self.llm.first_prompt = True
-
+        """
+        Processes the request, or the next round of a request in batch mode. A request in batch mode returns the
+        status 'batch_pending' while its batch job runs: the caller re-queues it, nothing waits for the job.
+        """
+        request_state = None
         try:
-            json_resp = """
-            {
-            "updated":"<YES/NO to state if you updated the code or not (if you believe it did not need fixing)>",
-            "comment":"<explain here what you updated (or the reason why you did not update it)>",
-            "missing_information":"<list here information needed to finalize the code (or NA if nothing is needed or if the code was not updated)>",
-            "signature_impact":"<YES/NO/UNKNOWN, to state here if the signature of the code will be updated as a consequence of changed parameter list, types, return type, etc.>",
-            "exception_impact":"<YES/NO/UNKNOWN, to state here if the exception handling related to the code will be update, as a consequence of changed exception thrown or caught, etc.>",
-            "enclosed_impact":"<YES/NO/UNKNOWN, to state here if the code update could impact code enclosed in it in the same source file, such as methods defined in updated class, etc.>",
-            "other_impact":"<YES/NO/UNKNOWN, to state here if the code update could impact any other code referencing this code>",
-            "impact_comment":"<comment here on signature, exception, enclosed, other impacts on any other code calling this one (or NA if not applicable)>",
-            "code":"<the fixed code goes here (or original code if the code was not updated)>"
-            }
-            """
+            record = None
+            if self.batch_runner:
+                self.__expire_batch_requests()
+                record = self.batch_runner.record(request_id)
+            with self.batch_lock:
+                request_state = self.batch_requests.get(request_id)
+            if request_state is not None and self.batch_runner.mongo_db is not None and (record is None or record.get("owner") != self.batch_runner.worker_id):
+                # Another worker took the request over, or completed it, since it was parked here
+                self.__drop_batch_request(request_id)
+                request_state = None
+            if request_state is not None:
+                return self.__resume_batch_request(request_state)
+
+            restored = None
+            if record is not None:
+                # Parked by another worker, or before a restart: the pipeline runs again with the answers of
+                # the completed rounds, and the running job is polled rather than submitted again
+                restored = self.batch_runner.restore(record)
+                self.batch_runner.save(restored)
+                if restored.job_id is not None and not self.__poll_batch(request_id, restored):
+                    return self.__batch_pending(request_id, restored)
+
+            json_resp = FIX_RESPONSE_SCHEMA
 
             # Get Request Information from Mongo DB
 
             # Example of accessing a collection (replace 'mycollection' with your collection name)
             engine_input_collection = self.mongo_db.get_collection("EngineInput")
             prompt_library_collection = self.mongo_db.get_collection("PromptLibrary")
-            engine_output_collection = self.mongo_db.get_collection("EngineOutput")
-            files_content_collection = self.mongo_db.get_collection("FilesContent")
 
             # Optionally, print some documents from the collection (this assumes the collection exists)
             engine_input_document = engine_input_collection.find_one({"request.requestid": f"{request_id}"})
@@ -681,6 +1120,14 @@ class AppCodeFixer:
                     RepoName = RepoURL.split("/")[-1].replace(".git", "")
                     RequestId = request["requestid"]
                     IssueID = request["issueid"]
+                    # "bypasscache": true forces fresh model completions for this request
+                    UseCache = not request.get("bypasscache", False)
+
+                    # Batch mode ("batchmode": true, or a large request): the model calls go through provider batch jobs
+                    ObjectCount = sum(len(requestdetail["objectdetails"]) for requestdetail in request["requestdetail"])
+                    batch = restored
+                    if batch is None and self.batch_runner and self.batch_runner.is_batch_request(request, ObjectCount):
+                        batch = AppLLMBatch(request_id)
 
                     engine_output = {
                         "requestid": RequestId,
@@ -698,7 +1145,34 @@ class AppCodeFixer:
                         "createddate": get_timestamp(),
                     }
 
-                    objects_status_list = []
+                    # Prefetch stage: the Imaging context of every object of the request is resolved
+                    # in one deduplicated batch, overlapping with the LLM calls of the fix stage
+                    prefetcher = AppImagingPrefetcher(self.imaging, TenantName, ApplicationName, request_id, self.prefetch_max_objects)
+                    prefetcher.prefetch([
+                        objectdetail["objectid"]
+                        for requestdetail in request["requestdetail"]
+                        for objectdetail in requestdetail["objectdetails"]
+                    ])
+
+                    # State shared by the stages of the request pipeline, kept between the rounds of a request in batch mode
+                    request_state = {
+                        "request_id": request_id,
+                        "repo_name": RepoName,
+                        "json_resp": json_resp,
+                        "mongo_db": mongo_db,
+                        "prefetcher": prefetcher,
+                        "use_cache": UseCache,
+                        "batch": batch,
+                        "jobs": [],
+                        "edits": AppEditAccumulator(),  # file edits of the request, serialized to contentinfo when persisted
+                        "engine_output": engine_output,
+                        "files_content": files_content,
+                        "file_items": [],  # files through the pipeline
+                        "parked": [],  # (stage name, item) waiting for the batch job of the round
+                        "failed": [],  # (stage name, item, exception) lost by an error in a stage handler
+                        "lock": threading.Lock(),
+                    }
+                    jobs = request_state["jobs"]
 
                     for requestdetail in request["requestdetail"]:
                         prompt_id = requestdetail["promptid"]
@@ -713,103 +1187,11 @@ class AppCodeFixer:
                                         PromptContent = prompt["prompt"]
                                         for objectdetail in requestdetail["objectdetails"]:
                                             ObjectID = objectdetail["objectid"]
+                                            jobs.append(AppObjectJob(len(jobs), ObjectID, PromptContent, request_state))
 
-                                            # Call the gen_code_connected_json function to process the request and generate code updates
-                                            engine_output = self.__gen_code_connected_json(
-                                                ApplicationName,
-                                                TenantName,
-                                                RepoName,
-                                                ObjectID,
-                                                PromptContent,
-                                                json_resp,
-                                                engine_output,
-                                                request_id,
-                                                mongo_db
-                                            )
-
-
-                        for object in engine_output['objects']:
-                            objects_status_list.append(object['status'])
-
-                        if all(item == "Unmodified" for item in objects_status_list):
-                            engine_output["status"] = "Unmodified"
-                        elif all(item == "failure" for item in objects_status_list):
-                            engine_output["status"] = "failure"
-                        elif any(item == "failure" for item in objects_status_list):
-                            engine_output["status"] = "partial success"
-                        else:
-                            engine_output["status"] = "success"
-
-                        for content in engine_output["contentinfo"]:
-                            lines = content["originalfilecontent"][0]
-                            replacements = {}
-                            for key, value in content["originalfilecontent"][1][0].items():
-                                tuple_value = ast.literal_eval(key)
-                                replacements[tuple_value] = value.split('\n')
-                                replacements[tuple_value] = [line + "\n" for line in replacements[tuple_value]]
-
-                            # Run the function with the lines and replacements
-                            modified_lines = replace_lines(self.app_logger, lines, replacements, request_id)
-                            modified_lines = "".join(modified_lines)
-                            modified_lines = self.__resend_fullfile_to_ai(modified_lines, request_id)
-                        
-                            # Generate a unique 24-character alphanumeric string
-                            unique_string = generate_unique_alphanumeric(request_id, self.app_logger)
-                            content["fileid"] = unique_string
-
-                            file_path = content["filefullname"].replace('\\','/')
-
-                            if RepoName in file_path:
-                                file_path = RepoName + file_path.split(RepoName)[-1]
-
-                            files_content_data = { "fileid":unique_string, "filepath":file_path, "updatedfilecontent": modified_lines }
-
-                            files_content["updatedcontentinfo"].append(files_content_data)
-
-                            # res = files_content_collection.insert_one(files_content_data)
-                            # print(f"Data inserted for file - {unique_string}")
-
-                            # with open("original_file.txt", "w") as of:
-                            #     of.writelines(lines)
-                            # with open("modified_file.txt", "w") as mf:
-                            #     mf.writelines(modified_lines)
-
-
-                        # Define the filter and update
-                        filter = {"request.requestid": f"{request_id}"}  # Match document with requestid
-                        update = {"$set": {"request.$[elem].status": f"{engine_output["status"] }"}}  # Update the status for the matched request
-                        array_filters = [{"elem.requestid": f"{request_id}"}] # Specify array filters
-                        engine_input_status_update = engine_input_collection.update_one(filter, update, array_filters=array_filters) # Perform the update
-
-                        # Check if data already exists
-                        existing_record = engine_output_collection.find_one({"requestid": engine_output["requestid"]})
-
-                        if existing_record:
-                            # Delete the existing record
-                            engine_output_collection.delete_one({"requestid": engine_output["requestid"]})
-                            print(f"Existing requestid - {engine_output['requestid']} deleted in engine_output_collection.")
-
-                        # Insert the new data
-                        engine_output_result = engine_output_collection.insert_one(engine_output)
-                        print(f"Data inserted into engine_output_collection for requestid - {engine_output['requestid']}")
-
-                        files_content_exist = files_content_collection.find_one({"requestid": files_content["requestid"]})
-
-                        if files_content_exist:
-                            # Delete the existing record
-                            files_content_collection.delete_one({"requestid": files_content["requestid"]})
-                            print(f"Existing requestid - {files_content['requestid']} deleted in files_content_collection.")
-                        
-                        # Insert the new data
-                        files_content_result = files_content_collection.insert_one(files_content)
-                        print(f"Data inserted into files_content_collection for requestid - {engine_output['requestid']}")
-
-                    return ({
-                        "Request_Id": request_id,
-                        "status": "success",
-                        "message" : f"Req -> {request_id} Successful.",
-                        "code": 200
-                    })
+                    request_state["barrier"] = AppFileBarrier(len(jobs))
+                    request_state["dependents"] = AppDependentChecks(len(jobs))
+                    return self.__run_request(request_state, list(jobs))
                 
                 else:
                     print(f"Req -> {request_id} Not Found or Incorrect EngineInput!")
@@ -825,9 +1207,22 @@ class AppCodeFixer:
             # Catch and print any errors that occur.
             print(f"An error occurred: {e}")
             self.app_logger.log_error("process_request", e, request_id)
+            self.__drop_batch_request(request_id)
+            if self.batch_runner:
+                try:
+                    self.batch_runner.forget(request_id)
+                except Exception as forget_error:
+                    self.app_logger.log_error("process_request", forget_error, request_id)
             return {
                 "Request_Id": request_id,
                 "status": "failed",
                 "message" : f"Internal Server Error -> {e}",
                 "code": 500
-            }
\ No newline at end of file
+            }
+        finally:
+            # Whatever the outcome, the prefetcher of a request that is not parked on a batch job is done
+            if request_state is not None:
+                with self.batch_lock:
+                    parked = self.batch_requests.get(request_id) is request_state
+                if not parked:
+                    request_state["prefetcher"].close()
@@ -0,0 +1,49 @@
+class AppImpactRecord:
+    # One caller of the object to fix, as resolved by the prefetch stage
+    __slots__ = (
+        "object_id", "object_type", "object_signature", "object_link_type", "object_bookmark_code",
+        "object_source_path", "object_file_id", "object_start_line", "object_end_line", "object_full_code",
+    )
+
+    def __init__(self, object_id="", object_type="", object_signature="", object_link_type="", object_bookmark_code="",
+                 object_source_path="", object_file_id=0, object_start_line=0, object_end_line=0, object_full_code=""):
+        self.object_id = object_id
+        self.object_type = object_type
+        self.object_signature = object_signature
+        self.object_link_type = object_link_type
+        self.object_bookmark_code = object_bookmark_code
+        self.object_source_path = object_source_path
+        self.object_file_id = object_file_id
+        self.object_start_line = object_start_line
+        self.object_end_line = object_end_line
+        self.object_full_code = object_full_code
+
+    def __getitem__(self, key):
+        # row["object_type"] like the former DataFrame rows
+        return getattr(self, key)
+
+class AppExceptionTable:
+    """
+    Exceptions raised, thrown or caught by the object, one column per field.
+
+    grouped() gives, per link type in sorted order, the exceptions without duplicates in their
+    order of appearance (the former groupby("link_type")["exception"].unique()).
+    """
+    __slots__ = ("link_types", "exceptions")
+
+    def __init__(self):
+        self.link_types = []
+        self.exceptions = []
+
+    def __len__(self):
+        return len(self.link_types)
+
+    def append(self, link_type, exception):
+        self.link_types.append(link_type)
+        self.exceptions.append(exception)
+
+    def grouped(self):
+        groups = {}
+        for link_type, exception in zip(self.link_types, self.exceptions):
+            groups.setdefault(link_type, {}).setdefault(exception, None)
+        return [(link_type, list(groups[link_type])) for link_type in sorted(groups)]
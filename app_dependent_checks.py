@@ -0,0 +1,116 @@
+import threading
+
+class AppDependentCheck:
+    # Check of one dependent object, shared by every fixed object of the request it calls
+    def __init__(self, object_id, row, request):
+        self.object_id = object_id
+        self.row = row  # impact record of the dependent object, from its first parent
+        self.request = request
+        self.parents = []  # indexes of the objects it depends on, in input order
+        self.parent_infos = []  # (index, parent info) of the fixed parents whose change may impact it
+        self.output = {"objects": [], "edits": None}  # object dictionaries and edits produced by the check
+        self.owner = None  # index of the object reporting the check in its output, the first one with a parent info
+
+class AppDependentChecks:
+    """
+    Dependent checks of a request, deduplicated by dependent object id.
+
+    A caller of several fixed objects is checked once, with the changes of all of them in its prompt,
+    once the last of them is fixed. Until every object has registered its callers, any check may
+    still get a parent and none is released. An object is complete once it is fixed and every
+    check of its callers is done.
+    """
+    def __init__(self, object_count):
+        self.object_count = object_count
+        self.lock = threading.Lock()
+        self.registered = 0
+        self.checks = {}  # dependent object id -> AppDependentCheck
+        self.checks_of = {}  # object index -> dependent object ids of its callers, in their order
+        self.waiting = {}  # dependent object id -> parents not fixed yet
+        self.pending = {}  # object index -> checks of its callers not done yet
+        self.fixed_objects = set()
+        self.candidates = set()  # dependent object ids without a parent waiting, maybe not all registered yet
+        self.released = set()
+        self.completed = set()
+
+    # private methods
+    def __resolve(self, check):
+        # Must be called with self.lock held: the check is done (or not needed), its parents stop waiting for it
+        for index in check.parents:
+            self.pending[index] -= 1
+
+    def __completed(self, indexes):
+        # Must be called with self.lock held
+        completed = []
+        for index in sorted(indexes):
+            if index in self.fixed_objects and index not in self.completed and not self.pending.get(index):
+                self.completed.add(index)
+                completed.append(index)
+        return completed
+
+    # public methods
+    def register(self, index, rows, request):
+        # Callers of the object with a known source location, known once its context is fetched
+        with self.lock:
+            self.registered += 1
+            object_ids = []
+            for row in rows:
+                object_id = str(row["object_id"])
+                if object_id in object_ids:
+                    continue
+                object_ids.append(object_id)
+                check = self.checks.get(object_id)
+                if check is None:
+                    check = self.checks[object_id] = AppDependentCheck(object_id, row, request)
+                check.parents.append(index)
+                self.waiting[object_id] = self.waiting.get(object_id, 0) + 1
+            self.checks_of[index] = object_ids
+            self.pending[index] = len(object_ids)
+
+    def fixed(self, index, parent_infos):
+        """
+        Records the fix of an object and the parent info of each of its callers to check ({dependent
+        object id: parent info}, empty when its change has no impact). Returns the checks to run and
+        the indexes of the completed objects.
+        """
+        with self.lock:
+            self.fixed_objects.add(index)
+            for object_id in self.checks_of.get(index, ()):
+                if object_id in parent_infos:
+                    self.checks[object_id].parent_infos.append((index, parent_infos[object_id]))
+                self.waiting[object_id] -= 1
+                if self.waiting[object_id] == 0:
+                    self.candidates.add(object_id)
+
+            ready = []
+            touched = {index}
+            if self.registered == self.object_count:
+                for object_id in sorted(self.candidates, key=lambda object_id: min(self.checks[object_id].parents)):
+                    if self.waiting[object_id]:
+                        continue
+                    self.candidates.discard(object_id)
+                    self.released.add(object_id)
+                    check = self.checks[object_id]
+                    touched.update(check.parents)
+                    if check.parent_infos:
+                        check.parent_infos.sort(key=lambda parent_info: parent_info[0])
+                        check.owner = check.parent_infos[0][0]
+                        ready.append(check)
+                    else:
+                        self.__resolve(check)
+            return ready, self.__completed(touched)
+
+    def is_fixed(self, index):
+        with self.lock:
+            return index in self.fixed_objects
+
+    def checked(self, check: AppDependentCheck):
+        # Returns the indexes of the objects completed by the check
+        with self.lock:
+            self.__resolve(check)
+            return self.__completed(check.parents)
+
+    def owned(self, index):
+        # Checks reported in the output of the object, in the order of its callers
+        with self.lock:
+            return [self.checks[object_id] for object_id in self.checks_of.get(index, ()) if self.checks[object_id].owner == index]
@@ -0,0 +1,224 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from flask import Config as FlaskConfig
+
+class AppFileCache:
+    """
+    Persistent, content-addressed cache for the source files served by CAST Imaging.
+
+    Entries are keyed by (tenant, application, fileId, analysis snapshot) and point to a blob
+    named after the SHA-256 of its content, so identical files are stored once whatever the
+    snapshot. The total blob size is bounded, least recently used entries are evicted first.
+
+    Changes are appended to a journal replayed over the index at load time. The index is only
+    rewritten once the journal outgrows it, and at exit, so a store costs O(1) amortized.
+    """
+    INDEX_FILE = "index.json"
+    JOURNAL_FILE = "journal.jsonl"
+    JOURNAL_MIN_RECORDS = 1000  # records appended before the index may be rewritten
+
+    def __init__(self, config: FlaskConfig):
+        # Independent of the working directory of the process
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), config["FILE_CACHE_DIR"])
+        self.max_size = int(float(config["FILE_CACHE_MAX_SIZE_IN_MB"]) * 1024 * 1024)
+        self.revalidate = str(config["FILE_CACHE_REVALIDATE"]).lower() in ("1", "true", "yes")
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> entry, least recently used first
+        self.blob_refs = {}  # digest -> number of entries referencing the blob
+        self.blob_sizes = {}  # digest -> blob size in bytes
+        self.total_size = 0
+        self.counters = {"hits": 0, "misses": 0, "revalidated": 0, "evictions": 0, "oversized": 0}
+        self.journal = None
+        self.journal_records = 0
+        os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+        self.__load_index()
+        self.__load_journal()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(tenant, application, file_id, snapshot):
+        return f"{tenant}/{application}/{file_id}/{snapshot}"
+
+    # private methods
+    def __blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest[:2], digest)
+
+    def __load_index(self):
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.isfile(index_path):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f"Ignoring unreadable file cache index {index_path}: {e}")
+            return
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get("last_access", 0)):
+            if os.path.isfile(self.__blob_path(entry["digest"])):
+                self.__add_entry(key, entry)
+
+    def __load_journal(self):
+        journal_path = os.path.join(self.cache_dir, self.JOURNAL_FILE)
+        if not os.path.isfile(journal_path):
+            return
+        try:
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # last record cut by a crash
+                    self.journal_records += 1
+                    if record["op"] == "store":
+                        if record["key"] in self.entries:
+                            self.__remove_entry(record["key"], delete_blob=False)
+                        if os.path.isfile(self.__blob_path(record["entry"]["digest"])):
+                            self.__add_entry(record["key"], record["entry"])
+                    elif record["op"] == "remove" and record["key"] in self.entries:
+                        self.__remove_entry(record["key"], delete_blob=False)
+        except OSError as e:
+            logging.error(f"Ignoring unreadable file cache journal {journal_path}: {e}")
+
+    def __append(self, record):
+        # Must be called with self.lock held
+        if self.journal is None:
+            self.journal = open(os.path.join(self.cache_dir, self.JOURNAL_FILE), "a", encoding="utf-8")
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        self.journal_records += 1
+        if self.journal_records > max(self.JOURNAL_MIN_RECORDS, len(self.entries)):
+            self.__save_index()
+
+    def __save_index(self):
+        # Must be called with self.lock held: the index replaces the journal
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = f"{index_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, index_path)
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        open(os.path.join(self.cache_dir, self.JOURNAL_FILE), "w").close()
+        self.journal_records = 0
+
+    def __add_entry(self, key, entry):
+        # Must be called with self.lock held
+        self.entries[key] = entry
+        if entry["digest"] not in self.blob_refs:
+            self.blob_refs[entry["digest"]] = 0
+            self.blob_sizes[entry["digest"]] = entry["size"]
+            self.total_size += entry["size"]
+        self.blob_refs[entry["digest"]] += 1
+
+    def __remove_entry(self, key, delete_blob=True):
+        # Must be called with self.lock held
+        entry = self.entries.pop(key)
+        digest = entry["digest"]
+        self.blob_refs[digest] -= 1
+        if self.blob_refs[digest] == 0:
+            del self.blob_refs[digest]
+            self.total_size -= self.blob_sizes.pop(digest)
+            if delete_blob:
+                try:
+                    os.remove(self.__blob_path(digest))
+                except OSError:
+                    pass
+
+    def __evict(self):
+        # Must be called with self.lock held
+        while self.entries and self.total_size > self.max_size:
+            key = next(iter(self.entries))
+            self.__remove_entry(key)
+            self.__append({"op": "remove", "key": key})
+            self.counters["evictions"] += 1
+
+    # public methods
+    def lookup(self, key):
+        # Returns the cache entry (with its HTTP validators) or None, and marks it as recently used
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            entry["last_access"] = time.time()
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return dict(entry)
+
+    def read(self, entry):
+        try:
+            with open(self.__blob_path(entry["digest"]), "rb") as f:
+                return f.read().decode("utf-8", "surrogatepass")
+        except OSError as e:
+            logging.error(f"Failed to read cached file {entry['digest']}: {e}")
+            return None
+
+    def store(self, key, content, etag=None, last_modified=None):
+        data = content.encode("utf-8", "surrogatepass")
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = self.__blob_path(digest)
+        with self.lock:
+            if len(data) > self.max_size:
+                # Would evict every other entry, then itself: not cached, and an older version of the file is dropped
+                if key in self.entries:
+                    self.__remove_entry(key)
+                    self.__append({"op": "remove", "key": key})
+                self.counters["oversized"] += 1
+                return
+            if key in self.entries:
+                self.__remove_entry(key)
+            if digest not in self.blob_refs or not os.path.isfile(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, blob_path)
+            entry = {
+                "digest": digest,
+                "size": len(data),
+                "etag": etag,
+                "last_modified": last_modified,
+                "last_access": time.time(),
+            }
+            self.__add_entry(key, entry)
+            self.__append({"op": "store", "key": key, "entry": entry})
+            self.__evict()
+
+    def mark_revalidated(self):
+        with self.lock:
+            self.counters["revalidated"] += 1
+
+    def invalidate(self, prefix=""):
+        # Drop every entry whose key starts with prefix (e.g. "tenant/application/")
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self.__remove_entry(key)
+            self.__save_index()
+
+    def flush(self):
+        # Rewrites the index with the last access times, at exit
+        with self.lock:
+            try:
+                self.__save_index()
+            except OSError as e:
+                logging.error(f"Failed to save the file cache index: {e}")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self.entries),
+                "blobs": len(self.blob_refs),
+                "size_in_bytes": self.total_size,
+                "max_size_in_bytes": self.max_size,
+            }
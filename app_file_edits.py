@@ -0,0 +1,212 @@
+import bisect
+import logging
+import threading
+
+from app_file_snapshot import FileSnapshot
+
+class AppFileEdit:
+    # Replacement of the lines start..end (1-based, inclusive) of a file by text
+    __slots__ = ("start", "end", "text", "object_id")
+
+    def __init__(self, start, end, text, object_id):
+        self.start = int(start)
+        self.end = int(end)
+        self.text = text
+        self.object_id = object_id
+
+    def key(self):
+        # Range key of the persisted contentinfo
+        return f"({self.start},{self.end})"
+
+class AppFileEdits:
+    # Edits of one file, sorted by range, with the snapshot of the original file
+    __slots__ = ("filefullname", "snapshot", "technology", "objects", "edits", "starts", "fileid")
+
+    def __init__(self, filefullname, snapshot: FileSnapshot, technology=""):
+        self.filefullname = filefullname
+        self.snapshot = snapshot
+        self.technology = technology
+        self.objects = []
+        self.edits = []
+        self.starts = []  # start line of each edit, for the bisection
+        self.fileid = None
+
+    def add(self, edit: AppFileEdit):
+        """
+        Inserts the edit in range order and returns None, or returns the edit it overlaps without
+        inserting it. An edit of the same range overlaps the previous one too: the first one is kept.
+        """
+        index = bisect.bisect_left(self.starts, edit.start)
+        if index > 0 and self.edits[index - 1].end >= edit.start:
+            return self.edits[index - 1]
+        if index < len(self.edits) and self.edits[index].start <= edit.end:
+            return self.edits[index]
+        self.edits.insert(index, edit)
+        self.starts.insert(index, edit.start)
+        return None
+
+    def replacements(self):
+        # {(start, end): replacement text}
+        return {(edit.start, edit.end): edit.text for edit in self.edits}
+
+    def to_contentinfo(self):
+        content = {
+            "filefullname": self.filefullname,
+            "objects": self.objects,
+            "originalfilecontent": [self.snapshot.lines(), [{edit.key(): edit.text for edit in self.edits}]],
+        }
+        if self.technology:
+            content["technology"] = self.technology
+        if self.fileid is not None:
+            content["fileid"] = self.fileid
+        return content
+
+class AppEditAccumulator:
+    """
+    Edits of a request, indexed by file path: each fix or dependent fix is added in O(log n) and the
+    overlapping ones are rejected instead of corrupting the file. The persisted contentinfo shape,
+    [lines, [{"(start,end)": text}]], is only built by to_contentinfo().
+    """
+    def __init__(self):
+        self.files = {}  # filefullname -> AppFileEdits, in order of the first edit
+        self.lock = threading.Lock()
+        self.conflicts = 0
+
+    # private methods
+    def __file(self, filefullname, snapshot, technology):
+        # Must be called with self.lock held
+        file = self.files.get(filefullname)
+        if file is None:
+            file = self.files[filefullname] = AppFileEdits(filefullname, snapshot, technology)
+        elif technology and not file.technology:
+            file.technology = technology
+        return file
+
+    def __add(self, file, edit):
+        # Must be called with self.lock held
+        conflict = file.add(edit)
+        if conflict is not None:
+            self.conflicts += 1
+            logging.warning(f"Edit of lines {edit.start}-{edit.end} of {file.filefullname} by object {edit.object_id} overlaps lines {conflict.start}-{conflict.end} changed by object {conflict.object_id}, not applied.")
+        return conflict
+
+    # public methods
+    def add(self, filefullname, snapshot: FileSnapshot, start, end, text, object_id, technology=""):
+        # Returns None, or the edit overlapping this one, which is then not applied
+        edit = AppFileEdit(start, end, text, object_id)
+        with self.lock:
+            file = self.__file(filefullname, snapshot, technology)
+            conflict = self.__add(file, edit)
+            if conflict is None:
+                file.objects.append(object_id)
+            return conflict
+
+    def merge(self, other, filefullname=None):
+        # Adds the edits of another accumulator (of one of its files), returns the rejected ones as (edit, overlapped edit)
+        rejected = []
+        with self.lock:
+            for other_file in other.files.values():
+                if filefullname is not None and other_file.filefullname != filefullname:
+                    continue
+                file = self.__file(other_file.filefullname, other_file.snapshot, other_file.technology)
+                rejected_ids = []
+                for edit in other_file.edits:
+                    conflict = self.__add(file, edit)
+                    if conflict is not None:
+                        rejected.append((edit, conflict))
+                        rejected_ids.append(edit.object_id)
+                for object_id in other_file.objects:
+                    if object_id in rejected_ids:
+                        rejected_ids.remove(object_id)
+                    else:
+                        file.objects.append(object_id)
+        return rejected
+
+    def reorder(self, filefullnames):
+        # Files in the given order, the other ones after them
+        with self.lock:
+            rank = {filefullname: index for index, filefullname in enumerate(filefullnames)}
+            self.files = dict(sorted(self.files.items(), key=lambda item: rank.get(item[0], len(rank))))
+
+    def __iter__(self):
+        return iter(list(self.files.values()))
+
+    def __len__(self):
+        return len(self.files)
+
+    def to_contentinfo(self):
+        return [file.to_contentinfo() for file in self.files.values()]
+
+class AppFileBarrier:
+    """
+    Fan-in of the object stages of a request into its file stages: the edits of a file are released
+    once every object that may change it (its own file, the files of its callers) is done.
+
+    Until the last object has registered its files, any file may still be changed and none is
+    released. The edits of a released file are given in the input order of the objects, so the
+    result does not depend on which object finished first.
+    """
+    def __init__(self, object_count):
+        self.object_count = object_count
+        self.lock = threading.Lock()
+        self.registered = 0
+        self.completed = set()
+        self.pending = {}  # filefullname -> registered objects not done yet that may change it
+        self.files_of = {}  # object index -> files it may change
+        self.changers = {}  # filefullname -> done objects changing it, for the files not released yet
+        self.held = True  # files changed before the last object registered, not checked since
+        self.released = set()
+        self.late = {}  # object index -> files it changed that were released before it was done
+
+    # private methods
+    def __ready(self, filefullnames):
+        # Must be called with self.lock held: the given files that no pending object can change any more
+        if self.registered < self.object_count:
+            return []
+        if self.held:
+            self.held = False
+            filefullnames = list(self.changers)
+        everything_done = len(self.completed) == self.object_count
+        ready = []
+        for filefullname in filefullnames:
+            if filefullname in self.changers and (everything_done or not self.pending.get(filefullname)):
+                self.released.add(filefullname)
+                ready.append((filefullname, sorted(self.changers.pop(filefullname))))
+        ready.sort(key=lambda file: file[1][0])
+        return ready
+
+    # public methods
+    def register(self, index, filefullnames):
+        # Files the object may change, known once its context is fetched
+        with self.lock:
+            self.registered += 1
+            self.files_of[index] = set(filefullnames)
+            for filefullname in self.files_of[index]:
+                self.pending[filefullname] = self.pending.get(filefullname, 0) + 1
+
+    def late_files(self, index):
+        # Files changed by the completed object that had already been released: its edits there are not applied
+        with self.lock:
+            return list(self.late.get(index, ()))
+
+    def is_complete(self, index):
+        with self.lock:
+            return index in self.completed
+
+    def complete(self, index, edits: AppEditAccumulator):
+        # Returns the released files, as (filefullname, indexes of the objects changing it in input order)
+        with self.lock:
+            if index in self.completed:
+                return []
+            self.completed.add(index)
+            for filefullname in self.files_of.get(index, ()):
+                self.pending[filefullname] -= 1
+            for filefullname in edits.files:
+                if filefullname in self.released:
+                    self.late.setdefault(index, []).append(filefullname)
+                else:
+                    self.changers.setdefault(filefullname, []).append(index)
+            # Only the files of this object can be released by its completion, every file once the last object is done
+            if len(self.completed) == self.object_count:
+                return self.__ready(list(self.changers))
+            return self.__ready(list(dict.fromkeys([*edits.files, *self.files_of.get(index, ())])))
@@ -0,0 +1,81 @@
+import re
+import threading
+
+from array import array
+from concurrent.futures import Future
+
+# Same line boundaries as str.splitlines(), so line numbers match the lines stored in contentinfo
+LINE_BREAK = re.compile(r"\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]")
+TRAILING_LINE_BREAK = re.compile(r"(?:\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029])\Z")
+
+class FileSnapshot:
+    """
+    Immutable source file with a line-offset index.
+
+    Line ranges are served as a single slice of the original text, without splitting the file.
+    """
+    def __init__(self, text):
+        self.text = text
+        # offsets[i] is the position of the first character of line i+1, the last item is len(text)
+        self.offsets = array("Q", [0])
+        for match in LINE_BREAK.finditer(text):
+            self.offsets.append(match.end())
+        if self.offsets[-1] != len(text):
+            self.offsets.append(len(text))
+        self.__lines = None
+        self.lock = threading.Lock()
+
+    @property
+    def line_count(self):
+        return len(self.offsets) - 1
+
+    def get_lines(self, start_line, end_line):
+        # Text of lines start_line..end_line (1-based, inclusive), without the last line break
+        start_line = max(int(start_line), 1)
+        end_line = min(int(end_line), self.line_count)
+        if start_line > end_line:
+            return ""
+        start, end = self.offsets[start_line - 1], self.offsets[end_line]
+        match = TRAILING_LINE_BREAK.search(self.text, start, end)
+        return self.text[start:match.start() if match else end]
+
+    def lines(self):
+        # Lines with their line breaks (str.splitlines(keepends=True)), built once per snapshot
+        with self.lock:
+            if self.__lines is None:
+                self.__lines = self.text.splitlines(keepends=True)
+            return self.__lines
+
+class AppFileSnapshots:
+    """
+    Request-scoped set of file snapshots: each fileId is downloaded once and every source
+    slice of the request is answered from its line-offset index.
+    """
+    def __init__(self, imaging, tenant, application, request_id):
+        self.imaging = imaging
+        self.tenant = tenant
+        self.application = application
+        self.request_id = request_id
+        self.files = {}  # fileId -> Future of FileSnapshot
+        self.lock = threading.Lock()
+
+    def get(self, object_type, file_id):
+        key = str(file_id)
+        with self.lock:
+            future = self.files.get(key)
+            owner = future is None
+            if owner:
+                future = self.files[key] = Future()
+        # Only the first caller fetches the file, concurrent callers wait for its result
+        if owner:
+            try:
+                future.set_result(FileSnapshot(self.imaging.get_file(object_type, self.tenant, self.application, file_id, self.request_id)))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def get_source(self, object_type, file_id, start_line, end_line):
+        return self.get(object_type, file_id).get_lines(start_line, end_line)
+
+    def get_file_lines(self, object_type, file_id):
+        return self.get(object_type, file_id).lines()
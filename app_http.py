@@ -0,0 +1,110 @@
+import threading
+import requests
+
+from urllib.parse import urlsplit
+from flask import Config as FlaskConfig
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+class AppHttpTransport:
+    """
+    Shared, thread-safe HTTP transport used by AppImaging and AppLLM.
+
+    All sessions mount the same adapter, so every worker thread draws from one keep-alive
+    connection pool per host instead of doing a fresh TCP+TLS handshake on every call.
+
+    The retry policy (429 and 5xx answers, read errors, with backoff) only applies to GET: POST is not
+    in the default allowed_methods of urllib3, so a model call is only retried when its connection could
+    not be established, its 429 and 5xx answers are left to AppLLM.
+    """
+    def __init__(self, config: FlaskConfig):
+        self.timeout = float(config["HTTP_TIMEOUT_IN_SECONDS"]) or None
+        self.retry = Retry(
+            total=int(config["HTTP_MAX_RETRIES"]),
+            backoff_factor=float(config["HTTP_BACKOFF_FACTOR"]),
+            # POST is not idempotent: only connection errors are retried for it, never a status code
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.adapter = _CountingAdapter(
+            self.__on_new_connection,
+            pool_connections=int(config["HTTP_POOL_CONNECTIONS"]),
+            pool_maxsize=int(config["HTTP_POOL_MAXSIZE"]),
+            max_retries=self.retry,
+        )
+        self.thread_local = threading.local()
+        self.lock = threading.Lock()
+        self.host_stats = {}
+
+    def __get_session(self):
+        # requests.Session is not guaranteed thread-safe (cookies), so each thread gets its own
+        # session; the connection pools live in the shared adapter.
+        if not hasattr(self.thread_local, "session"):
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self.thread_local.session = session
+        return self.thread_local.session
+
+    def __get_host_stats(self, host):
+        # Must be called with self.lock held
+        if host not in self.host_stats:
+            self.host_stats[host] = {"requests": 0, "handshakes": 0, "errors": 0}
+        return self.host_stats[host]
+
+    def __on_new_connection(self, host, port):
+        with self.lock:
+            self.__get_host_stats(f"{host}:{port}")["handshakes"] += 1
+
+    def request(self, method, url, **kwargs):
+        parts = urlsplit(url)
+        host = f"{parts.hostname}:{parts.port or (443 if parts.scheme == 'https' else 80)}"
+        kwargs.setdefault("timeout", self.timeout)
+        with self.lock:
+            self.__get_host_stats(host)["requests"] += 1
+        try:
+            return self.__get_session().request(method, url, **kwargs)
+        except Exception:
+            with self.lock:
+                self.__get_host_stats(host)["errors"] += 1
+            raise
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for host, stats in self.host_stats.items():
+                reused = max(stats["requests"] - stats["handshakes"], 0)
+                result[host] = {
+                    **stats,
+                    "reused": reused,
+                    "reuse_ratio": round(reused / stats["requests"], 3) if stats["requests"] else 0.0,
+                }
+            return result
+
+class _CountingAdapter(HTTPAdapter):
+    # HTTPAdapter whose urllib3 pools report every new connection (i.e. every handshake)
+    def __init__(self, on_new_connection, **kwargs):
+        self.on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.on_new_connection),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.on_new_connection),
+        }
+
+def _counting_pool_class(base, on_new_connection):
+    class CountingConnectionPool(base):
+        def _new_conn(self):
+            on_new_connection(self.host, self.port)
+            return super()._new_conn()
+    return CountingConnectionPool
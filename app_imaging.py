@@ -1,21 +1,100 @@
-import requests
+import hashlib
+import threading
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from flask import Config as FlaskConfig
+from app_cache import AppCache
+from app_file_cache import AppFileCache
+from app_http import AppHttpTransport
 from app_logger import AppLogger
 
 class AppImaging:
-    def __init__(self, app_logger: AppLogger, config: FlaskConfig):
+    def __init__(self, app_logger: AppLogger, config: FlaskConfig, transport: AppHttpTransport):
         self.base_url = f"{config["IMAGING_URL"]}rest/tenants"
         self.params = {"api-key": config["IMAGING_API_KEY"]}
         self.app_logger = app_logger
+        self.transport = transport
+        # On-disk source file cache, disabled when no cache directory is configured
+        self.file_cache = AppFileCache(config) if config["FILE_CACHE_DIR"] else None
+        self.snapshot_ttl = float(config["IMAGING_SNAPSHOT_TTL_IN_SECONDS"])
+        self.snapshots = {}  # (tenant, application) -> (snapshot, expiry)
+        self.snapshots_lock = threading.Lock()
+        self.snapshots_refresh_lock = threading.Lock()
+        # Object-graph metadata (source locations, callers, callees) of an analysis snapshot
+        self.metadata_cache = AppCache(config["IMAGING_METADATA_CACHE_SIZE"], config["IMAGING_METADATA_CACHE_TTL_IN_SECONDS"])
+        # Shared pool bounding the number of concurrent Imaging fetches of the whole process
+        self.executor = ThreadPoolExecutor(max_workers=int(config["IMAGING_MAX_CONCURRENCY"]), thread_name_prefix="imaging")
+
+    # private methods
+    def __get_metadata(self, kind, tenant, application, object_id, url):
+        # Returns (status code, decoded JSON or None, url). Only the decoded JSON of successful responses is cached,
+        # keyed by snapshot so a new analysis never serves stale data; without a known snapshot nothing is cached.
+        snapshot = self.get_snapshot(tenant, application)
+        cache_key = (tenant, application, snapshot, kind, str(object_id))
+        data = self.metadata_cache.get(cache_key) if snapshot else None
+        if data is not None:
+            return 200, data, url
+        response = self.transport.get(url, params=self.params, verify=False)
+        if response.status_code != 200:
+            return response.status_code, None, url
+        data = response.json()
+        if snapshot:
+            self.metadata_cache.set(cache_key, data)
+        return 200, data, url
+
+    # public methods
+    def submit(self, fn, *args, **kwargs):
+        # Runs fn on the Imaging pool. fn must not wait on tasks still queued on the pool (risk of deadlock).
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def invalidate(self, tenant, application):
+        # To be called when a new Imaging analysis of the application lands
+        with self.snapshots_lock:
+            self.snapshots.pop((tenant, application), None)
+        invalidated = self.metadata_cache.invalidate(lambda key: key[0] == tenant and key[1] == application)
+        if self.file_cache:
+            self.file_cache.invalidate(f"{tenant}/{application}/")
+        return invalidated
+
+    def cache_stats(self):
+        return {
+            "metadata_cache": self.metadata_cache.stats(),
+            "file_cache": self.file_cache.stats() if self.file_cache else None,
+        }
+
+    def get_snapshot(self, tenant, application):
+        """
+        Returns a token identifying the current analysis snapshot of the application, or None if unknown.
+
+        The token is a digest of the application descriptor returned by Imaging, which changes
+        whenever a new analysis is published. It is kept in memory for IMAGING_SNAPSHOT_TTL_IN_SECONDS.
+        """
+        with self.snapshots_lock:
+            snapshot, expiry = self.snapshots.get((tenant, application), (None, 0))
+        if expiry > time.monotonic():
+            return snapshot
+
+        # Concurrent fetches of the same request all need the snapshot at once: refresh it only once
+        with self.snapshots_refresh_lock:
+            with self.snapshots_lock:
+                snapshot, expiry = self.snapshots.get((tenant, application), (None, 0))
+            if expiry > time.monotonic():
+                return snapshot
+            application_url = f"{self.base_url}/{tenant}/applications/{application}"
+            application_response = self.transport.get(application_url, params=self.params, verify=False)
+            snapshot = hashlib.sha1(application_response.content).hexdigest() if application_response.status_code == 200 else None
+            with self.snapshots_lock:
+                self.snapshots[(tenant, application)] = (snapshot, time.monotonic() + self.snapshot_ttl)
+            return snapshot
 
     def get_source_locations(self, tenant, application, object_id):
         object_url = f"{self.base_url}/{tenant}/applications/{application}/objects/{object_id}?select=source-locations"
-        return requests.get(object_url, params=self.params, verify=False), object_url
+        return self.__get_metadata("source-locations", tenant, application, object_id, object_url)
 
     def get_source(self, object_type, tenant, application, object_id,  start_line, end_line, request_id):
         object_code_url = f"{self.base_url}/{tenant}/applications/{application}/files/{object_id}?start-line={start_line}&end-line={end_line}"
-        object_code_response = requests.get(object_code_url, params=self.params, verify=False)
+        object_code_response = self.transport.get(object_code_url, params=self.params, verify=False)
         # Check if the object code was fetched successfully
         if object_code_response.status_code == 200:
             object_code = (object_code_response.text)  # Get object code
@@ -26,10 +105,39 @@ class AppImaging:
 
     def get_file(self, object_type, tenant, application, file_id, request_id):
         object_code_url = f"{self.base_url}/{tenant}/applications/{application}/files/{file_id}"
-        object_code_response = requests.get(object_code_url, params=self.params, verify=False)
+
+        cache_key = None
+        cache_entry = None
+        headers = {}
+        if self.file_cache:
+            snapshot = self.get_snapshot(tenant, application)
+            cache_key = AppFileCache.make_key(tenant, application, file_id, snapshot or "unknown")
+            cache_entry = self.file_cache.lookup(cache_key)
+            # An entry of a known snapshot is immutable; otherwise it is only served after a conditional request
+            if cache_entry and snapshot and not self.file_cache.revalidate:
+                object_code = self.file_cache.read(cache_entry)
+                if object_code is not None:
+                    return object_code
+                cache_entry = None
+            if cache_entry:
+                if cache_entry["etag"]:
+                    headers["If-None-Match"] = cache_entry["etag"]
+                if cache_entry["last_modified"]:
+                    headers["If-Modified-Since"] = cache_entry["last_modified"]
+
+        object_code_response = self.transport.get(object_code_url, params=self.params, headers=headers, verify=False)
+        if object_code_response.status_code == 304 and cache_entry:
+            object_code = self.file_cache.read(cache_entry)
+            if object_code is not None:
+                self.file_cache.mark_revalidated()
+                return object_code
+            object_code_response = self.transport.get(object_code_url, params=self.params, verify=False)
+
         # Check if the object code was fetched successfully
         if object_code_response.status_code == 200:
             object_code = (object_code_response.text)  # Get object code
+            if cache_key:
+                self.file_cache.store(cache_key, object_code, object_code_response.headers.get("ETag"), object_code_response.headers.get("Last-Modified"))
         else:
             object_code = ""
             self.app_logger.log_error("get_file", f"Failed to fetch {object_type} code using {object_code_url}. Status code: {object_code_response.status_code}", request_id)
@@ -37,8 +145,8 @@ class AppImaging:
 
     def get_callees(self, tenant, application, object_id):
         object_callees_url = f"{self.base_url}/{tenant}/applications/{application}/objects/{object_id}/callees"
-        return requests.get(object_callees_url, params=self.params, verify=False), object_callees_url
+        return self.__get_metadata("callees", tenant, application, object_id, object_callees_url)
 
     def get_callers(self, tenant, application, object_id):
         object_callers_url = f"{self.base_url}/{tenant}/applications/{application}/objects/{object_id}/callers?select=bookmarks"
-        return requests.get(object_callers_url, params=self.params, verify=False), object_callers_url
\ No newline at end of file
+        return self.__get_metadata("callers", tenant, application, object_id, object_callers_url)
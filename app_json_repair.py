@@ -0,0 +1,125 @@
+import json
+import re
+import threading
+
+CODE_FENCE = re.compile(r"^\s*```[a-zA-Z]*\s*\n?(.*?)\n?\s*```\s*$", re.DOTALL)
+
+class AppJsonRepair:
+    """
+    Deterministic local repairs of a model answer that is not valid JSON.
+
+    Repairs are applied cumulatively, in order, until the answer parses as a JSON object; the name
+    of the repair that made it parse is recorded. Only when all of them fail is the model re-prompted.
+    """
+    def __init__(self):
+        self.repairs = [
+            ("strip_code_fence", self.__strip_code_fence),
+            ("extract_object", self.__extract_object),
+            ("remove_trailing_commas", self.__remove_trailing_commas),
+            ("escape_control_characters", self.__escape_control_characters),
+        ]
+        self.lock = threading.Lock()
+        self.counters = {name: 0 for name, _ in self.repairs}
+        self.counters.update({"tolerant_parser": 0, "failed": 0})
+
+    # private methods
+    @staticmethod
+    def __strip_code_fence(text):
+        match = CODE_FENCE.match(text)
+        return match.group(1) if match else text
+
+    @staticmethod
+    def __extract_object(text):
+        # Drops any prose before the first '{' and after the last '}'
+        start = text.find("{")
+        end = text.rfind("}")
+        return text[start:end + 1] if 0 <= start < end else text
+
+    @staticmethod
+    def __scan(text, on_char):
+        # Calls on_char(index, char, in_string) for every character, tracking JSON strings and escapes
+        in_string = False
+        escape = False
+        for index, char in enumerate(text):
+            on_char(index, char, in_string)
+            if escape:
+                escape = False
+            elif char == "\\" and in_string:
+                escape = True
+            elif char == '"':
+                in_string = not in_string
+
+    def __remove_trailing_commas(self, text):
+        result = []
+        pending_comma = []  # a comma outside strings, kept until the next significant character is known
+
+        def on_char(index, char, in_string):
+            if not in_string and char == ",":
+                if pending_comma:
+                    result.extend(pending_comma)
+                pending_comma[:] = [char]
+            elif pending_comma and not in_string and char in " \t\r\n":
+                pending_comma.append(char)
+            else:
+                if pending_comma:
+                    # ",}" and ",]": the comma is dropped, the whitespace is kept
+                    result.extend(pending_comma[1:] if char in "}]" else pending_comma)
+                    pending_comma.clear()
+                result.append(char)
+
+        self.__scan(text, on_char)
+        result.extend(pending_comma)
+        return "".join(result)
+
+    def __escape_control_characters(self, text):
+        # Raw newlines, tabs... inside strings (typically in the 'code' field) are escaped
+        result = []
+
+        def on_char(index, char, in_string):
+            if in_string and char < " ":
+                result.append(json.dumps(char)[1:-1])
+            else:
+                result.append(char)
+
+        self.__scan(text, on_char)
+        return "".join(result)
+
+    def __count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    # public methods
+    def repair(self, text):
+        """
+        Returns (parsed JSON object, name of the successful repair), or (None, None) when the text cannot be repaired.
+        """
+        if not isinstance(text, str):
+            return None, None
+        for name, repair in self.repairs:
+            repaired = repair(text)
+            if repaired == text:
+                continue
+            text = repaired
+            try:
+                value = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(value, dict):
+                self.__count(name)
+                return value, name
+
+        # Tolerant parser: control characters are accepted anywhere in strings
+        try:
+            value = json.loads(text, strict=False)
+        except ValueError:
+            value = None
+        if isinstance(value, dict):
+            self.__count("tolerant_parser")
+            return value, "tolerant_parser"
+
+        self.__count("failed")
+        return None, None
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
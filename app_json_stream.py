@@ -0,0 +1,167 @@
+import json
+
+WHITESPACE = " \t\r\n"
+ESCAPES = '"\\/bfnrtu'
+HEX_DIGITS = "0123456789abcdefABCDEF"
+LITERAL_START = "-0123456789tfn"
+
+class AppJsonStreamParser:
+    """
+    Incremental validator of a JSON object received in chunks (streamed model completions).
+
+    Tracks the structure character by character, so a malformed answer is detected as soon as
+    the first invalid character arrives instead of after the whole generation. It also measures
+    the length of one top-level string field (the "code" field by default) while it is streamed.
+
+    Only what the local JSON repair cannot fix aborts the stream: up to max_wrapping characters
+    around the object (a code fence, a short introduction), raw control characters in strings and
+    trailing commas are tolerated, and repaired once the answer is complete.
+    """
+    def __init__(self, watched_key="code", max_wrapping=200):
+        self.watched_key = watched_key
+        self.max_wrapping = max_wrapping
+        self.wrapping = 0
+        self.watched_length = 0
+        self.position = 0
+        self.error = None
+        self.stack = []  # one [kind, last key] per open container
+        self.expect = "root"
+        self.in_string = False
+        self.string_is_key = False
+        self.in_watched = False
+        self.escape = False
+        self.unicode_left = 0
+        self.key = []
+        self.literal = []
+
+    # private methods
+    def __fail(self, message):
+        self.error = f"{message}: char {self.position}"
+
+    def __wrap(self, message):
+        # Text around the object: tolerated up to max_wrapping characters
+        self.wrapping += 1
+        if self.wrapping > self.max_wrapping:
+            self.__fail(message)
+
+    def __end_value(self):
+        self.expect = "comma_or_end" if self.stack else "done"
+
+    def __end_literal(self):
+        literal = "".join(self.literal)
+        self.literal = []
+        try:
+            json.loads(literal)
+        except ValueError:
+            self.__fail(f"Invalid literal '{literal}'")
+            return
+        self.__end_value()
+
+    def __feed_string(self, char):
+        if self.escape:
+            self.escape = False
+            if char not in ESCAPES:
+                self.__fail("Invalid \\escape")
+            elif char == "u":
+                self.unicode_left = 4
+        elif self.unicode_left:
+            self.unicode_left -= 1
+            if char not in HEX_DIGITS:
+                self.__fail("Invalid \\uXXXX escape")
+        elif char == "\\":
+            self.escape = True
+        elif char == '"':
+            self.in_string = False
+            if self.string_is_key:
+                self.stack[-1][1] = "".join(self.key)
+                self.key = []
+                self.expect = "colon"
+            else:
+                self.in_watched = False
+                self.__end_value()
+            return
+
+        if self.string_is_key:
+            self.key.append(char)
+        elif self.in_watched:
+            self.watched_length += 1
+
+    def __start_string(self, is_key):
+        self.in_string = True
+        self.string_is_key = is_key
+        self.in_watched = not is_key and len(self.stack) == 1 and self.stack[0][1] == self.watched_key
+
+    def __feed_char(self, char):
+        self.position += 1
+        if self.in_string:
+            self.__feed_string(char)
+            return
+        if self.literal:
+            if char.isalnum() or char in "+-.":
+                self.literal.append(char)
+                return
+            self.__end_literal()
+            if self.error:
+                return
+        if char in WHITESPACE:
+            return
+
+        expect = self.expect
+        if expect == "root":
+            if char != "{":
+                self.__wrap("Expecting '{'")
+                return
+            self.stack.append(["{", None])
+            self.expect = "key_or_end"
+        elif expect in ("value", "value_or_end"):
+            if char == "]" and expect == "value_or_end":
+                self.stack.pop()
+                self.__end_value()
+            elif char == "{":
+                self.stack.append(["{", None])
+                self.expect = "key_or_end"
+            elif char == "[":
+                self.stack.append(["[", None])
+                self.expect = "value_or_end"
+            elif char == '"':
+                self.__start_string(False)
+            elif char in LITERAL_START:
+                self.literal.append(char)
+            else:
+                self.__fail("Expecting value")
+        elif expect in ("key", "key_or_end"):
+            if char == "}" and expect == "key_or_end":
+                self.stack.pop()
+                self.__end_value()
+            elif char == '"':
+                self.__start_string(True)
+            else:
+                self.__fail("Expecting property name enclosed in double quotes")
+        elif expect == "colon":
+            if char == ":":
+                self.expect = "value"
+            else:
+                self.__fail("Expecting ':' delimiter")
+        elif expect == "comma_or_end":
+            kind = self.stack[-1][0]
+            if char == ",":
+                self.expect = "key_or_end" if kind == "{" else "value_or_end"
+            elif char == ("}" if kind == "{" else "]"):
+                self.stack.pop()
+                self.__end_value()
+            else:
+                self.__fail("Expecting ',' delimiter")
+        else:
+            self.__wrap("Extra data")
+
+    # public methods
+    def feed(self, text):
+        # Returns False as soon as the text received so far cannot be the beginning of a valid JSON object
+        for char in text:
+            if self.error:
+                break
+            self.__feed_char(char)
+        return self.error is None
+
+    def is_complete(self):
+        return self.error is None and self.expect == "done"
@@ -0,0 +1,50 @@
+from app_file_snapshot import FileSnapshot
+
+class AppLineSplice:
+    """
+    Replaces line ranges of a file snapshot in one pass over its text.
+
+    The ranges (1-based, inclusive) are checked before anything is copied: a range outside of the
+    file or overlapping a previous one is reported in conflicts and not applied. The kept parts of
+    the original text are sliced at the line offsets of the snapshot and joined once with the
+    replacements, each replacement ending with a line break like the lines it replaces.
+    """
+    def __init__(self, snapshot: FileSnapshot, replacements):
+        # replacements: {(start, end): text without its last line break}
+        self.snapshot = snapshot
+        self.conflicts = []
+        self.ranges = []  # (start, end, text) of the applied replacements, in line order
+        line_count = snapshot.line_count
+        previous_end = 0
+        for (start, end), text in sorted(((int(start), int(end)), text) for (start, end), text in replacements.items()):
+            if start < 1 or end < start or start > line_count:
+                self.conflicts.append(f"lines {start}-{end} out of the {line_count} lines of the file")
+            elif start <= previous_end:
+                self.conflicts.append(f"lines {start}-{end} overlap lines ending at {previous_end}")
+            else:
+                end = min(end, line_count)
+                self.ranges.append((start, end, text))
+                previous_end = end
+
+    def changed_ranges(self):
+        # Line ranges of the replacements in the spliced text
+        changed = []
+        shift = 0
+        for start, end, text in self.ranges:
+            count = text.count("\n") + 1
+            changed.append((start + shift, start + shift + count - 1))
+            shift += count - (end - start + 1)
+        return changed
+
+    def text(self):
+        source = self.snapshot.text
+        offsets = self.snapshot.offsets
+        parts = []
+        position = 0
+        for start, end, text in self.ranges:
+            parts.append(source[position:offsets[start - 1]])
+            parts.append(text)
+            parts.append("\n")
+            position = offsets[end]
+        parts.append(source[position:])
+        return "".join(parts)
@@ -1,36 +1,56 @@
+import copy
 import json
 import logging
+import threading
 import time
-import requests
-import tiktoken
 
 from flask import Config as FlaskConfig
+from app_batch import AppLLMBatch
+from app_http import AppHttpTransport
+from app_json_repair import AppJsonRepair
+from app_json_stream import AppJsonStreamParser
+from app_llm_cache import AppLLMCache
+from app_llm_router import AppLLMRoute, AppLLMRouter
+from app_llm_schema import AppLLMSchema, AppLLMSchemaError
 from app_logger import AppLogger
+from app_rate_limiter import AppRateLimiter
+from app_token_counter import AppTokenCounter
+from app_tokenizer import AppTokenizer
+
+TRUNCATION_MARKER = "\n[...]\n"
+RESPONSE_FORMATS = ("text", "json_object", "json_schema")  # from the weakest to the strictest
 
 class AppLLM:
-    def __init__(self, app_logger: AppLogger,  config: FlaskConfig):
+    def __init__(self, app_logger: AppLogger,  config: FlaskConfig, transport: AppHttpTransport, llm_cache: AppLLMCache = None):
         self.model_name = config["MODEL_NAME"]
         self.model_version = config["MODEL_VERSION"] # UNUSED
-        self.model_url = config["MODEL_URL"]
         self.model_max_input_tokens = int(config["MODEL_MAX_INPUT_TOKENS"])
         self.model_max_output_tokens = int(config["MODEL_MAX_OUTPUT_TOKENS"])
-        self.model_invocation_delay = int(config["MODEL_INVOCATION_DELAY_IN_SECONDS"])
-        self.headers = { "Authorization": f"Bearer {config["MODEL_API_KEY"]}", "Content-Type": "application/json" }
+        self.model_invocation_delay = int(config["MODEL_INVOCATION_DELAY_IN_SECONDS"]) # default delay after a 429 without Retry-After
+        self.model_max_rate_limit_retries = int(config["MODEL_MAX_RATE_LIMIT_RETRIES"])
+        self.model_response_format_retry = float(config["MODEL_RESPONSE_FORMAT_RETRY_IN_SECONDS"])
         self.app_logger = app_logger
-        self.first_prompt = True
-        try:
-            # Try to retrieve the appropriate token encoding based on the AI model name.
-            # Different models may use different tokenization methods.
-            self.encoding = tiktoken.encoding_for_model(self.model_name)
-            print(f"Using encoding for {self.model_name}")
-        except KeyError:
-            # If the model name is not recognized (causing a KeyError), fall back to a default encoding.
-            # 'cl100k_base' is a common fallback for models that do not have a specific encoding.
-            self.encoding = tiktoken.get_encoding("cl100k_base")
-            print(f"Using fallback encoding 'cl100k_base'")
+        self.transport = transport
+        self.llm_cache = llm_cache
+        # Model endpoint of each call, by task and prompt size
+        self.router = AppLLMRouter(config)
+        # Shared by all the worker threads: throughput is bounded by the provider quota, not by a fixed delay
+        self.rate_limiter = AppRateLimiter(config["MODEL_REQUESTS_PER_MINUTE"], config["MODEL_TOKENS_PER_MINUTE"])
+        # Loaded on first use, from the local BPE cache when available
+        self.encoding = AppTokenizer(self.model_name, config)
+        self.token_counter = AppTokenCounter(self.encoding, config["TOKEN_COUNT_CACHE_SIZE"])
+        self.json_repair = AppJsonRepair()
+        # Structured output assumed by the prompts: 'json_schema' (answer constrained by the schema), 'json_object' (JSON mode) or 'text'.
+        # A route enforcing less gets the JSON instructions back in its prompts
+        self.model_response_format = config["MODEL_RESPONSE_FORMAT"]
+        # Streaming mode: answers are validated while they are generated and aborted as soon as they go wrong
+        self.model_streaming = str(config["MODEL_STREAMING"]).lower() in ("1", "true", "yes")
+        self.model_stream_max_code_chars_per_token = float(config["MODEL_STREAM_MAX_CODE_CHARS_PER_TOKEN"])
+        self.stream_lock = threading.Lock()
+        self.stream_counters = {"streams": 0, "completed": 0, "aborted_invalid": 0, "aborted_oversized": 0, "ttft_total_in_seconds": 0.0, "ttft_max_in_seconds": 0.0, "duration_total_in_seconds": 0.0}
 
     # private methods
-    def count_tokens(self, prompt, request_id):
+    def count_tokens(self, prompt, request_id, segments=(), templates=()):
         try:
             """
             Counts the number of tokens in the given prompt using the token encoding for the specified AI model.
@@ -38,15 +58,14 @@ class AppLLM:
             Parameters:
             ai_model_name (str): The name of the AI model, used to select the appropriate token encoding.
             prompt (str): The input text for which tokens will be counted.
+            segments (tuple): Dynamic texts embedded in the prompt, counted from the memo.
+            templates (tuple): Static templates embedded in the prompt, tokenized only once.
 
             Returns:
             int: The number of tokens in the prompt.
             """
-            # Encode the prompt using the selected encoding, which converts the text into tokens.
-            tokens = self.encoding.encode(prompt)
-
             # Return the total number of tokens in the prompt.
-            return len(tokens)
+            return self.token_counter.count_composed(prompt, segments, templates)
         except Exception as e:
             # Catch and print any errors that occur.
             print(f"An error occurred: {e}")
@@ -55,14 +74,203 @@ class AppLLM:
     def truncate_prompt(self, prompt, max_tokens):
         """
         Truncate the prompt so that its token count does not exceed max_tokens.
+        The head (task, code) and the tail (answer instructions) are kept, the middle is cut.
         Returns the truncated prompt and the number of tokens.
         """
         tokens = self.encoding.encode(prompt)
         if len(tokens) <= max_tokens:
             return prompt, len(tokens)
-        truncated_tokens = tokens[:max_tokens]
+        marker = self.encoding.encode(TRUNCATION_MARKER)
+        tail_size = min(max_tokens // 4, max(max_tokens - len(marker), 0))
+        head_size = max(max_tokens - tail_size - len(marker), 0)
+        if head_size == 0:
+            return self.encoding.decode(tokens[len(tokens) - max_tokens:]), max_tokens
+        truncated_tokens = tokens[:head_size] + marker + tokens[len(tokens) - tail_size:]
         truncated_prompt = self.encoding.decode(truncated_tokens)
-        return truncated_prompt, max_tokens
+        return truncated_prompt, len(truncated_tokens)
+
+    def __post(self, route: AppLLMRoute, payload, estimated_tokens, ObjectID, stream=False, fallback_payload=None):
+        """
+        Sends the payload to an endpoint of the route as soon as the shared quota and the endpoint quota allow it.
+
+        A 429 blocks the endpoint that answered it, and the shared quota when the endpoint has no quota of its own;
+        a failing endpoint is retried on another one of the route. A 400 to a payload with structured output is
+        retried with the fallback payload, and the endpoint that answered it gets the fallback payloads for
+        MODEL_RESPONSE_FORMAT_RETRY_IN_SECONDS, the other endpoints of the route keep the structured output. Returns the response and the endpoint
+        that answered it: the caller settles the estimated tokens of both limiters once the call is over.
+        """
+        pool = route.pool
+        # The shared quota is charged once per call, whatever the number of attempts
+        self.rate_limiter.acquire(estimated_tokens)
+        try:
+            for attempt in range(self.model_max_rate_limit_retries + 1):
+                if attempt:
+                    self.rate_limiter.wait_unblocked()
+                endpoint = pool.select(estimated_tokens)
+                endpoint.rate_limiter.acquire(estimated_tokens)
+                start_time = time.monotonic()
+                last_attempt = attempt == self.model_max_rate_limit_retries or len(pool.endpoints) == 1
+                structured = fallback_payload is not None and endpoint.text_until <= start_time
+                endpoint_payload = fallback_payload if fallback_payload is not None and not structured else payload
+                try:
+                    response = self.transport.post(endpoint.url, headers=endpoint.headers, json=endpoint_payload, stream=stream)
+                except Exception as e:
+                    pool.record(endpoint, error=True)
+                    endpoint.rate_limiter.settle(estimated_tokens, 0)
+                    if last_attempt:
+                        raise
+                    logging.warning(f"AI model endpoint {endpoint.name} failed for objectID-{ObjectID}: {e}, retrying on another endpoint...")
+                    continue
+                if response.status_code == 400 and structured and attempt < self.model_max_rate_limit_retries:
+                    response.close()
+                    endpoint.rate_limiter.settle(estimated_tokens, 0)
+                    logging.warning(f"AI model endpoint {endpoint.name} rejected the response format '{route.response_format}' for objectID-{ObjectID}, falls back to 'text' for {self.model_response_format_retry} seconds...")
+                    endpoint.text_until = time.monotonic() + self.model_response_format_retry
+                    continue
+                if response.status_code != 429:
+                    failed = response.status_code >= 500 or response.status_code in (401, 403)
+                    pool.record(endpoint, time.monotonic() - start_time, error=failed)
+                    if not failed or last_attempt:
+                        break
+                    response.close()
+                    endpoint.rate_limiter.settle(estimated_tokens, 0)
+                    logging.warning(f"AI model endpoint {endpoint.name} answered {response.status_code} for objectID-{ObjectID}, retrying on another endpoint...")
+                    continue
+                response.close()
+                if attempt < self.model_max_rate_limit_retries:
+                    endpoint.rate_limiter.settle(estimated_tokens, 0)  # a refused call used no tokens, the last one is settled by the caller
+                pool.record(endpoint, rate_limited=True)
+                # "Retry-After" can contain a date/time or a delay in seconds
+                delay = AppRateLimiter.parse_retry_after(response.headers.get("Retry-After"))
+                if delay is None:
+                    delay = self.model_invocation_delay
+                logging.warning(f"AI model rate limit reached on endpoint {endpoint.name} for objectID-{ObjectID}, retrying in {delay} seconds (attempt {attempt + 1})...")
+                endpoint.rate_limiter.on_rate_limited(delay)
+                if endpoint.rate_limiter.requests_per_minute <= 0 and endpoint.rate_limiter.tokens_per_minute <= 0:
+                    # An endpoint without a quota of its own draws from the shared quota: every call waits
+                    self.rate_limiter.on_rate_limited(delay)
+        except Exception:
+            self.rate_limiter.settle(estimated_tokens, 0)
+            raise
+        return response, endpoint
+
+    def __stream(self, route: AppLLMRoute, payload, estimated_tokens, max_tokens, ObjectID, fallback_payload=None):
+        """
+        Sends the payload in streaming mode (server-sent events) and validates the JSON answer while it arrives.
+
+        Returns a dict shaped like a non-streamed completion and the endpoint that answered. When the answer is
+        aborted early, the content is the partial answer and "aborted" holds the reason ("invalid" or "oversized") and "error" the detail.
+        """
+        payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        if fallback_payload is not None:
+            fallback_payload = {**fallback_payload, "stream": True, "stream_options": {"include_usage": True}}
+        max_code_chars = int(max_tokens * self.model_stream_max_code_chars_per_token)
+        parser = AppJsonStreamParser("code")
+        content = []
+        usage = None
+        aborted = None
+        error = None
+        first_token_time = None
+
+        start_time = time.monotonic()
+        response, endpoint = self.__post(route, payload, estimated_tokens, ObjectID, stream=True, fallback_payload=fallback_payload)
+        try:
+            with response:
+                response.raise_for_status()  # Raise an error for bad responses
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    for choice in chunk.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if not delta:
+                            continue
+                        if first_token_time is None:
+                            first_token_time = time.monotonic()
+                        content.append(delta)
+                        if not parser.feed(delta):
+                            aborted, error = "invalid", parser.error
+                        elif parser.watched_length > max_code_chars:
+                            aborted, error = "oversized", f"the 'code' field exceeds the expected size of {max_code_chars} characters"
+                    if aborted:
+                        # Closing the connection stops the generation, and the token spend, on the provider side
+                        logging.warning(f"AI response stream aborted for objectID-{ObjectID}: {error}")
+                        break
+        except Exception:
+            # The call is over without an answer: nothing is left to settle for the caller
+            self.rate_limiter.settle(estimated_tokens, 0)
+            endpoint.rate_limiter.settle(estimated_tokens, 0)
+            raise
+
+        end_time = time.monotonic()
+        ttft = (first_token_time or end_time) - start_time
+        with self.stream_lock:
+            self.stream_counters["streams"] += 1
+            self.stream_counters[f"aborted_{aborted}" if aborted else "completed"] += 1
+            self.stream_counters["ttft_total_in_seconds"] += ttft
+            self.stream_counters["ttft_max_in_seconds"] = max(self.stream_counters["ttft_max_in_seconds"], ttft)
+            self.stream_counters["duration_total_in_seconds"] += end_time - start_time
+
+        content = "".join(content)
+        if usage is None:
+            # The provider did not report the usage (aborted stream, or no support of stream_options)
+            prompt_tokens = self.token_counter.count(payload["messages"][0]["content"])
+            completion_tokens = self.token_counter.count(content)
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        return {"choices": [{"message": {"content": content}}], "usage": usage, "aborted": aborted, "error": error}, endpoint
+
+    def response_guidelines(self, schema: AppLLMSchema, response_format=None):
+        # Prompt section describing the expected answer, not needed when the endpoint enforces the schema
+        response_format = response_format or self.model_response_format
+        if response_format == "json_schema":
+            return ""
+        elif response_format == "json_object":
+            return f"Respond with a JSON object with the following structure:\n'''\n{schema.template}\n'''\n"
+        return f"GUIDELINES:\nUse the following JSON structure to respond:\n'''\n{schema.template}\n'''\n"
+
+    def response_closing(self, response_format=None):
+        if (response_format or self.model_response_format) in ("json_schema", "json_object"):
+            return ""
+        return ("Make sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string. "
+                "Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n")
+
+    def __payload(self, route: AppLLMRoute, messages, schema: AppLLMSchema):
+        """
+        Returns the payload of a call to the route, and the payload to fall back to when its endpoint rejects
+        the structured output (None without structured output). The JSON instructions left out of the prompts
+        by MODEL_RESPONSE_FORMAT are added back whenever the route does not enforce as much.
+        """
+        payload = {"model": route.model_name, "messages": messages, "temperature": 0}
+        if schema is None:
+            return payload, None
+        instructed_messages = messages
+        if self.model_response_format != "text":
+            content = f"{messages[0]['content']}\n{self.response_guidelines(schema, 'text')}\n{self.response_closing('text')}"
+            instructed_messages = [{"role": "user", "content": content}]
+        if RESPONSE_FORMATS.index(route.response_format) < RESPONSE_FORMATS.index(self.model_response_format):
+            payload["messages"] = instructed_messages
+        response_format = schema.response_format(route.response_format)
+        if not response_format:
+            return payload, None
+        fallback_payload = {**payload, "messages": instructed_messages}
+        payload["response_format"] = response_format
+        return payload, fallback_payload
+
+    def stream_stats(self):
+        with self.stream_lock:
+            counters = dict(self.stream_counters)
+        streams = counters["streams"]
+        return {
+            **counters,
+            "enabled": self.model_streaming,
+            "ttft_avg_in_seconds": round(counters["ttft_total_in_seconds"] / streams, 3) if streams else 0.0,
+            "duration_avg_in_seconds": round(counters["duration_total_in_seconds"] / streams, 3) if streams else 0.0,
+        }
 
     def ask_ai_model(
         self,
@@ -71,22 +279,11 @@ class AppLLM:
         json_resp,
         max_tokens,
         ObjectID=None,
+        use_cache=True,
+        prompt_tokens=None,
+        batch: AppLLMBatch = None,
+        task="fix",
     ):
-        # REM-DMA: I understand the LLM is rate limited
-        # REM-DMA: typically, if a request is denied because of rate-limitation, the HTTP status code should be 429 (Too Many Requests)
-        # REM-DMA: in which case a "Retry-After" header may be provided indicating when a new request can be issued
-        # REM-DMA: "Retry-After" can contain a date/time or a delay in seconds
-        # REM-DMA: see https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Retry-After
-        # REM-DMA: maybe it would be interesting to use that info, if available, to optimize throughput?
-        # REM-DMA: the idea would be to remove all systematic calls to "time.sleep"
-        # REM-DMA: and only sleep when the limited has been exceeded
-
-        if self.first_prompt:
-            self.first_prompt = False
-        else:
-            # Delay for model invocation
-            time.sleep(self.model_invocation_delay)  
-
         MAX_RETRIES = 3
 
         tokens = {
@@ -102,7 +299,12 @@ class AppLLM:
 
             Parameters:
             prompt_content (str): prompt to send to the AI model.
+            json_resp (AppLLMSchema or str): expected structure of the answer, validated when it is an AppLLMSchema.
             max_tokens (int): The maximum number of tokens the AI model can generate.
+            use_cache (bool): False to bypass the completion cache.
+            prompt_tokens (int): Token count of prompt_content when already known by the caller.
+            batch (AppLLMBatch): Batch of the request in batch mode, None to call the model directly.
+            task (str): 'fix', 'dependent' or 'cleanup', selects the model endpoint with the prompt size.
 
             Returns:
             dict or None: The JSON response from the AI model if valid, otherwise None.
@@ -122,38 +324,86 @@ class AppLLM:
 
             messages = [{"role": "user", "content": prompt_content}]
 
-            # Prepare the payload for the AI API
-            payload = { "model": self.model_name, "messages": messages, "temperature": 0 }
+            schema = json_resp if isinstance(json_resp, AppLLMSchema) else None
+            if schema:
+                json_resp = schema.template
 
             # with open(f"payload_for_objectID_{ObjectID}.json", "w") as f:
             #     json.dump(payload, f, indent=4)
 
             # Check prompt token length before sending to LLM
-            prompt_token_count = self.count_tokens(prompt_content, request_id)
-            if prompt_token_count > self.model_max_input_tokens:
+            if prompt_tokens is not None:
+                prompt_token_count = prompt_tokens
+            elif (len(self.router.routes_of(task)) == 1 and self.rate_limiter.tokens_per_minute <= 0
+                  and self.token_counter.fits(prompt_content, self.router.prompt_limit(task, max_tokens))):
+                # One route, clearly under its limits, and no token quota to draw from: the exact count is not needed
+                prompt_token_count = 0
+            else:
+                prompt_token_count = self.count_tokens(prompt_content, request_id)
+
+            # The same endpoint answers the JSON repair retries of the call
+            route = self.router.route(task, prompt_token_count, max_tokens)
+            if prompt_token_count > route.max_input_tokens:
                 self.app_logger.log_error(
-                    f"Prompt too long: {prompt_token_count} tokens (limit: {self.model_max_input_tokens})",
+                    f"Prompt too long: {prompt_token_count} tokens (limit: {route.max_input_tokens})",
                     f"ask_ai_model ObjectID={ObjectID}", request_id
                 )
                 # Optionally, truncate the prompt automatically
-                prompt_content, prompt_token_count = self.truncate_prompt(prompt_content, self.model_max_input_tokens)
+                prompt_content, prompt_token_count = self.truncate_prompt(prompt_content, route.max_input_tokens)
+                messages = [{"role": "user", "content": prompt_content}]
                 # Or, if you want to reject instead of truncate, uncomment below and comment out the above two lines:
-                # return None, f"Prompt too long: {prompt_token_count} tokens (limit: {self.model_max_input_tokens}). Please shorten your input.", {"prompt_tokens": prompt_token_count, "completion_tokens": 0, "total_tokens": prompt_token_count}
+                # return None, f"Prompt too long: {prompt_token_count} tokens (limit: {route.max_input_tokens}). Please shorten your input.", {"prompt_tokens": prompt_token_count, "completion_tokens": 0, "total_tokens": prompt_token_count}
+
+            # Prepare the payload for the AI API
+            payload, fallback_payload = self.__payload(route, messages, schema)
+
+            # Completions are deterministic (temperature 0): an identical prompt is answered from the cache,
+            # reporting the token usage of the original call
+            cache_key = AppLLMCache.make_key(route.model_name, messages, max_tokens)
+            cached = self.llm_cache.get(cache_key, use_cache) if self.llm_cache else None
+            if cached is not None:
+                ai_response, cached_tokens = cached
+                print(f"processed objectID - {ObjectID} (cached).")
+                return copy.deepcopy(ai_response), "success", dict(cached_tokens)
+
+            original_prompt_content = prompt_content
+
             # Loop for retrying the request in case of errors or invalid JSON.
             for attempt in range(1, MAX_RETRIES + 1):
+                # Send the request to the AI model and get the completion response.
+                estimated_tokens = prompt_token_count + max_tokens
+                endpoint = None
+                used_tokens = 0
                 try:
-                    # Send the request to the AI model and get the completion response.
-                    response = requests.post(self.model_url, headers=self.headers, json=payload)
-                    response.raise_for_status()  # Raise an error for bad responses
-
-                    # Extract the AI model's response content (text) from the first choice.
-                    response_content = response.text
+                    if batch is not None:
+                        # Batch mode: answered from the batch results of the previous rounds, or recorded for the next batch job
+                        custom_id = AppLLMCache.make_key(route.model_name, payload["messages"], max_tokens)
+                        answer = batch.lookup(custom_id)
+                        if answer is None:
+                            batch.add(custom_id, payload)
+                            return None, AppLLMBatch.PENDING, tokens
+                        if "error" in answer:
+                            return None, f"{answer['error']}. Please Resend the request...", tokens
+                        response_content = json.dumps(answer)
+                    elif self.model_streaming:
+                        streamed_json, endpoint = self.__stream(route, payload, estimated_tokens, max_tokens, ObjectID, fallback_payload)
+                        response_content = json.dumps(streamed_json)
+                    else:
+                        response, endpoint = self.__post(route, payload, estimated_tokens, ObjectID, fallback_payload=fallback_payload)
+                        response.raise_for_status()  # Raise an error for bad responses
+
+                        # Extract the AI model's response content (text) from the first choice.
+                        response_content = response.text
 
                     logging.info(f"AI Response (Attempt {attempt}): {response_content}")
 
                     # Try to parse the AI response as JSON.
+                    # (reset on each attempt: an answer that is not even a completion has no abort flag)
+                    response_json = {}
+                    ai_response = response_content
                     try:
                         response_json = json.loads(response_content)
+                        used_tokens = (response_json.get("usage") or {}).get("total_tokens", 0)
 
                         ai_response = response_json["choices"][0]["message"]["content"]
 
@@ -165,7 +415,26 @@ class AppLLM:
 
 
                         ai_response = response_json["choices"][0]["message"]["content"]
-                        ai_response = json.loads(ai_response)  # Successfully parsed JSON, return it.
+                        if response_json.get("aborted") == "oversized":
+                            # The streamed answer was cut short: handled as an invalid JSON answer
+                            # (an answer aborted as invalid goes through the local repair first, like any other one)
+                            raise json.JSONDecodeError(response_json["error"], ai_response, len(ai_response))
+                        try:
+                            ai_response = json.loads(ai_response)  # Successfully parsed JSON, return it.
+                        except json.JSONDecodeError:
+                            # Local repair first (code fences, trailing commas, raw newlines...), re-prompting is the last resort
+                            repaired_response, repair = self.json_repair.repair(ai_response)
+                            if repaired_response is None:
+                                raise
+                            logging.info(f"AI response of objectID-{ObjectID} repaired locally ({repair}).")
+                            ai_response = repaired_response
+                        if schema:
+                            # Every field is checked here, once, instead of failing deep inside the caller
+                            try:
+                                ai_response = schema.validate(ai_response)
+                            except AppLLMSchemaError:
+                                ai_response = response_json["choices"][0]["message"]["content"]
+                                raise
 
                         print(f"processed objectID - {ObjectID}.")
 
@@ -174,30 +443,48 @@ class AppLLM:
                             "completion_tokens": response_json["usage"]["completion_tokens"],
                             "total_tokens": response_json["usage"]["total_tokens"]
                             }
+                        if self.llm_cache:
+                            # Stored under the original prompt, even when the answer came from a JSON repair retry
+                            self.llm_cache.set(cache_key, route.model_name, copy.deepcopy(ai_response), tokens, use_cache)
 
                         return ai_response, "success", tokens
-                    except json.JSONDecodeError as e:
+                    except (json.JSONDecodeError, AppLLMSchemaError) as e:
                         # Log the JSON parsing error and prepare for retry if needed.
                         logging.error(f"JSON decoding failed on attempt {attempt}: {e}")
 
                         if attempt < MAX_RETRIES:
-                            # If attempts remain, wait for a delay before retrying.
-                            logging.info(f"Retrying AI request in {self.model_invocation_delay} seconds...")
-                            time.sleep(self.model_invocation_delay)
-
-                            prompt_content = (
-                                f"The following text is not a valid JSON string:\n```{ai_response}```\n"
-                                f"When trying to parse it with json.loads() in Python script, one gets the following error:\n```{e}```\n"
-                                f"It should match the following structure:\n```{json_resp}```\n"
-                                f"\nMake sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string. "
-                                f"Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n"
-                            )
+                            # If attempts remain, retry as soon as the rate limiter allows it.
+                            logging.info("Retrying AI request...")
+
+                            if response_json.get("aborted") == "oversized":
+                                # A runaway answer: ask again for the original task, with an explicit size constraint
+                                prompt_content = (
+                                    f"{original_prompt_content}\n"
+                                    f"A previous answer was rejected because {response_json['error']}. "
+                                    f"Keep the 'code' field to the updated version of the given code only.\n"
+                                )
+                            elif isinstance(e, AppLLMSchemaError):
+                                prompt_content = (
+                                    f"The following JSON string does not match the expected structure:\n```{ai_response}```\n"
+                                    f"Error: {e}.\n"
+                                    f"It should match the following structure:\n```{json_resp}```\n"
+                                    f"\n{self.response_closing()}"
+                                )
+                            else:
+                                prompt_content = (
+                                    f"The following text is not a valid JSON string:\n```{ai_response}```\n"
+                                    f"When trying to parse it with json.loads() in Python script, one gets the following error:\n```{e}```\n"
+                                    f"It should match the following structure:\n```{json_resp}```\n"
+                                    f"\nMake sure your response is a valid JSON string.\nRespond only the JSON string, and only the JSON string. "
+                                    f"Do not enclose the JSON string in triple quotes, backslashes, ... Do not add comments outside of the JSON structure.\n"
+                                )
 
                             # prompt_content = (prompt_content.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\"))
 
                             messages = [{"role": "user", "content": prompt_content}]
                             # Prepare the payload for the AI API
-                            payload = { "model": self.model_name, "messages": messages, "temperature": 0 }
+                            payload, fallback_payload = self.__payload(route, messages, schema)
+                            prompt_token_count = self.count_tokens(prompt_content, request_id, (original_prompt_content, ai_response, str(e)), (json_resp,))
 
                         else:
                             # If max retries reached, log an error and return None.
@@ -208,6 +495,11 @@ class AppLLM:
                     # Log any general errors during the request, and retry if possible.
                     print(f"Error during AI model completion for the objectID-{ObjectID}:  {e}")
                     return None, f"{e}. Please Resend the request...", tokens
+                finally:
+                    if endpoint is not None:
+                        # The estimate drawn from the quotas is corrected by the real usage, nothing for a failed call
+                        self.rate_limiter.settle(estimated_tokens, used_tokens)
+                        endpoint.rate_limiter.settle(estimated_tokens, used_tokens)
 
             # Return None if all attempts fail.
             return None, "AI Model failed to fix the code. Please Resend the request...", tokens
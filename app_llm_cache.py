@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+import threading
+
+from datetime import datetime, timezone
+from flask import Config as FlaskConfig
+from app_cache import AppCache
+from app_mongo import AppMongoDb
+
+class AppLLMCache:
+    """
+    Two-tier cache of deterministic (temperature 0) model completions.
+
+    Completions are keyed by a hash of (model name, messages, max_tokens). The in-memory tier is
+    bounded by size and TTL, the persistent tier is a MongoDB collection expiring documents with
+    a TTL index, so answers survive restarts and are shared by every API instance.
+    """
+    COLLECTION_NAME = "LLMCompletionCache"
+
+    def __init__(self, mongo_db: AppMongoDb, config: FlaskConfig):
+        self.mongo_db = mongo_db
+        self.enabled = str(config["LLM_CACHE_ENABLED"]).lower() in ("1", "true", "yes")
+        self.ttl = int(config["LLM_CACHE_TTL_IN_SECONDS"])
+        self.memory = AppCache(config["LLM_CACHE_SIZE"], self.ttl)
+        self.lock = threading.Lock()
+        self.index_created = False
+        self.counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "bypassed": 0, "stores": 0}
+
+    @staticmethod
+    def make_key(model_name, messages, max_tokens):
+        payload = json.dumps([model_name, messages, max_tokens], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # private methods
+    def __count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def __get_collection(self):
+        collection = self.mongo_db.get_collection(self.COLLECTION_NAME)
+        if not self.index_created:
+            # Documents are removed by MongoDB once they are older than the TTL
+            if self.ttl > 0:
+                collection.create_index("createdAt", expireAfterSeconds=self.ttl)
+            self.index_created = True
+        return collection
+
+    # public methods
+    def get(self, key, use_cache=True):
+        # Returns (response, tokens) of a cached completion, or None
+        if not self.enabled:
+            return None
+        if not use_cache:
+            self.__count("bypassed")
+            return None
+
+        cached = self.memory.get(key)
+        if cached is not None:
+            self.__count("memory_hits")
+            return cached
+
+        try:
+            document = self.__get_collection().find_one({"_id": key})
+        except Exception as e:
+            logging.error(f"Failed to read the LLM completion cache: {e}")
+            document = None
+        if document is None:
+            self.__count("misses")
+            return None
+
+        cached = (document["response"], document["tokens"])
+        self.memory.set(key, cached)
+        self.__count("persistent_hits")
+        return cached
+
+    def set(self, key, model_name, response, tokens, use_cache=True):
+        if not self.enabled or not use_cache:
+            return
+        self.memory.set(key, (response, tokens))
+        try:
+            self.__get_collection().replace_one(
+                {"_id": key},
+                {"_id": key, "model": model_name, "response": response, "tokens": tokens, "createdAt": datetime.now(timezone.utc)},
+                upsert=True
+            )
+            self.__count("stores")
+        except Exception as e:
+            logging.error(f"Failed to write the LLM completion cache: {e}")
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters["memory_hits"] + counters["persistent_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["persistent_hits"]
+        return {
+            **counters,
+            "enabled": self.enabled,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "memory": self.memory.stats(),
+        }
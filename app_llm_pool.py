@@ -0,0 +1,119 @@
+import collections
+import random
+import threading
+import time
+
+from app_rate_limiter import AppRateLimiter
+
+class AppLLMEndpoint:
+    # One deployment of a model: its URL and key, its own quota and its health
+    def __init__(self, name, url, api_key, weight=1, requests_per_minute=0, tokens_per_minute=0):
+        self.name = name
+        self.url = url
+        self.headers = { "Authorization": f"Bearer {api_key}", "Content-Type": "application/json" }
+        self.weight = float(weight)
+        self.rate_limiter = AppRateLimiter(requests_per_minute, tokens_per_minute)
+        self.latency_ewma = None  # seconds until the response headers
+        self.error_ewma = 0.0
+        self.consecutive_errors = 0
+        self.recent_rate_limits = collections.deque()  # time of the recent 429 answers
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.probation = False  # re-admitted after an ejection, the next failure ejects it again
+        self.text_until = 0.0  # structured output rejected: the endpoint gets the payloads without it until then
+        self.counters = {"calls": 0, "errors": 0, "rate_limited": 0, "ejected": 0}
+
+class AppLLMPool:
+    """
+    Endpoints (deployments, API keys) serving the same model, the total throughput scales with their number.
+
+    Each call goes to an endpoint drawn at random, weighted by its configured weight, its error
+    rate and latency (EWMA) and its recent 429 answers. An endpoint failing too often is ejected
+    for a delay doubling at each new ejection, then re-admitted on probation: one success clears it,
+    one failure ejects it again.
+    """
+    def __init__(self, name, endpoints, ewma_alpha=0.2, eject_error_rate=0.5, eject_consecutive_errors=3, eject_seconds=30, max_eject_seconds=600, rate_limit_window=60):
+        self.name = name
+        self.endpoints = endpoints
+        self.ewma_alpha = float(ewma_alpha)
+        self.eject_error_rate = float(eject_error_rate)
+        self.eject_consecutive_errors = int(eject_consecutive_errors)
+        self.eject_seconds = float(eject_seconds)
+        self.max_eject_seconds = float(max_eject_seconds)
+        self.rate_limit_window = float(rate_limit_window)
+        self.lock = threading.Lock()
+
+    # private methods
+    def __score(self, endpoint, now, tokens):
+        # Must be called with self.lock held
+        while endpoint.recent_rate_limits and endpoint.recent_rate_limits[0] < now - self.rate_limit_window:
+            endpoint.recent_rate_limits.popleft()
+        latencies = [other.latency_ewma for other in self.endpoints if other.latency_ewma is not None]
+        latency = endpoint.latency_ewma if endpoint.latency_ewma is not None else (sum(latencies) / len(latencies) if latencies else 1.0)
+        score = endpoint.weight * (1.0 - endpoint.error_ewma) / max(latency, 0.01)
+        score /= 1 + len(endpoint.recent_rate_limits)
+        # An endpoint waiting for its quota (or for the Retry-After of a 429) is only used when all are waiting
+        score /= 1 + 10 * endpoint.rate_limiter.wait_time(tokens)
+        return max(score, 1e-9)
+
+    def __eject(self, endpoint, now):
+        # Must be called with self.lock held
+        endpoint.ejections += 1
+        endpoint.probation = True
+        endpoint.ejected_until = now + min(self.eject_seconds * 2 ** (endpoint.ejections - 1), self.max_eject_seconds)
+        endpoint.counters["ejected"] += 1
+
+    # public methods
+    def select(self, tokens=0):
+        if len(self.endpoints) == 1:
+            return self.endpoints[0]
+        with self.lock:
+            now = time.monotonic()
+            admitted = [endpoint for endpoint in self.endpoints if endpoint.ejected_until <= now]
+            if not admitted:
+                # Everything is ejected: the endpoint re-admitted first is still better than no call at all
+                return min(self.endpoints, key=lambda endpoint: endpoint.ejected_until)
+            scores = [self.__score(endpoint, now, tokens) for endpoint in admitted]
+            return random.choices(admitted, weights=scores)[0]
+
+    def record(self, endpoint, latency=None, error=False, rate_limited=False):
+        with self.lock:
+            now = time.monotonic()
+            endpoint.counters["calls"] += 1
+            if rate_limited:
+                # A 429 is a quota signal, not a failure of the endpoint
+                endpoint.counters["rate_limited"] += 1
+                endpoint.recent_rate_limits.append(now)
+                return
+            if latency is not None:
+                endpoint.latency_ewma = latency if endpoint.latency_ewma is None else (1 - self.ewma_alpha) * endpoint.latency_ewma + self.ewma_alpha * latency
+            endpoint.error_ewma = (1 - self.ewma_alpha) * endpoint.error_ewma + self.ewma_alpha * (1.0 if error else 0.0)
+            if error:
+                endpoint.counters["errors"] += 1
+                endpoint.consecutive_errors += 1
+                unhealthy = endpoint.probation or endpoint.consecutive_errors >= self.eject_consecutive_errors or endpoint.error_ewma >= self.eject_error_rate
+                if len(self.endpoints) > 1 and unhealthy and endpoint.ejected_until <= now:
+                    self.__eject(endpoint, now)
+            else:
+                endpoint.consecutive_errors = 0
+                endpoint.ejections = 0
+                endpoint.probation = False
+
+    def stats(self):
+        with self.lock:
+            now = time.monotonic()
+            return [
+                {
+                    "name": endpoint.name,
+                    "url": endpoint.url,
+                    "weight": endpoint.weight,
+                    **endpoint.counters,
+                    "latency_ewma_in_seconds": round(endpoint.latency_ewma, 3) if endpoint.latency_ewma is not None else None,
+                    "error_rate_ewma": round(endpoint.error_ewma, 3),
+                    "recent_rate_limits": len(endpoint.recent_rate_limits),
+                    "ejected_for_seconds": round(max(endpoint.ejected_until - now, 0.0), 3),
+                    "probation": endpoint.probation,
+                    "rate_limiter": endpoint.rate_limiter.stats(),
+                }
+                for endpoint in self.endpoints
+            ]
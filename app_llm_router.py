@@ -0,0 +1,136 @@
+import json
+import threading
+
+from flask import Config as FlaskConfig
+from app_llm_pool import AppLLMEndpoint, AppLLMPool
+
+TASKS = ("fix", "dependent", "cleanup")
+
+class AppLLMRoute:
+    # One model, the endpoints serving it and the tasks and prompt sizes it serves
+    def __init__(self, name, model_name, pool: AppLLMPool, max_input_tokens, max_output_tokens, tasks=TASKS, max_prompt_tokens=0, response_format="text"):
+        self.name = name
+        self.model_name = model_name
+        self.pool = pool
+        self.max_input_tokens = int(max_input_tokens)
+        self.max_output_tokens = int(max_output_tokens)
+        self.tasks = tuple(tasks)
+        self.max_prompt_tokens = int(max_prompt_tokens)  # 0 for no limit other than the context window
+        self.response_format = response_format  # structured output of the endpoints
+
+    def prompt_limit(self, max_tokens):
+        # Prompts accepted by this route for an answer of max_tokens are strictly under this limit
+        limit = self.max_input_tokens - max_tokens
+        if self.max_prompt_tokens > 0:
+            limit = min(limit, self.max_prompt_tokens)
+        return limit
+
+    def accepts(self, task, prompt_tokens, max_tokens):
+        return task in self.tasks and prompt_tokens < self.prompt_limit(max_tokens) and max_tokens < self.max_output_tokens
+
+class AppLLMRouter:
+    """
+    Selects the model of a call from its task ('fix', 'dependent' or 'cleanup') and its size.
+
+    MODEL_ROUTES lists the additional models, in order of preference, as JSON:
+    [{"name": "small", "model": "...", "url": "...", "api_key": "...", "tasks": ["dependent", "cleanup"],
+      "max_prompt_tokens": 4000, "max_input_tokens": 128000, "max_output_tokens": 16000, "response_format": "json_schema"}]
+    Missing url, api_key, token limits and response_format default to the MODEL_* settings. The default route
+    (MODEL_NAME) serves every task and every size that no listed route accepts.
+
+    A route can be served by several deployments, listed in its "endpoints" (MODEL_ENDPOINTS for
+    the default route) instead of url and api_key, each with its own quota:
+    [{"name": "east", "url": "...", "api_key": "...", "weight": 2, "requests_per_minute": 500, "tokens_per_minute": 300000}]
+    """
+    def __init__(self, config: FlaskConfig):
+        self.config = config
+        default_endpoints = self.__load(config["MODEL_ENDPOINTS"]) or [{"url": config["MODEL_URL"]}]
+        self.default_route = AppLLMRoute(
+            "default",
+            config["MODEL_NAME"],
+            self.__pool("default", default_endpoints),
+            config["MODEL_MAX_INPUT_TOKENS"],
+            config["MODEL_MAX_OUTPUT_TOKENS"],
+            response_format=config["MODEL_RESPONSE_FORMAT"],
+        )
+        self.routes = []
+        for index, route in enumerate(self.__load(config["MODEL_ROUTES"])):
+            name = route.get("name", f"route{index + 1}")
+            endpoints = route.get("endpoints") or [{"url": route.get("url", config["MODEL_URL"]), "api_key": route.get("api_key", config["MODEL_API_KEY"])}]
+            self.routes.append(AppLLMRoute(
+                name,
+                route["model"],
+                self.__pool(name, endpoints),
+                route.get("max_input_tokens", self.default_route.max_input_tokens),
+                route.get("max_output_tokens", self.default_route.max_output_tokens),
+                route.get("tasks", TASKS),
+                route.get("max_prompt_tokens", 0),
+                route.get("response_format", self.default_route.response_format),
+            ))
+        self.routes.append(self.default_route)
+        self.lock = threading.Lock()
+        self.counters = {route.name: {task: 0 for task in TASKS} for route in self.routes}
+
+    # private methods
+    @staticmethod
+    def __load(value):
+        if isinstance(value, str):
+            return json.loads(value) if value.strip() else []
+        return list(value or [])
+
+    def __pool(self, route_name, endpoints):
+        config = self.config
+        return AppLLMPool(
+            route_name,
+            [
+                AppLLMEndpoint(
+                    endpoint.get("name", f"{route_name}-{index + 1}"),
+                    endpoint["url"],
+                    endpoint.get("api_key", config["MODEL_API_KEY"]),
+                    endpoint.get("weight", 1),
+                    endpoint.get("requests_per_minute", 0),
+                    endpoint.get("tokens_per_minute", 0),
+                )
+                for index, endpoint in enumerate(endpoints)
+            ],
+            config["MODEL_POOL_EWMA_ALPHA"],
+            config["MODEL_POOL_EJECT_ERROR_RATE"],
+            config["MODEL_POOL_EJECT_CONSECUTIVE_ERRORS"],
+            config["MODEL_POOL_EJECT_IN_SECONDS"],
+            config["MODEL_POOL_MAX_EJECT_IN_SECONDS"],
+            config["MODEL_POOL_RATE_LIMIT_WINDOW_IN_SECONDS"],
+        )
+
+    # public methods
+    def routes_of(self, task):
+        return [route for route in self.routes if task in route.tasks]
+
+    def prompt_limit(self, task, max_tokens):
+        # Largest prompt accepted by every route of the task: up to it, a prompt is routed the same whatever its exact size
+        return min(route.prompt_limit(max_tokens) for route in self.routes_of(task)) - 1
+
+    def prompt_budget(self, task, max_tokens):
+        # Largest prompt accepted by at least one route of the task, -1 when no route can produce max_tokens
+        return max((route.prompt_limit(max_tokens) for route in self.routes if task in route.tasks and max_tokens < route.max_output_tokens), default=0) - 1
+
+    def accepts(self, task, prompt_tokens, max_tokens):
+        # True when at least one route can serve the call
+        return any(route.accepts(task, prompt_tokens, max_tokens) for route in self.routes)
+
+    def for_model(self, model_name):
+        return next((route for route in self.routes if route.model_name == model_name), self.default_route)
+
+    def route(self, task, prompt_tokens, max_tokens):
+        selected = next((route for route in self.routes if route.accepts(task, prompt_tokens, max_tokens)), self.default_route)
+        with self.lock:
+            self.counters[selected.name][task] = self.counters[selected.name].get(task, 0) + 1
+        return selected
+
+    def stats(self):
+        with self.lock:
+            counters = {name: dict(tasks) for name, tasks in self.counters.items()}
+        return [
+            {"name": route.name, "model": route.model_name, "tasks": list(route.tasks), "max_prompt_tokens": route.max_prompt_tokens,
+             "max_input_tokens": route.max_input_tokens, "max_output_tokens": route.max_output_tokens, "calls": counters[route.name]}
+            for route in self.routes
+        ]
@@ -0,0 +1,88 @@
+class AppLLMSchemaError(ValueError):
+    pass
+
+class AppLLMSchema:
+    """
+    Expected structure of a model answer: a flat JSON object of string fields, some of them restricted to an enumeration.
+
+    The same definition produces the structured-output request (response_format), the JSON template
+    used in prompts when the endpoint has no structured output, and the validation of the answers.
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields  # [(key, enumeration or None, description)]
+        self.template = "{\n" + ",\n".join(f'"{key}":"<{description}>"' for key, _, description in fields) + "\n}"
+
+    def response_format(self, mode):
+        if mode == "json_schema":
+            properties = {}
+            for key, enumeration, description in self.fields:
+                properties[key] = {"type": "string", "description": description}
+                if enumeration:
+                    properties[key]["enum"] = list(enumeration)
+            return {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": self.name,
+                    "strict": True,
+                    "schema": {"type": "object", "properties": properties, "required": [key for key, _, _ in self.fields], "additionalProperties": False},
+                },
+            }
+        elif mode == "json_object":
+            return {"type": "json_object"}
+        return None
+
+    def validate(self, value):
+        # Returns the answer with every field present, as a string, enumerations in upper case
+        if not isinstance(value, dict):
+            raise AppLLMSchemaError(f"Expecting a JSON object, got {type(value).__name__}")
+        result = {}
+        for key, enumeration, _ in self.fields:
+            if key not in value:
+                raise AppLLMSchemaError(f"Missing field '{key}'")
+            field = value[key]
+            if isinstance(field, bool):
+                field = "YES" if field else "NO"
+            elif field is None:
+                field = "NA"
+            elif not isinstance(field, str):
+                field = str(field)
+            if enumeration:
+                field = field.strip().upper()
+                if field not in enumeration:
+                    raise AppLLMSchemaError(f"Invalid value '{value[key]}' for field '{key}', expecting one of {', '.join(enumeration)}")
+            result[key] = field
+        return result
+
+YES_NO = ("YES", "NO")
+YES_NO_UNKNOWN = ("YES", "NO", "UNKNOWN")
+
+FIX_RESPONSE_SCHEMA = AppLLMSchema("code_fix", [
+    ("updated", YES_NO, "YES/NO to state if you updated the code or not (if you believe it did not need fixing)"),
+    ("comment", None, "explain here what you updated (or the reason why you did not update it)"),
+    ("missing_information", None, "list here information needed to finalize the code (or NA if nothing is needed or if the code was not updated)"),
+    ("signature_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the signature of the code will be updated as a consequence of changed parameter list, types, return type, etc."),
+    ("exception_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the exception handling related to the code will be update, as a consequence of changed exception thrown or caught, etc."),
+    ("enclosed_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the code update could impact code enclosed in it in the same source file, such as methods defined in updated class, etc."),
+    ("other_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the code update could impact any other code referencing this code"),
+    ("impact_comment", None, "comment here on signature, exception, enclosed, other impacts on any other code calling this one (or NA if not applicable)"),
+    ("code", None, "the fixed code goes here (or original code if the code was not updated)"),
+])
+
+DEPENDENT_RESPONSE_SCHEMA = AppLLMSchema("dependent_code_update", [
+    ("updated", YES_NO, "YES/NO to state if you updated the dependent code or not (if you believe it did not need updating)"),
+    ("comment", None, "explain here what you updated (or NA if the dependent code does not need to be updated)"),
+    ("missing_information", None, "list here information needed to finalize the dependent code (or NA if nothing is needed or if the dependent code was not updated)"),
+    ("signature_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the signature of the dependent code will be updated as a consequence of changed parameter list, types, return type, etc."),
+    ("exception_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the exception handling related to the dependent code will be update, as a consequence of changed exception thrown or caugth, etc."),
+    ("enclosed_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the dependent code update could impact further code enclosed in it in the same source file, such as methods defined in updated class, etc."),
+    ("other_impact", YES_NO_UNKNOWN, "YES/NO/UNKNOWN, to state here if the dependent code update could impact any other code referencing this code"),
+    ("impact_comment", None, "comment here on signature, exception, enclosed, other impacts on any other code calling this one (or NA if not applicable)"),
+    ("code", None, "the updated dependent code goes here (or original dependent code if the dependent code was not updated)"),
+])
+
+FULLFILE_RESPONSE_SCHEMA = AppLLMSchema("syntax_cleanup", [
+    ("updated", YES_NO, "YES/NO to state if you updated the code or not (if you believe it did not need fixing)"),
+    ("comment", None, "explain here what you updated (or the reason why you did not update it)"),
+    ("code", None, "the fixed code goes here (or original code if the code was not updated)"),
+])
@@ -1,11 +1,21 @@
 from flask import Config as FlaskConfig
 from pymongo import MongoClient
+import threading
 
 class AppMongoDb:
     def __init__(self, config: FlaskConfig):
         self.connection_string = config["MONGODB_CONNECTION_STRING"]
         self.mongodb_database_name = config["MONGODB_DATABASE_NAME"]
-        self.client = MongoClient(self.connection_string)
+        self.client_lock = threading.Lock()
+        self.mongo_client = None  # created on first use, not at import time
+
+    @property
+    def client(self):
+        if self.mongo_client is None:
+            with self.client_lock:
+                if self.mongo_client is None:
+                    self.mongo_client = MongoClient(self.connection_string)
+        return self.mongo_client
 
     def get_collection(self, collection_name):
         # Example of accessing a specific database (replace 'mydatabase' with your DB name)
@@ -0,0 +1,160 @@
+import logging
+import queue
+import threading
+import time
+
+class AppPipelineStage:
+    # One stage of a pipeline: its handler, its worker threads and the bounded queue feeding it
+    def __init__(self, name, handler, workers, queue_size):
+        self.name = name
+        self.handler = handler  # handler(item) returns the items passed to the next stage
+        self.workers = max(int(workers), 1)
+        self.queue = queue.Queue(maxsize=max(int(queue_size), 1))
+
+class AppPipelineStats:
+    # Metrics of the stages of every pipeline run, by stage name
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.pipelines = []  # running pipelines, for the current queue depths
+
+    # private methods
+    def __stage(self, name):
+        # Must be called with self.lock held
+        return self.stages.setdefault(name, {
+            "workers": 0, "processed": 0, "failed": 0, "max_queue_depth": 0,
+            "queue_wait_in_seconds": 0.0, "handler_time_in_seconds": 0.0, "max_handler_time_in_seconds": 0.0,
+        })
+
+    # public methods
+    def started(self, pipeline):
+        with self.lock:
+            self.pipelines.append(pipeline)
+            for stage in pipeline.stages:
+                self.__stage(stage.name)["workers"] = stage.workers
+
+    def finished(self, pipeline):
+        with self.lock:
+            self.pipelines.remove(pipeline)
+
+    def queued(self, name, depth):
+        with self.lock:
+            stage = self.__stage(name)
+            stage["max_queue_depth"] = max(stage["max_queue_depth"], depth)
+
+    def processed(self, name, wait, latency, failed):
+        with self.lock:
+            stage = self.__stage(name)
+            stage["processed"] += 1
+            stage["failed"] += failed
+            stage["queue_wait_in_seconds"] += wait
+            stage["handler_time_in_seconds"] += latency
+            stage["max_handler_time_in_seconds"] = max(stage["max_handler_time_in_seconds"], latency)
+
+    def stats(self):
+        with self.lock:
+            depths = {}
+            for pipeline in self.pipelines:
+                for stage in pipeline.stages:
+                    depths[stage.name] = depths.get(stage.name, 0) + stage.queue.qsize()
+            result = {}
+            for name, stage in self.stages.items():
+                processed = stage["processed"]
+                result[name] = {
+                    **stage,
+                    "queue_wait_in_seconds": round(stage["queue_wait_in_seconds"], 3),
+                    "handler_time_in_seconds": round(stage["handler_time_in_seconds"], 3),
+                    "max_handler_time_in_seconds": round(stage["max_handler_time_in_seconds"], 3),
+                    "avg_queue_wait_in_seconds": round(stage["queue_wait_in_seconds"] / processed, 3) if processed else None,
+                    "avg_handler_time_in_seconds": round(stage["handler_time_in_seconds"] / processed, 3) if processed else None,
+                    "queue_depth": depths.get(name, 0),
+                }
+            return {"running": len(self.pipelines), "stages": result}
+
+class AppPipeline:
+    """
+    Stages connected by bounded queues, each stage with its own worker threads.
+
+    Every item returned by the handler of a stage is queued for the next stage; the items returned
+    by the last stage are the result of run(). A full queue blocks the stage feeding it, so work
+    piles up in front of the slowest stage only, which shows in its queue depth and wait time.
+    An item whose handler raised is kept in failed, as (stage name, item, exception), for the caller to recover.
+    """
+    STOP = object()
+
+    def __init__(self, name, stages, stats: AppPipelineStats = None):
+        self.name = name
+        self.stages = stages
+        self.stats = stats or AppPipelineStats()
+        self.lock = threading.Lock()
+        self.running = [stage.workers for stage in stages]
+        self.results = []
+        self.failed = []
+
+    # private methods
+    def __put(self, index, item):
+        if index == len(self.stages):
+            with self.lock:
+                self.results.append(item)
+            return
+        stage = self.stages[index]
+        stage.queue.put((item, time.perf_counter()))
+        self.stats.queued(stage.name, stage.queue.qsize())
+
+    def __work(self, index):
+        stage = self.stages[index]
+        while True:
+            entry = stage.queue.get()
+            if entry is self.STOP:
+                break
+            item, queued_at = entry
+            start_time = time.perf_counter()
+            failed = False
+            try:
+                outputs = stage.handler(item) or ()
+            except Exception as e:
+                # Handlers report their own failures, an item reaching this point goes back to the caller
+                logging.error(f"Pipeline {self.name}, stage {stage.name}: {e}")
+                with self.lock:
+                    self.failed.append((stage.name, item, e))
+                outputs = ()
+                failed = True
+            self.stats.processed(stage.name, start_time - queued_at, time.perf_counter() - start_time, failed)
+            for output in outputs:
+                self.__put(index + 1, output)
+
+        # The last worker of a stage stops the next stage, once everything it produced is queued
+        with self.lock:
+            self.running[index] -= 1
+            last = self.running[index] == 0
+        if last:
+            self.__stop(index + 1)
+
+    def __stop(self, index):
+        if index < len(self.stages):
+            for _ in range(self.stages[index].workers):
+                self.stages[index].queue.put(self.STOP)
+
+    # public methods
+    def run(self, items, resumed=()):
+        # resumed: (stage name, item) of items entering the pipeline at a later stage (parked items of a previous run)
+        self.stats.started(self)
+        threads = [
+            threading.Thread(target=self.__work, args=(index,), name=f"{self.name}-{stage.name}-{worker + 1}", daemon=True)
+            for index, stage in enumerate(self.stages)
+            for worker in range(stage.workers)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            stage_index = {stage.name: index for index, stage in enumerate(self.stages)}
+            for name, item in resumed:
+                self.__put(stage_index[name], item)
+            for item in items:
+                self.__put(0, item)
+            self.__stop(0)
+            for thread in threads:
+                thread.join()
+        finally:
+            self.stats.finished(self)
+        return self.results
@@ -0,0 +1,186 @@
+import logging
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from app_file_snapshot import AppFileSnapshots
+from app_imaging import AppImaging
+
+class AppImagingPrefetcher:
+    """
+    Request-wide Imaging prefetch stage.
+
+    Resolves the metadata, callers, callees and files of every object of a request before any
+    LLM call, in one deduplicated batch: an object, caller or file shared by several objects is
+    fetched once per request. Contexts are built in the background, so the fix stage can start
+    on the first object while the following ones are still being fetched.
+    """
+    def __init__(self, imaging: AppImaging, tenant, application, request_id, max_objects):
+        self.imaging = imaging
+        self.tenant = tenant
+        self.application = application
+        self.request_id = request_id
+        self.files = AppFileSnapshots(imaging, tenant, application, request_id)
+        self.calls = {}  # (kind, object id) -> Future of (status code, data, url)
+        self.contexts = {}  # object id -> Future of the object context
+        self.lock = threading.Lock()
+        # Context assembly waits on Imaging fetches, so it must not run on the Imaging pool itself
+        self.executor = ThreadPoolExecutor(max_workers=int(max_objects), thread_name_prefix="prefetch")
+
+    # private methods
+    def __call_once(self, kind, object_id, fetch):
+        # Single-flight Imaging call: the first caller runs the fetch, concurrent callers wait for its result.
+        # The fetch runs in the owner's thread, so nobody ever waits on a task still queued on the Imaging pool.
+        key = (kind, str(object_id))
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = Future()
+        if owner:
+            try:
+                future.set_result(fetch(self.tenant, self.application, object_id))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    def __submit_once(self, kind, object_id, fetch):
+        return self.imaging.submit(self.__call_once, kind, object_id, fetch)
+
+    def __fetch_impact_object(self, impact_object):
+        # Fetch set of one impacted caller: source locations, full body and bookmark.
+        # Returns ("success", impact row), or ("failure" / "external", message) when the caller cannot be used.
+        impact_object_id = impact_object.get("id")  # Get impact object ID
+        impact_object_status, impact_object_data, impact_object_url = self.__call_once("source-locations", impact_object_id, self.imaging.get_source_locations)
+
+        impact_object_source_path = ""
+        impact_object_field_id = 0
+        impact_object_start_line = 0
+        impact_object_end_line = 0
+        impact_object_full_code = ""
+
+        # Check if impact object data was fetched successfully
+        if impact_object_status == 200:
+            impact_object_type = impact_object_data.get("typeId", "")  # Get impact object type
+            impact_object_signature = impact_object_data.get("mangling", "")  # Get impact object signature
+            impact_object_source_locations = impact_object_data.get("sourceLocations")
+            if not impact_object_source_locations:
+                return "failure", f"failed because of reason: sourceLocations not available for impact object from Imaging API -> {impact_object_url}"
+            impact_object_source_location = impact_object_source_locations[0]  # Extract source location
+            impact_object_source_path = impact_object_source_location["filePath"]  # Get source file path
+            impact_object_field_id = int(impact_object_source_location["fileId"])  # Get file ID
+            impact_object_start_line = int(impact_object_source_location["startLine"])  # Get start line number
+            impact_object_end_line = int(impact_object_source_location["endLine"])  # Get end line number
+
+            if impact_object_data["external"] == "true":
+                return "external", f"failed because of reason: It is an external object and it does not contains sourceLocations."
+
+            impact_object_full_code = self.files.get_source('impact object', impact_object_field_id, impact_object_start_line, impact_object_end_line)
+            if impact_object_full_code is None:
+                logging.error(f"Failed to fetch impact object code using {impact_object_url}. Status code: 404 or not found.")
+                impact_object_full_code = ""  # Or handle as needed
+
+        else:
+            impact_object_type = ""
+            impact_object_signature = ""
+            logging.error(f"Failed to fetch impact object data using {impact_object_url}. Status code: {impact_object_status}")
+
+        impact_object_link_type = impact_object.get("linkType", "")  # Get link type for impact object
+
+        # Handle bookmarks associated with the impact object
+        bookmarks = impact_object.get("bookmarks")
+        if not bookmarks:
+            impact_object_bookmark_code = ""
+        else:
+            bookmark = bookmarks[0]
+            impact_object_bookmark_field_id = bookmark.get("fileId", "")  # Get file ID from bookmark
+            # Calculate start and end lines for impact object code
+            impact_object_bookmark_start_line = max(int(bookmark.get("startLine", 1)) - 1, 0)
+            impact_object_bookmark_end_line = max(int(bookmark.get("endLine", 1)) - 1, 0)
+            impact_object_bookmark_code = self.files.get_source('impact object bookmark', impact_object_bookmark_field_id, impact_object_bookmark_start_line, impact_object_bookmark_end_line)
+
+        return "success", {
+            "object_id": impact_object_id,
+            "object_type": impact_object_type,
+            "object_signature": impact_object_signature,
+            "object_link_type": impact_object_link_type,
+            "object_bookmark_code": impact_object_bookmark_code,
+            "object_source_path": impact_object_source_path,
+            "object_file_id": int(impact_object_field_id),
+            "object_start_line": int(impact_object_start_line),
+            "object_end_line": int(impact_object_end_line),
+            "object_full_code": impact_object_full_code,
+        }
+
+    def __build_context(self, object_id):
+        # Object, callees and callers lookups are independent: run them concurrently
+        object_future = self.__submit_once("source-locations", object_id, self.imaging.get_source_locations)
+        object_callees_future = self.__submit_once("callees", object_id, self.imaging.get_callees)
+        object_callers_future = self.__submit_once("callers", object_id, self.imaging.get_callers)
+
+        object_status, object_data, object_url = object_future.result()
+        context = {"object_id": object_id, "object_url": object_url, "object_data": None, "failure": None, "callees": [], "impacts": []}
+
+        # Check if object details were fetched successfully
+        if object_status != 200:
+            logging.error(f"Failed to fetch object data using {object_url}. Status code: {object_status}")
+            return context
+
+        context["object_data"] = object_data
+
+        if not object_data.get("sourceLocations"):
+            context["failure"] = f"failed because of reason: sourceLocations not available for this object from Imaging API -> {object_url}"
+            return context
+
+        if object_data["external"] == "true":
+            context["failure"] = f"failed because of reason: It is an external object and it does not contains sourceLocations."
+            return context
+
+        source_location = object_data["sourceLocations"][0]  # Extract source location
+        context["object_source_path"] = source_location["filePath"]  # Get source file path
+        context["object_field_id"] = source_location["fileId"]  # Get file ID
+        context["object_start_line"] = source_location["startLine"]  # Get start line number
+        context["object_end_line"] = source_location["endLine"]  # Get end line number
+
+        # Start the fetch set of every impacted caller before fetching the object code
+        object_callers_status, object_callers, object_callers_url = object_callers_future.result()
+        if object_callers_status == 200:
+            impact_futures = [
+                self.imaging.submit(self.__fetch_impact_object, impact_object)
+                for impact_object in object_callers
+            ]
+        else:
+            impact_futures = []
+            logging.error(f"Failed to fetch callers using {object_callers_url}. Status code: {object_callers_status}")
+
+        # fetch object code
+        obj_code = self.files.get_source('object', context["object_field_id"], context["object_start_line"], context["object_end_line"])
+        if obj_code is None:
+            context["failure"] = f"Failed to fetch object code using Imaging API for fileId={context['object_field_id']}, startLine={context['object_start_line']}, endLine={context['object_end_line']}."
+            return context
+        context["obj_code"] = obj_code
+
+        # Fetch callees for the current object
+        object_callees_status, object_callees, object_callees_url = object_callees_future.result()
+        if object_callees_status == 200:
+            context["callees"] = object_callees
+        else:
+            logging.error(f"Failed to fetch callees using {object_callees_url}. Status code: {object_callees_status}")
+
+        # Impacted callers in their original order, so the prompt stays deterministic
+        context["impacts"] = [impact_future.result() for impact_future in impact_futures]
+        return context
+
+    # public methods
+    def prefetch(self, object_ids):
+        # Schedules the context of every object (once per distinct object id)
+        for object_id in object_ids:
+            with self.lock:
+                if object_id not in self.contexts:
+                    self.contexts[object_id] = self.executor.submit(self.__build_context, object_id)
+
+    def get_context(self, object_id):
+        self.prefetch([object_id])
+        return self.contexts[object_id].result()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
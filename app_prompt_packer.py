@@ -0,0 +1,94 @@
+import textwrap
+import threading
+
+from app_token_counter import AppTokenCounter
+
+class AppPromptItem:
+    # Optional prompt context: its alternative texts, from the most to the least detailed, and its value
+    def __init__(self, label, rank, levels):
+        self.label = label
+        self.rank = rank  # items of lowest rank are trimmed first
+        self.levels = levels
+
+class AppPromptPacker:
+    """
+    Fits a prompt into a token budget by trimming its optional context instead of rejecting it.
+
+    The lowest-value items are reduced first: every item is lowered to its next, shorter, level
+    (e.g. a caller without its code) before any item is dropped. Among items of the same rank,
+    the last ones are trimmed first. The mandatory part of the prompt is never modified.
+    """
+    def __init__(self, token_counter: AppTokenCounter):
+        self.token_counter = token_counter
+        self.lock = threading.Lock()
+        self.counters = {"packed": 0, "trimmed": 0, "unfit": 0, "reduced_items": 0, "dropped_items": 0, "saved_tokens": 0}
+
+    @staticmethod
+    def normalize(text):
+        # Common indentation, trailing spaces and runs of blank lines cost tokens without adding context
+        lines = [line.rstrip() for line in textwrap.dedent(str(text).expandtabs(4)).split("\n")]
+        result = []
+        for line in lines:
+            if line or (result and result[-1]):
+                result.append(line)
+        return "\n".join(result).strip("\n")
+
+    def pack(self, items, render, budget, segments=(), templates=()):
+        """
+        Returns (prompt, token count, report), the report being None when nothing was trimmed.
+
+        render(kept) builds the prompt from the kept items, a list of (item, text) in their original
+        order. segments and templates are passed to the token counter with the kept texts.
+        """
+        levels = [0] * len(items)
+
+        def build():
+            kept = [(item, item.levels[level]) for item, level in zip(items, levels) if level < len(item.levels)]
+            prompt = render(kept)
+            return prompt, self.token_counter.count_composed(prompt, tuple(segments) + tuple(text for _, text in kept), templates)
+
+        prompt, tokens = build()
+        tokens_before = tokens
+        report = None
+        if tokens > budget:
+            order = sorted(range(len(items)), key=lambda index: (items[index].rank, -index))
+            # Every item is reduced, level after level, before the first one is dropped
+            depths = max(len(item.levels) for item in items) - 1 if items else 0
+            steps = [(index, depth) for depth in range(1, depths + 1) for index in order if depth < len(items[index].levels)]
+            steps += [(index, len(items[index].levels)) for index in order]
+            estimate = tokens
+            for index, level in steps:
+                if tokens <= budget:
+                    break
+                item = items[index]
+                estimate -= self.token_counter.count(item.levels[levels[index]])
+                levels[index] = level
+                if level < len(item.levels):
+                    estimate += self.token_counter.count(item.levels[level])
+                # The estimate ignores the glue of the rendering, only an estimated fit is counted exactly
+                if estimate <= budget:
+                    prompt, tokens = build()
+                    estimate = tokens
+            if tokens > budget:
+                prompt, tokens = build()
+            report = {
+                "tokens_before": tokens_before,
+                "tokens_after": tokens,
+                "budget": budget,
+                "reduced": [item.label for item, level in zip(items, levels) if 0 < level < len(item.levels)],
+                "dropped": [item.label for item, level in zip(items, levels) if level >= len(item.levels)],
+            }
+
+        with self.lock:
+            self.counters["packed"] += 1
+            if report:
+                self.counters["trimmed"] += 1
+                self.counters["unfit"] += tokens > budget
+                self.counters["reduced_items"] += len(report["reduced"])
+                self.counters["dropped_items"] += len(report["dropped"])
+                self.counters["saved_tokens"] += tokens_before - tokens
+        return prompt, tokens, report
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
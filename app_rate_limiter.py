@@ -0,0 +1,123 @@
+import email.utils
+import threading
+import time
+
+class AppRateLimiter:
+    """
+    Process-wide token-bucket limiter for the model provider quota.
+
+    Every worker draws from the same requests-per-minute and tokens-per-minute buckets.
+    A caller only sleeps when a bucket is empty or after the provider answered 429 (Too Many Requests).
+    A limit <= 0 disables the corresponding bucket.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.request_bucket = self.requests_per_minute
+        self.token_bucket = self.tokens_per_minute
+        self.blocked_until = 0.0
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "throttled": 0, "wait_in_seconds": 0.0, "rate_limited": 0}
+
+    @staticmethod
+    def parse_retry_after(value):
+        # "Retry-After" contains either a delay in seconds or an HTTP date, returns a delay in seconds or None
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_date.timestamp() - time.time(), 0.0)
+
+    # private methods
+    def __refill(self, now):
+        # Must be called with self.lock held
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        if self.requests_per_minute > 0:
+            self.request_bucket = min(self.requests_per_minute, self.request_bucket + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute > 0:
+            self.token_bucket = min(self.tokens_per_minute, self.token_bucket + elapsed * self.tokens_per_minute / 60)
+
+    def __wait_time(self, now, tokens):
+        # Must be called with self.lock held
+        wait = self.blocked_until - now
+        if self.requests_per_minute > 0 and self.request_bucket < 1:
+            wait = max(wait, (1 - self.request_bucket) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute > 0 and self.token_bucket < tokens:
+            wait = max(wait, (tokens - self.token_bucket) * 60 / self.tokens_per_minute)
+        return wait
+
+    # public methods
+    def acquire(self, tokens=0):
+        # Blocks until one request and the given number of tokens are available, returns the time waited
+        if self.tokens_per_minute > 0:
+            tokens = min(tokens, self.tokens_per_minute)  # a single call larger than the quota must still go through
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.__refill(now)
+                wait = self.__wait_time(now, tokens)
+                if wait <= 0:
+                    if self.requests_per_minute > 0:
+                        self.request_bucket -= 1
+                    if self.tokens_per_minute > 0:
+                        self.token_bucket -= tokens
+                    self.counters["requests"] += 1
+                    if waited:
+                        self.counters["throttled"] += 1
+                        self.counters["wait_in_seconds"] += waited
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def wait_unblocked(self):
+        # Blocks until the delay of the last 429 is over, without drawing from the buckets; returns the time waited
+        waited = 0.0
+        while True:
+            with self.lock:
+                wait = self.blocked_until - time.monotonic()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def wait_time(self, tokens=0):
+        # Time an acquire of the given number of tokens would wait now, without drawing from the buckets
+        if self.tokens_per_minute > 0:
+            tokens = min(tokens, self.tokens_per_minute)
+        with self.lock:
+            now = time.monotonic()
+            self.__refill(now)
+            return max(self.__wait_time(now, tokens), 0.0)
+
+    def settle(self, estimated_tokens, actual_tokens):
+        # Corrects the token bucket once the provider reported the real usage of a call
+        if self.tokens_per_minute > 0:
+            # acquire drew at most a full bucket for an oversized estimate
+            estimated_tokens = min(estimated_tokens, self.tokens_per_minute)
+            with self.lock:
+                self.token_bucket = min(self.tokens_per_minute, self.token_bucket + estimated_tokens - actual_tokens)
+
+    def on_rate_limited(self, delay):
+        # The provider refused a call (HTTP 429): nobody sends anything before the delay is over
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.request_bucket = min(self.request_bucket, 0)
+            self.counters["rate_limited"] += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                **self.counters,
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_per_minute": self.tokens_per_minute,
+                "blocked_for_seconds": round(max(self.blocked_until - time.monotonic(), 0.0), 3),
+            }
@@ -0,0 +1,127 @@
+import ast
+import builtins
+import json
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+from flask import Config as FlaskConfig
+
+class AppValidator:
+    # Checks the syntax of one technology, problems() returns an empty list for a valid file
+    name = ""
+
+    def problems(self, code):
+        return []
+
+    def unresolved_imports(self, code):
+        return []
+
+class AppPythonValidator(AppValidator):
+    name = "python"
+
+    def problems(self, code):
+        try:
+            ast.parse(code)
+        except (SyntaxError, ValueError) as e:
+            return [f"line {getattr(e, 'lineno', '?')}: {getattr(e, 'msg', e)}"]
+        return []
+
+    def unresolved_imports(self, code):
+        # Names read but bound nowhere in the module (scopes are not told apart, which only hides problems)
+        tree = ast.parse(code)
+        bound = set(dir(builtins)) | {"__file__", "__name__", "__doc__", "__spec__", "__builtins__"}
+        loaded = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names):
+                return []
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                bound.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                bound.add(node.name)
+            elif isinstance(node, ast.arg):
+                bound.add(node.arg)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                bound.add(node.name)
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                bound.update(node.names)
+            elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+                bound.add(node.name)
+            elif isinstance(node, ast.MatchMapping) and node.rest:
+                bound.add(node.rest)
+            elif isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load):
+                    loaded.setdefault(node.id, node.lineno)
+                else:
+                    bound.add(node.id)
+        return [f"{name} (line {line})" for name, line in loaded.items() if name not in bound]
+
+class AppJsonValidator(AppValidator):
+    name = "json"
+
+    def problems(self, code):
+        try:
+            json.loads(code)
+        except ValueError as e:
+            return [str(e)]
+        return []
+
+class AppXmlValidator(AppValidator):
+    name = "xml"
+
+    def problems(self, code):
+        try:
+            ET.fromstring(code)
+        except ET.ParseError as e:
+            return [str(e)]
+        return []
+
+class AppSyntaxValidator:
+    """
+    Local syntax check of a modified file before its AI syntax cleanup: a file that parses and has
+    no unresolved import is not sent to the model.
+
+    The validator is chosen from the technology reported by Imaging (programmingLanguage), then
+    from the file extension. Only technologies with a real parser are checked (Python, JSON, XML):
+    files of other technologies (Java, C#, C/C++, JavaScript...) are always sent to the model.
+    """
+    def __init__(self, config: FlaskConfig):
+        self.enabled = str(config["CLEANUP_VALIDATION_ENABLED"]).lower() in ("1", "true", "yes")
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.technologies = {"python": AppPythonValidator(), "json": AppJsonValidator(), "xml": AppXmlValidator()}
+        self.extensions = {".py": self.technologies["python"], ".json": self.technologies["json"], ".xml": self.technologies["xml"]}
+
+    # private methods
+    def __count(self, technology, counter):
+        with self.lock:
+            counters = self.counters.setdefault(technology, {"passed": 0, "failed": 0, "unresolved_imports": 0, "unsupported": 0})
+            counters[counter] += 1
+
+    # public methods
+    def validator(self, technology, file_name):
+        validator = self.technologies.get((technology or "").strip().lower())
+        if validator is None:
+            validator = self.extensions.get(os.path.splitext(file_name or "")[1].lower())
+        return validator
+
+    def check(self, code, technology, file_name):
+        """
+        Returns None when the file cannot be checked locally, else the list of its problems
+        (syntax errors and unresolved imports), empty when the file does not need the cleanup.
+        """
+        validator = self.validator(technology, file_name)
+        if validator is None:
+            self.__count((technology or os.path.splitext(file_name or "")[1] or "unknown").lower(), "unsupported")
+            return None
+        problems = validator.problems(code)
+        if problems:
+            self.__count(validator.name, "failed")
+            return problems
+        problems = validator.unresolved_imports(code)
+        self.__count(validator.name, "unresolved_imports" if problems else "passed")
+        return [f"unresolved import {problem}" for problem in problems]
+
+    def stats(self):
+        with self.lock:
+            return {"enabled": self.enabled, "technologies": {technology: dict(counters) for technology, counters in self.counters.items()}}
@@ -0,0 +1,83 @@
+import hashlib
+import threading
+
+from app_cache import AppCache
+
+class AppTokenCounter:
+    """
+    Memoized token accounting on top of a tiktoken encoding.
+
+    Static prompt templates are tokenized once and pinned, dynamic segments (object code, files,
+    prompts) are memoized by content digest, so a prompt assembled around a large code segment
+    only encodes the small text surrounding it.
+    """
+    def __init__(self, encoding, max_size):
+        self.encoding = encoding
+        self.memo = AppCache(max_size)  # digest -> token count
+        self.templates = {}  # template text -> token count, never evicted
+        self.lock = threading.Lock()
+        self.counters = {"encoded": 0, "encoded_chars": 0, "bound_shortcuts": 0}
+
+    @staticmethod
+    def upper_bound(text):
+        # Every token covers at least one UTF-8 byte
+        return len(text.encode("utf-8", "surrogatepass"))
+
+    # private methods
+    def __encode_count(self, text):
+        with self.lock:
+            self.counters["encoded"] += 1
+            self.counters["encoded_chars"] += len(text)
+        return len(self.encoding.encode(text))
+
+    # public methods
+    def pin(self, template):
+        # Pre-tokenizes a static template segment
+        count = self.templates.get(template)
+        if count is None:
+            count = self.templates[template] = self.__encode_count(template)
+        return count
+
+    def count(self, text):
+        count = self.templates.get(text)
+        if count is not None:
+            return count
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        count = self.memo.get(key)
+        if count is None:
+            count = self.__encode_count(text)
+            self.memo.set(key, count)
+        return count
+
+    def count_composed(self, text, segments=(), templates=()):
+        """
+        Counts the tokens of a text embedding the given segments and templates.
+
+        Each segment or template found in the text is counted on its own (memoized or pinned), only
+        the remaining text is encoded. Merges across segment boundaries are ignored, which can
+        only over-estimate the exact count by a few tokens.
+        """
+        rest = text
+        total = 0
+        for template in templates:
+            if template and template in rest:
+                rest = rest.replace(template, "", 1)
+                total += self.pin(template)
+        for segment in segments:
+            if segment and segment in rest:
+                rest = rest.replace(segment, "", 1)
+                total += self.count(segment)
+        return total + self.count(rest)
+
+    def fits(self, text, max_tokens):
+        # Exact encoding is skipped when the text is clearly under budget
+        if self.upper_bound(text) <= max_tokens:
+            with self.lock:
+                self.counters["bound_shortcuts"] += 1
+            return True
+        return self.count(text) <= max_tokens
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {**counters, "templates": len(self.templates), "memo": self.memo.stats()}
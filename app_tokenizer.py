@@ -0,0 +1,107 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import tiktoken
+
+from flask import Config as FlaskConfig
+
+BPE_URL = "https://openaipublic.blob.core.windows.net/encodings/{name}.tiktoken"
+
+class AppApproximateEncoding:
+    # Stand-in when no BPE ranks can be loaded (air-gapped node without the bundled files): about 4 characters per token
+    name = "approximate"
+
+    def encode(self, text, **kwargs):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+class AppTokenizer:
+    """
+    tiktoken encoding of the model, loaded on first use instead of at startup.
+
+    The BPE ranks are read from TIKTOKEN_CACHE_DIR (relative to this module), where tiktoken expects
+    them named after the sha1 of their download URL; a provisioned '<encoding>.tiktoken' file in the
+    same directory is accepted too (see README). The network is only used when neither is present.
+    """
+    def __init__(self, model_name, config: FlaskConfig):
+        self.model_name = model_name
+        self.cache_dir = config["TIKTOKEN_CACHE_DIR"]
+        if self.cache_dir:
+            # Independent of the working directory of the process
+            self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.cache_dir)
+        self.encoding_name = None
+        self.lock = threading.Lock()
+        self.loaded = None
+        self.load_time = None
+        self.source = None
+
+    # private methods
+    def __prepare_cache(self, encoding_name):
+        # Returns 'cache' when the BPE file is available locally
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", self.cache_dir)
+        cache_dir = os.environ["TIKTOKEN_CACHE_DIR"]
+        cache_path = os.path.join(cache_dir, hashlib.sha1(BPE_URL.format(name=encoding_name).encode()).hexdigest())
+        bundled_path = os.path.join(cache_dir, f"{encoding_name}.tiktoken")
+        if not os.path.exists(cache_path) and os.path.exists(bundled_path):
+            try:
+                shutil.copyfile(bundled_path, cache_path)
+            except OSError as e:
+                logging.warning(f"Cannot copy {bundled_path} into the tiktoken cache: {e}")
+        return "cache" if os.path.exists(cache_path) else "download"
+
+    def __load(self):
+        start_time = time.perf_counter()
+        try:
+            # Try to retrieve the appropriate token encoding based on the AI model name.
+            # Different models may use different tokenization methods.
+            self.encoding_name = tiktoken.encoding_name_for_model(self.model_name)
+            print(f"Using encoding for {self.model_name}")
+        except KeyError:
+            # If the model name is not recognized (causing a KeyError), fall back to a default encoding.
+            # 'cl100k_base' is a common fallback for models that do not have a specific encoding.
+            self.encoding_name = "cl100k_base"
+            print(f"Using fallback encoding 'cl100k_base'")
+        try:
+            self.source = self.__prepare_cache(self.encoding_name) if self.cache_dir else "download"
+            encoding = tiktoken.get_encoding(self.encoding_name)
+        except Exception as e:
+            logging.error(f"Token encoding '{self.encoding_name}' not available ({e}), token counts are approximated")
+            self.source = "approximate"
+            encoding = AppApproximateEncoding()
+        self.load_time = time.perf_counter() - start_time
+        return encoding
+
+    # public methods
+    @property
+    def encoding(self):
+        encoding = self.loaded
+        if encoding is None:
+            with self.lock:
+                if self.loaded is None:
+                    self.loaded = self.__load()
+                encoding = self.loaded
+        return encoding
+
+    def encode(self, text, **kwargs):
+        return self.encoding.encode(text, **kwargs)
+
+    def decode(self, tokens):
+        return self.encoding.decode(tokens)
+
+    def preload(self):
+        # Loads the encoding in the background, so that neither the startup nor the first request waits for it
+        threading.Thread(target=lambda: self.encoding, daemon=True).start()
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "encoding": self.encoding_name,
+            "loaded": self.loaded is not None,
+            "source": self.source,
+            "load_time_in_seconds": round(self.load_time, 3) if self.load_time is not None else None,
+        }
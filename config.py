@@ -7,15 +7,79 @@ class Config:
     MODEL_MAX_INPUT_TOKENS = '${{API_PYTHON_MODEL_MAX_INPUT_TOKENS}}'
     MODEL_MAX_OUTPUT_TOKENS = '${{API_PYTHON_MODEL_MAX_OUTPUT_TOKENS}}'
     MODEL_INVOCATION_DELAY_IN_SECONDS = '${{API_PYTHON_MODEL_INVOCATION_DELAY_IN_SECONDS}}'
+    MODEL_REQUESTS_PER_MINUTE = 0  # provider quota shared by all workers, 0 for no limit
+    MODEL_TOKENS_PER_MINUTE = 0  # provider quota shared by all workers, 0 for no limit
+    MODEL_ROUTES = ''  # JSON list of additional model endpoints by task ('fix', 'dependent', 'cleanup') and prompt size, see app_llm_router.py
+    MODEL_ENDPOINTS = ''  # JSON list of deployments serving MODEL_NAME (url, api_key, weight, quotas), MODEL_URL when empty
+    MODEL_POOL_EWMA_ALPHA = 0.2  # weight of the last call in the latency and error rate averages of an endpoint
+    MODEL_POOL_EJECT_ERROR_RATE = 0.5  # an endpoint whose error rate reaches this value is ejected
+    MODEL_POOL_EJECT_CONSECUTIVE_ERRORS = 3
+    MODEL_POOL_EJECT_IN_SECONDS = 30  # first ejection, doubled at each new ejection
+    MODEL_POOL_MAX_EJECT_IN_SECONDS = 600
+    MODEL_POOL_RATE_LIMIT_WINDOW_IN_SECONDS = 60  # recent 429 answers lower the share of an endpoint
+    MODEL_MAX_RATE_LIMIT_RETRIES = 5  # retries of a call refused with HTTP 429
+    MODEL_RESPONSE_FORMAT = 'text'  # structured output: 'json_schema', 'json_object' (JSON mode) or 'text'; a route can set its own "response_format"
+    MODEL_RESPONSE_FORMAT_RETRY_IN_SECONDS = 3600  # an endpoint that rejected the structured output gets plain prompts for this delay
+    MODEL_STREAMING = False  # stream completions (server-sent events) and abort invalid answers early
+    MODEL_STREAM_MAX_CODE_CHARS_PER_TOKEN = 8  # a streamed 'code' field longer than max_tokens * this value is aborted
+    LLM_CACHE_ENABLED = True  # cache of the model completions (memory + MongoDB)
+    LLM_CACHE_SIZE = 1000  # completions kept in memory
+    LLM_CACHE_TTL_IN_SECONDS = 604800  # 0 for no expiry
+    TOKEN_COUNT_CACHE_SIZE = 10000  # memoized token counts of prompt segments
+    TIKTOKEN_CACHE_DIR = 'cache/tiktoken'  # BPE files of the token encodings (sha1 of their URL, or '<encoding>.tiktoken'), relative to the application directory, see README for offline nodes
 
     # Imaging configs...
     IMAGING_URL = '${{API_PYTHON_IMAGING_URL}}'
     IMAGING_API_KEY = ''
+    IMAGING_SNAPSHOT_TTL_IN_SECONDS = 60  # how long the analysis snapshot of an application is trusted
+    IMAGING_METADATA_CACHE_SIZE = 50000  # decoded source locations, callers and callees kept in memory
+    IMAGING_METADATA_CACHE_TTL_IN_SECONDS = 3600
+    IMAGING_MAX_CONCURRENCY = 8  # concurrent Imaging fetches (object, callees, callers fan-out)
+    PREFETCH_MAX_OBJECTS = 4  # objects of a request whose Imaging context is assembled concurrently
+
+    # Request pipeline configs: worker threads of each stage, and items waiting between two stages...
+    PIPELINE_QUEUE_SIZE = 16  # a full queue blocks the stage feeding it
+    PIPELINE_FETCH_CONTEXT_WORKERS = 4
+    PIPELINE_BUILD_PROMPT_WORKERS = 2
+    PIPELINE_FIX_WORKERS = 4  # concurrent fix calls of one request
+    PIPELINE_DEPENDENT_CHECK_WORKERS = 4
+    PIPELINE_ASSEMBLE_FILE_WORKERS = 1
+    PIPELINE_CLEANUP_WORKERS = 4  # concurrent syntax cleanups of one request
+    PIPELINE_PERSIST_WORKERS = 1
+
+    # Syntax cleanup of the modified files configs...
+    CLEANUP_MODE = 'regions'  # 'regions': changed regions and header only, 'file': whole file
+    CLEANUP_CONTEXT_LINES = 20  # lines kept around each changed region
+    CLEANUP_HEADER_MAX_LINES = 200  # the header (package, imports) is searched in the first lines of the file
+    CLEANUP_MAX_COVERAGE = 0.6  # the whole file is sent when the regions cover more than this part of it
+    CLEANUP_VALIDATION_ENABLED = True  # Python, JSON and XML files parsing locally without unresolved imports are not sent to the cleanup
+
+    # Source file cache configs...
+    FILE_CACHE_DIR = 'cache/files'  # relative to the application directory, leave empty to disable the on-disk cache
+    FILE_CACHE_MAX_SIZE_IN_MB = 1024
+    FILE_CACHE_REVALIDATE = False  # always send a conditional request before serving a cached file
 
     # MongoDB configs...
     MONGODB_CONNECTION_STRING =  '${{API_PYTHON_MONGO_CONNECTION_STRING}}'
     MONGODB_DATABASE_NAME = '${{API_PYTHON_MONGO_DATABASE_NAME}}'
 
+    # HTTP transport configs (shared by Imaging and model calls)...
+    HTTP_POOL_CONNECTIONS = 10  # number of per-host connection pools to keep
+    HTTP_POOL_MAXSIZE = 32  # keep-alive connections per host, should be >= MAX_THREADS
+    HTTP_MAX_RETRIES = 3
+    HTTP_BACKOFF_FACTOR = 0.5
+    HTTP_TIMEOUT_IN_SECONDS = 300
+
+    # Batch mode for large, latency-insensitive requests ('openai', 'local' file-based stand-in, or '' to disable)
+    BATCH_VENDOR = ''
+    BATCH_URL = 'https://api.openai.com/v1'
+    BATCH_COMPLETION_WINDOW = '24h'
+    BATCH_DIR = 'cache/batches'  # JSONL input files (and jobs of the 'local' vendor), relative to the application directory
+    BATCH_MIN_OBJECTS = 0  # requests with at least this number of objects use batch mode, 0 for explicit "batchmode" requests only
+    BATCH_POLL_INTERVAL_IN_SECONDS = 30
+    BATCH_TIMEOUT_IN_SECONDS = 86400
+    BATCH_MAX_ROUNDS = 10  # batch jobs per request (fix, dependent checks, file cleanups, JSON repairs)
+
     MAX_THREADS = '${{API_PYTHON_MODEL_MAX_THREADS}}'
     PORT = '${{API_PYTHON_MODEL_PORT}}'
 
@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+
+import pytest
+
+# The application modules live at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+class FakeResponse:
+    # Answer of FakeTransport, with the parts of requests.Response used by the application
+    def __init__(self, status_code=200, body=None, headers=None, lines=None):
+        self.status_code = status_code
+        self.text = body if isinstance(body, str) else json.dumps(body or {})
+        self.headers = headers or {}
+        self.lines = lines or []
+        self.closed = False
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_lines(self, decode_unicode=False):
+        return iter(self.lines)
+
+class FakeTransport:
+    # Answers the posts with the given responses in order, and records the payloads
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.payloads = []
+
+    def post(self, url, headers=None, json=None, stream=False):
+        self.payloads.append(json)
+        return self.responses.pop(0)
+
+class FakeClock:
+    # Stands for the time module of the module under test
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+class FakeLogger:
+    def __init__(self):
+        self.errors = []
+
+    def log_error(self, function_name, exception, requestid=None):
+        self.errors.append((function_name, str(exception), requestid))
+
+class FakeCollection:
+    # In-memory Mongo collection, matching the filters on equal top-level fields
+    def __init__(self):
+        self.documents = []
+        self.indexes = []
+
+    @staticmethod
+    def matches(document, filter):
+        return all(document.get(key) == value for key, value in filter.items())
+
+    def find_one(self, filter):
+        return next((dict(document) for document in self.documents if self.matches(document, filter)), None)
+
+    def find(self, filter=None):
+        return [dict(document) for document in self.documents if self.matches(document, filter or {})]
+
+    def insert_one(self, document):
+        self.documents.append(dict(document))
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.insert_one(document)
+
+    def update_one(self, filter, update, upsert=False):
+        for document in self.documents:
+            if self.matches(document, filter):
+                document.update(update["$set"])
+                return
+        if upsert:
+            self.insert_one({**filter, **update["$set"]})
+
+    def replace_one(self, filter, document, upsert=False):
+        for index, existing in enumerate(self.documents):
+            if self.matches(existing, filter):
+                self.documents[index] = dict(document)
+                return
+        if upsert:
+            self.insert_one(document)
+
+    def create_index(self, key, **options):
+        self.indexes.append((key, options))
+
+    def delete_one(self, filter):
+        for document in self.documents:
+            if self.matches(document, filter):
+                self.documents.remove(document)
+                return
+
+    def delete_many(self, filter):
+        self.documents = [document for document in self.documents if not self.matches(document, filter)]
+
+class FakeMongo:
+    # AppMongoDb with FakeCollection collections
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, FakeCollection())
+
+def completion(content, total_tokens=15):
+    # Body of a non-streamed chat completion
+    return {"choices": [{"message": {"content": content if isinstance(content, str) else json.dumps(content)}}],
+            "usage": {"prompt_tokens": total_tokens - 5, "completion_tokens": 5, "total_tokens": total_tokens}}
+
+@pytest.fixture
+def config(tmp_path):
+    values = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    values.update({
+        "MODEL_NAME": "gpt-4o",
+        "MODEL_URL": "http://model.test/v1/chat/completions",
+        "MODEL_API_KEY": "key",
+        "MODEL_MAX_INPUT_TOKENS": 100000,
+        "MODEL_MAX_OUTPUT_TOKENS": 16000,
+        "MODEL_INVOCATION_DELAY_IN_SECONDS": 0,
+        "TIKTOKEN_CACHE_DIR": "",
+        "FILE_CACHE_DIR": str(tmp_path / "files"),
+        "BATCH_DIR": str(tmp_path / "batches"),
+    })
+    return values
@@ -0,0 +1,140 @@
+from app_batch import AppBatch, AppLLMBatch
+from conftest import FakeLogger, FakeMongo
+
+
+class FakeBackend:
+    def __init__(self, status="in_progress", results=()):
+        self.status = status
+        self.output = list(results)
+        self.submitted = []
+        self.cancelled = []
+
+    def submit(self, input_path):
+        self.submitted.append(input_path)
+        return f"job-{len(self.submitted)}"
+
+    def poll(self, job_id):
+        return self.status
+
+    def cancel(self, job_id):
+        self.cancelled.append(job_id)
+
+    def results(self, job_id):
+        return self.output
+
+
+def make_runner(config, backend, mongo_db=None, **overrides):
+    config.update(overrides)
+    runner = AppBatch(FakeLogger(), config, transport=None, mongo_db=mongo_db)
+    runner.backend = backend
+    return runner
+
+
+def pending_batch():
+    batch = AppLLMBatch("R1")
+    batch.add("a", {"model": "gpt-4o"})
+    batch.add("b", {"model": "gpt-4o"})
+    return batch
+
+
+def test_submit_does_not_wait_and_poll_reports_running_job(config):
+    backend = FakeBackend()
+    runner = make_runner(config, backend)
+    batch = pending_batch()
+
+    assert runner.submit(batch) == "job-1"
+    assert runner.poll(batch) is False
+    assert batch.pending and batch.rounds == 0
+
+
+def test_completed_job_answers_every_pending_call(config):
+    backend = FakeBackend("completed", [
+        {"custom_id": "a", "response": {"status_code": 200, "body": {"ok": 1}}},
+        {"custom_id": "c", "response": {"status_code": 500, "body": "boom"}},
+    ])
+    runner = make_runner(config, backend)
+    batch = pending_batch()
+    runner.submit(batch)
+
+    assert runner.poll(batch) is True
+    assert batch.lookup("a") == {"ok": 1}
+    assert "error" in batch.lookup("b")
+    assert "error" in batch.lookup("c")
+    assert batch.pending == {} and batch.rounds == 1 and batch.job_id is None
+
+
+def test_timed_out_job_is_cancelled(config):
+    backend = FakeBackend()
+    runner = make_runner(config, backend, BATCH_TIMEOUT_IN_SECONDS=0)
+    batch = pending_batch()
+    runner.submit(batch)
+    batch.submitted_at -= 1
+
+    assert runner.poll(batch) is True
+    assert backend.cancelled == ["job-1"]
+    assert "timed out" in batch.lookup("a")["error"]
+
+
+class FailingBackend(FakeBackend):
+    def poll(self, job_id):
+        raise ConnectionError("provider unreachable")
+
+
+def test_poll_error_is_raised_within_the_timeout(config):
+    runner = make_runner(config, FailingBackend())
+    batch = pending_batch()
+    runner.submit(batch)
+
+    try:
+        runner.poll(batch)
+    except ConnectionError:
+        pass
+    else:
+        raise AssertionError("poll swallowed a transient provider error")
+    assert batch.pending and batch.job_id == "job-1"
+
+
+def test_unreachable_job_fails_its_calls_past_the_timeout(config):
+    runner = make_runner(config, FailingBackend(), BATCH_TIMEOUT_IN_SECONDS=0)
+    batch = pending_batch()
+    runner.submit(batch)
+    batch.submitted_at -= 1
+
+    assert runner.poll(batch) is True
+    assert "unreachable" in batch.lookup("a")["error"]
+
+
+def test_stored_job_is_restored_by_another_worker(config):
+    mongo_db = FakeMongo()
+    backend = FakeBackend()
+    first = make_runner(config, backend, mongo_db)
+    batch = pending_batch()
+    first.submit(batch)
+
+    second = make_runner(config, backend, mongo_db)
+    record = second.record("R1")
+    assert record["owner"] == first.worker_id
+    restored = second.restore(record)
+    second.save(restored)
+    assert second.record("R1")["owner"] == second.worker_id
+    assert restored.job_id == "job-1" and sorted(restored.pending) == ["a", "b"]
+
+    backend.status = "completed"
+    backend.output = [{"custom_id": "a", "response": {"status_code": 200, "body": {"ok": 1}}}]
+    assert second.poll(restored) is True
+    assert backend.submitted == [backend.submitted[0]]
+    again = second.restore(second.record("R1"))
+    assert again.lookup("a") == {"ok": 1} and again.job_id is None and again.pending == {}
+
+    second.forget("R1")
+    assert second.record("R1") is None
+
+
+def test_submit_stops_after_max_rounds(config):
+    runner = make_runner(config, FakeBackend(), BATCH_MAX_ROUNDS=0)
+    try:
+        runner.submit(pending_batch())
+    except RuntimeError as e:
+        assert "still pending" in str(e)
+    else:
+        raise AssertionError("submit accepted a batch past BATCH_MAX_ROUNDS")
@@ -0,0 +1,45 @@
+from app_cleanup_regions import AppCleanupRegions
+
+def numbered_lines(count, header=()):
+    return [f"{line}\n" for line in header] + [f"line {number}\n" for number in range(len(header) + 1, count + 1)]
+
+def test_changed_ranges_are_widened_within_the_file():
+    regions = AppCleanupRegions(numbered_lines(20), [(1, 1), (20, 20)], context_lines=2, header_max_lines=5)
+    assert regions.regions == [(1, 3), (18, 20)]
+
+def test_overlapping_and_adjacent_regions_are_merged():
+    lines = numbered_lines(40)
+    assert AppCleanupRegions(lines, [(5, 8), (7, 12)], 0, 5).regions == [(5, 12)]
+    assert AppCleanupRegions(lines, [(5, 8), (9, 12)], 0, 5).regions == [(5, 12)]
+    assert AppCleanupRegions(lines, [(5, 8), (10, 12)], 0, 5).regions == [(5, 8), (10, 12)]
+    assert AppCleanupRegions(lines, [(20, 22), (5, 8), (10, 12)], 1, 5).regions == [(4, 13), (19, 23)]
+
+def test_the_header_section_is_a_region():
+    lines = numbered_lines(30, header=("package a;", "", "import b.C;", "import d.E;"))
+    regions = AppCleanupRegions(lines, [(20, 20)], 1, header_max_lines=10)
+    assert regions.regions == [(1, 4), (19, 21)]
+    assert regions.line_count() == 7
+    assert regions.coverage() == 7 / 30
+
+def test_regions_are_rendered_after_their_markers():
+    regions = AppCleanupRegions(numbered_lines(10), [(2, 3), (8, 8)], 0, 5)
+    assert regions.render() == "@@@ REGION 1 @@@\nline 2\nline 3\n@@@ REGION 2 @@@\nline 8"
+
+def test_the_cleaned_regions_are_spliced_back():
+    regions = AppCleanupRegions(numbered_lines(10), [(2, 3), (8, 8)], 0, 5)
+    cleaned = "@@@ REGION 1 @@@\nLINE 2\n@@@ REGION 2 @@@\nLINE 8\nLINE 8b"
+    assert regions.splice(cleaned) == "line 1\nLINE 2\nline 4\nline 5\nline 6\nline 7\nLINE 8\nLINE 8b\nline 9\nline 10\n"
+
+def test_regions_at_the_start_and_the_end_of_the_file_are_spliced_back():
+    lines = numbered_lines(5)
+    lines[-1] = "line 5"  # no final line break
+    regions = AppCleanupRegions(lines, [(1, 1), (5, 5)], 0, 5)
+    assert regions.render() == "@@@ REGION 1 @@@\nline 1\n@@@ REGION 2 @@@\nline 5"
+    assert regions.splice("@@@ REGION 1 @@@\nFIRST\n@@@ REGION 2 @@@\nLAST") == "FIRST\nline 2\nline 3\nline 4\nLAST"
+
+def test_an_answer_with_unexpected_markers_is_rejected():
+    regions = AppCleanupRegions(numbered_lines(10), [(2, 3), (8, 8)], 0, 5)
+    assert regions.splice("@@@ REGION 1 @@@\nLINE 2") is None  # missing
+    assert regions.splice("@@@ REGION 2 @@@\nLINE 8\n@@@ REGION 1 @@@\nLINE 2") is None  # reordered
+    assert regions.splice("@@@ REGION 1 @@@\nLINE 2\n@@@ REGION 1 @@@\nLINE 2\n@@@ REGION 2 @@@\nLINE 8") is None  # duplicated
+    assert regions.splice("LINE 2\nLINE 8") is None
@@ -0,0 +1,44 @@
+import pytest
+
+from app_context_records import AppExceptionTable, AppImpactRecord
+
+ROWS = [
+    ("throw", "IOException"),
+    ("catch", "SQLException"),
+    ("throw", "IllegalStateException"),
+    ("raise", "IOException"),
+    ("throw", "IOException"),
+    ("catch", "SQLException"),
+    ("", "Exception"),
+    ("catch", "IOException"),
+]
+
+def make_table(rows):
+    table = AppExceptionTable()
+    for link_type, exception in rows:
+        table.append(link_type, exception)
+    return table
+
+def test_exceptions_are_grouped_by_sorted_link_type_without_duplicates():
+    assert make_table(ROWS).grouped() == [
+        ("", ["Exception"]),
+        ("catch", ["SQLException", "IOException"]),
+        ("raise", ["IOException"]),
+        ("throw", ["IOException", "IllegalStateException"]),
+    ]
+    assert make_table([]).grouped() == []
+    assert len(make_table(ROWS)) == len(ROWS)
+
+@pytest.mark.parametrize("rows", [ROWS, ROWS[:1], list(reversed(ROWS)), [("throw", "B"), ("throw", "A"), ("throw", "B")]])
+def test_grouped_matches_the_former_pandas_groupby(rows):
+    pd = pytest.importorskip("pandas")
+    exceptions = pd.DataFrame(columns=["link_type", "exception"])
+    for link_type, exception in rows:
+        exceptions = pd.concat([exceptions, pd.DataFrame({"link_type": [link_type], "exception": [exception]})], ignore_index=True)
+    expected = [(link_type, list(exception)) for link_type, exception in exceptions.groupby("link_type")["exception"].unique().items()]
+    assert make_table(rows).grouped() == expected
+
+def test_an_impact_record_reads_like_a_dataframe_row():
+    record = AppImpactRecord(object_id="c1", object_type="method", object_start_line=4)
+    assert record["object_id"] == "c1" and record["object_type"] == "method" and record["object_start_line"] == 4
+    assert record["object_full_code"] == "" and record["object_file_id"] == 0
@@ -0,0 +1,88 @@
+import os
+
+import app_file_cache
+from app_file_cache import AppFileCache
+
+def make_cache(cache_dir, max_size_in_mb=1):
+    return AppFileCache({"FILE_CACHE_DIR": str(cache_dir), "FILE_CACHE_MAX_SIZE_IN_MB": max_size_in_mb, "FILE_CACHE_REVALIDATE": False})
+
+def test_store_and_read(tmp_path):
+    cache = make_cache(tmp_path)
+    key = AppFileCache.make_key("t", "a", 1, "s1")
+    cache.store(key, "line 1\nline 2\n", etag='"e1"')
+    entry = cache.lookup(key)
+    assert entry["etag"] == '"e1"'
+    assert cache.read(entry) == "line 1\nline 2\n"
+    assert cache.lookup(AppFileCache.make_key("t", "a", 2, "s1")) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_identical_content_is_stored_once(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("t/a/1/s1", "same")
+    cache.store("t/a/1/s2", "same")
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["blobs"] == 1
+
+def test_store_appends_to_the_journal_without_rewriting_the_index(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("t/a/1/s1", "one")
+    cache.store("t/a/2/s1", "two")
+    assert not os.path.exists(tmp_path / AppFileCache.INDEX_FILE)
+    with open(tmp_path / AppFileCache.JOURNAL_FILE, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+def test_reload_replays_the_journal(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("t/a/1/s1", "one")
+    cache.store("t/a/2/s1", "two")
+    cache.store("t/a/1/s1", "one again")
+    reloaded = make_cache(tmp_path)
+    assert reloaded.read(reloaded.lookup("t/a/1/s1")) == "one again"
+    assert reloaded.read(reloaded.lookup("t/a/2/s1")) == "two"
+    assert reloaded.stats()["entries"] == 2
+
+def test_flush_moves_the_journal_into_the_index(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("t/a/1/s1", "one")
+    cache.flush()
+    assert os.path.getsize(tmp_path / AppFileCache.JOURNAL_FILE) == 0
+    reloaded = make_cache(tmp_path)
+    assert reloaded.read(reloaded.lookup("t/a/1/s1")) == "one"
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_size_in_mb=10 / (1024 * 1024))
+    cache.store("t/a/1/s1", "12345")
+    cache.store("t/a/2/s1", "67890")
+    cache.lookup("t/a/1/s1")
+    cache.store("t/a/3/s1", "abcde")
+    assert cache.lookup("t/a/2/s1") is None
+    assert cache.lookup("t/a/1/s1") is not None
+    assert cache.stats()["evictions"] == 1
+    assert make_cache(tmp_path, max_size_in_mb=10 / (1024 * 1024)).lookup("t/a/2/s1") is None
+
+def test_a_file_larger_than_the_cache_is_not_stored(tmp_path):
+    cache = make_cache(tmp_path, max_size_in_mb=10 / (1024 * 1024))
+    cache.store("t/a/1/s1", "12345")
+    cache.store("t/a/2/s1", "small")
+    cache.store("t/a/2/s1", "far too large for the cache")
+    assert cache.lookup("t/a/1/s1") is not None
+    assert cache.lookup("t/a/2/s1") is None
+    assert cache.stats()["oversized"] == 1 and cache.stats()["evictions"] == 0
+    assert cache.stats()["size_in_bytes"] == 5
+    assert make_cache(tmp_path, max_size_in_mb=10 / (1024 * 1024)).lookup("t/a/2/s1") is None
+
+def test_invalidate_by_prefix(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store("t/a/1/s1", "one")
+    cache.store("t/b/1/s1", "other")
+    cache.invalidate("t/a/")
+    assert cache.lookup("t/a/1/s1") is None
+    assert cache.lookup("t/b/1/s1") is not None
+    assert make_cache(tmp_path).lookup("t/a/1/s1") is None
+
+def test_a_relative_cache_dir_is_resolved_from_the_module(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_file_cache, "__file__", str(tmp_path / "app" / "app_file_cache.py"))
+    monkeypatch.chdir("/")
+    cache = AppFileCache({"FILE_CACHE_DIR": "cache/files", "FILE_CACHE_MAX_SIZE_IN_MB": 1, "FILE_CACHE_REVALIDATE": False})
+    assert cache.cache_dir == str(tmp_path / "app" / "cache" / "files")
+    assert os.path.isdir(tmp_path / "app" / "cache" / "files" / "blobs")
@@ -0,0 +1,48 @@
+from app_file_edits import AppEditAccumulator, AppFileEdit, AppFileEdits
+from app_file_snapshot import FileSnapshot
+
+SNAPSHOT = FileSnapshot("".join(f"line {number}\n" for number in range(1, 21)))
+
+def test_edits_are_kept_in_range_order():
+    file = AppFileEdits("a.java", SNAPSHOT)
+    assert file.add(AppFileEdit(10, 12, "B", "O2")) is None
+    assert file.add(AppFileEdit(2, 4, "A", "O1")) is None
+    assert file.add(AppFileEdit(15, 15, "C", "O3")) is None
+    assert [(edit.start, edit.end) for edit in file.edits] == [(2, 4), (10, 12), (15, 15)]
+
+def test_an_overlapping_edit_is_rejected():
+    file = AppFileEdits("a.java", SNAPSHOT)
+    file.add(AppFileEdit(5, 10, "A", "O1"))
+    assert file.add(AppFileEdit(8, 12, "B", "O2")).object_id == "O1"
+    assert file.add(AppFileEdit(1, 5, "C", "O3")).object_id == "O1"
+    assert file.add(AppFileEdit(6, 7, "D", "O4")).object_id == "O1"
+    assert file.replacements() == {(5, 10): "A"}
+
+def test_an_edit_of_the_same_range_is_a_conflict():
+    edits = AppEditAccumulator()
+    assert edits.add("a.java", SNAPSHOT, 3, 6, "fix", "C1") is None
+    conflict = edits.add("a.java", SNAPSHOT, 3, 6, "dependent fix", "C1")
+    assert (conflict.start, conflict.end, conflict.text) == (3, 6, "fix")
+    content = edits.to_contentinfo()[0]
+    assert content["objects"] == ["C1"]
+    assert content["originalfilecontent"][1] == [{"(3,6)": "fix"}]
+    assert edits.conflicts == 1
+
+def test_merge_returns_the_rejected_edits_and_keeps_their_objects_out():
+    edits = AppEditAccumulator()
+    edits.add("a.java", SNAPSHOT, 3, 6, "A", "O1")
+    other = AppEditAccumulator()
+    other.add("a.java", SNAPSHOT, 3, 6, "B", "O2")
+    other.add("a.java", SNAPSHOT, 8, 9, "C", "O2")
+    other.add("b.java", SNAPSHOT, 1, 1, "D", "O3")
+    rejected = edits.merge(other, "a.java")
+    assert [(edit.object_id, conflict.object_id) for edit, conflict in rejected] == [("O2", "O1")]
+    assert edits.files["a.java"].objects == ["O1", "O2"]
+    assert list(edits.files) == ["a.java"]
+
+def test_reorder_puts_the_files_in_the_given_order():
+    edits = AppEditAccumulator()
+    for name in ("c", "a", "b"):
+        edits.add(name, SNAPSHOT, 1, 1, name, name)
+    edits.reorder(["a", "b"])
+    assert [file.filefullname for file in edits] == ["a", "b", "c"]
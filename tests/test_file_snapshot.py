@@ -0,0 +1,57 @@
+from app_file_snapshot import AppFileSnapshots, FileSnapshot
+
+def test_lines_are_served_without_their_last_line_break():
+    snapshot = FileSnapshot("one\ntwo\nthree\n")
+    assert snapshot.line_count == 3
+    assert snapshot.get_lines(1, 1) == "one"
+    assert snapshot.get_lines(1, 2) == "one\ntwo"
+    assert snapshot.get_lines(2, 3) == "two\nthree"
+
+def test_crlf_line_breaks_are_kept_inside_and_dropped_at_the_end():
+    snapshot = FileSnapshot("one\r\ntwo\r\nthree\r\n")
+    assert snapshot.line_count == 3
+    assert snapshot.get_lines(1, 2) == "one\r\ntwo"
+    assert snapshot.get_lines(3, 3) == "three"
+
+def test_the_last_line_without_a_final_line_break():
+    snapshot = FileSnapshot("one\ntwo")
+    assert snapshot.line_count == 2
+    assert snapshot.get_lines(2, 2) == "two"
+    assert snapshot.get_lines(1, 2) == "one\ntwo"
+
+def test_out_of_range_lines_are_clamped():
+    snapshot = FileSnapshot("one\ntwo\nthree\n")
+    assert snapshot.get_lines(0, 1) == "one"
+    assert snapshot.get_lines(-5, 2) == "one\ntwo"
+    assert snapshot.get_lines(3, 99) == "three"
+    assert snapshot.get_lines(4, 9) == ""
+    assert snapshot.get_lines(3, 2) == ""
+    assert snapshot.get_lines("2", "2") == "two"
+
+def test_an_empty_file_has_no_lines():
+    snapshot = FileSnapshot("")
+    assert snapshot.line_count == 0 and snapshot.get_lines(1, 1) == "" and snapshot.lines() == []
+
+def test_line_numbers_match_splitlines():
+    text = "a\r\nb\rc\nd\x0ce f"
+    snapshot = FileSnapshot(text)
+    lines = text.splitlines()
+    assert snapshot.line_count == len(lines)
+    assert [snapshot.get_lines(number, number) for number in range(1, len(lines) + 1)] == lines
+    assert snapshot.lines() == text.splitlines(keepends=True)
+
+def test_a_file_is_fetched_once_per_request():
+    class FakeImaging:
+        def __init__(self):
+            self.fetches = []
+
+        def get_file(self, object_type, tenant, application, file_id, request_id):
+            self.fetches.append(file_id)
+            return "one\ntwo\n"
+
+    imaging = FakeImaging()
+    files = AppFileSnapshots(imaging, "T", "A", "R1")
+    assert files.get_source("object", 7, 2, 2) == "two"
+    assert files.get_source("impact object", "7", 1, 1) == "one"
+    assert files.get_file_lines("dep object", 7) == ["one\n", "two\n"]
+    assert imaging.fetches == [7]
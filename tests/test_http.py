@@ -0,0 +1,91 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app_http import AppHttpTransport
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive server answering each path with the statuses queued for it, then 200
+    protocol_version = "HTTP/1.1"
+
+    def __answer(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        server = self.server
+        with server.lock:
+            server.hits.append((self.command, self.path))
+            statuses = server.statuses.get(self.path) or [200]
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+        self.send_response(status)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    do_GET = __answer
+    do_POST = __answer
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.hits = []
+    server.statuses = {}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_transport(config, **overrides):
+    config.update({"HTTP_MAX_RETRIES": 2, "HTTP_BACKOFF_FACTOR": 0, "HTTP_TIMEOUT_IN_SECONDS": 5, **overrides})
+    return AppHttpTransport(config)
+
+def url(server, path="/"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+def test_every_thread_has_its_own_session_on_the_shared_adapter(config):
+    transport = make_transport(config)
+    session = transport._AppHttpTransport__get_session
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        sessions = list(executor.map(lambda _: session(), range(2)))
+    sessions.append(session())
+    assert session() is sessions[-1]
+    assert len({id(s) for s in sessions}) >= 2
+    assert all(s.get_adapter("http://x.test/") is transport.adapter for s in sessions)
+    assert all(s.get_adapter("https://x.test/") is transport.adapter for s in sessions)
+
+def test_the_retry_policy_covers_get_only(config):
+    transport = make_transport(config)
+    assert transport.retry.is_retry("GET", 503)
+    assert transport.retry.is_retry("GET", 429, has_retry_after=True)
+    assert not transport.retry.is_retry("POST", 503)
+    assert not transport.retry.is_retry("GET", 404)
+
+def test_a_failing_get_is_retried_and_a_post_is_not(config, server):
+    transport = make_transport(config)
+    server.statuses["/get"] = [503, 502, 200]
+    assert transport.get(url(server, "/get")).status_code == 200
+    server.statuses["/post"] = [503, 200]
+    assert transport.post(url(server, "/post"), json={}).status_code == 503
+    assert server.hits == [("GET", "/get")] * 3 + [("POST", "/post")]
+
+def test_connections_are_reused_and_counted_per_host(config, server):
+    transport = make_transport(config)
+    for _ in range(5):
+        assert transport.get(url(server)).text == "ok"
+    stats = transport.stats()[f"127.0.0.1:{server.server_address[1]}"]
+    assert stats["requests"] == 5 and stats["handshakes"] == 1 and stats["errors"] == 0
+    assert stats["reused"] == 4 and stats["reuse_ratio"] == 0.8
+
+def test_a_connection_error_is_counted(config):
+    transport = make_transport(config, HTTP_MAX_RETRIES=0)
+    with pytest.raises(Exception):
+        transport.get("http://127.0.0.1:9/")
+    assert transport.stats()["127.0.0.1:9"]["errors"] == 1
@@ -0,0 +1,70 @@
+from app_imaging import AppImaging
+from conftest import FakeLogger, FakeResponse
+
+class FakeImagingTransport:
+    # Serves the descriptor of the application and the metadata of its objects, and counts the GETs
+    def __init__(self):
+        self.descriptor = {"name": "A", "snapshot": "s1"}
+        self.descriptor_status = 200
+        self.metadata_status = 200
+        self.gets = []
+
+    def get(self, url, params=None, headers=None, verify=True):
+        self.gets.append(url)
+        if url.endswith("/applications/A"):
+            return FakeResponse(self.descriptor_status, self.descriptor)
+        return FakeResponse(self.metadata_status, {"id": url.split("/objects/")[1], "snapshot": self.descriptor["snapshot"]})
+
+def make_imaging(config, **overrides):
+    config.update({"IMAGING_URL": "http://imaging.test/", "IMAGING_SNAPSHOT_TTL_IN_SECONDS": 0, **overrides})
+    transport = FakeImagingTransport()
+    return AppImaging(FakeLogger(), config, transport), transport
+
+def metadata_gets(transport):
+    return [url for url in transport.gets if "/objects/" in url]
+
+def test_the_decoded_metadata_is_cached_per_snapshot(config):
+    imaging, transport = make_imaging(config)
+    status, data, url = imaging.get_source_locations("T", "A", 7)
+    assert status == 200 and data["id"] == "7?select=source-locations" and url.endswith("?select=source-locations")
+    assert imaging.get_source_locations("T", "A", 7)[1] is data
+    assert len(metadata_gets(transport)) == 1
+    assert imaging.cache_stats()["metadata_cache"]["hits"] == 1
+
+def test_a_new_snapshot_is_fetched_again(config):
+    imaging, transport = make_imaging(config)
+    imaging.get_callers("T", "A", 7)
+    transport.descriptor = {"name": "A", "snapshot": "s2"}
+    _, data, _ = imaging.get_callers("T", "A", 7)
+    assert data["snapshot"] == "s2"
+    assert len(metadata_gets(transport)) == 2
+
+def test_nothing_is_cached_without_a_known_snapshot(config):
+    imaging, transport = make_imaging(config)
+    transport.descriptor_status = 503
+    imaging.get_callees("T", "A", 7)
+    imaging.get_callees("T", "A", 7)
+    assert len(metadata_gets(transport)) == 2
+    assert imaging.cache_stats()["metadata_cache"]["entries"] == 0
+
+def test_a_failed_fetch_is_not_cached(config):
+    imaging, transport = make_imaging(config)
+    transport.metadata_status = 404
+    assert imaging.get_callees("T", "A", 7) == (404, None, "http://imaging.test/rest/tenants/T/applications/A/objects/7/callees")
+    transport.metadata_status = 200
+    assert imaging.get_callees("T", "A", 7)[0] == 200
+    assert len(metadata_gets(transport)) == 2
+
+def test_invalidate_drops_the_entries_of_the_application_only(config):
+    imaging, transport = make_imaging(config, IMAGING_SNAPSHOT_TTL_IN_SECONDS=60)
+    imaging.get_callers("T", "A", 7)
+    imaging.get_callees("T", "A", 7)
+    imaging.metadata_cache.set(("T", "B", "s1", "callers", "7"), [])
+    assert imaging.invalidate("T", "A") == 2
+    assert imaging.metadata_cache.get(("T", "B", "s1", "callers", "7")) == []
+
+    # The snapshot is read again too
+    descriptor_gets = transport.gets.count("http://imaging.test/rest/tenants/T/applications/A")
+    imaging.get_callers("T", "A", 7)
+    assert transport.gets.count("http://imaging.test/rest/tenants/T/applications/A") == descriptor_gets + 1
+    assert len(metadata_gets(transport)) == 3
@@ -0,0 +1,32 @@
+import pytest
+
+from app_json_repair import AppJsonRepair
+
+@pytest.mark.parametrize("text, repair", [
+    ('```json\n{"a": 1}\n```', "strip_code_fence"),
+    ('Here it is: {"a": 1} Hope it helps.', "extract_object"),
+    ('{"a": 1, "b": [1, 2,],}', "remove_trailing_commas"),
+    ('{"a": "line 1\nline 2"}', "escape_control_characters"),
+])
+def test_repairs(text, repair):
+    json_repair = AppJsonRepair()
+    value, name = json_repair.repair(text)
+    assert name == repair
+    assert value["a"] in (1, "line 1\nline 2")
+    assert json_repair.stats()[repair] == 1
+
+def test_repairs_are_cumulative():
+    value, name = AppJsonRepair().repair('```json\n{"code": "a\tb", "list": [1,],}\n```')
+    assert value == {"code": "a\tb", "list": [1]}
+    assert name == "escape_control_characters"
+
+def test_commas_in_strings_are_kept():
+    value, _ = AppJsonRepair().repair('{"code": "f(a, b,)", "x": [1,]}')
+    assert value["code"] == "f(a, b,)"
+
+def test_unrepairable_text():
+    json_repair = AppJsonRepair()
+    assert json_repair.repair('{"a": ') == (None, None)
+    assert json_repair.repair("[1, 2]") == (None, None)
+    assert json_repair.repair(None) == (None, None)
+    assert json_repair.stats()["failed"] == 2
@@ -0,0 +1,47 @@
+import json
+
+from app_json_stream import AppJsonStreamParser
+
+ANSWER = json.dumps({"updated": "yes", "comment": "fixed", "code": "int x = 1;\nreturn x;", "list": [1, 2.5, -3e2, True, None]})
+
+def feed_in_chunks(text, size=7, **kwargs):
+    parser = AppJsonStreamParser(**kwargs)
+    for index in range(0, len(text), size):
+        if not parser.feed(text[index:index + size]):
+            break
+    return parser
+
+def test_valid_object_in_chunks():
+    parser = feed_in_chunks(ANSWER)
+    assert parser.error is None
+    assert parser.is_complete()
+    assert parser.watched_length == len("int x = 1;\\nreturn x;")
+
+def test_watched_key_is_top_level_only():
+    parser = feed_in_chunks('{"nested": {"code": "abc"}, "code": "de"}')
+    assert parser.is_complete()
+    assert parser.watched_length == 2
+
+def test_invalid_structure_aborts_at_once():
+    parser = AppJsonStreamParser()
+    assert parser.feed('{"updated": "yes" "comment"') is False
+    assert "Expecting ',' delimiter" in parser.error
+    assert parser.feed('more') is False
+
+def test_invalid_escape_and_literal():
+    assert AppJsonStreamParser().feed('{"a": "\\q"}') is False
+    assert AppJsonStreamParser().feed('{"a": tru }') is False
+    assert AppJsonStreamParser().feed('{"a": "\\u12G4"}') is False
+
+def test_code_fence_and_introduction_are_tolerated():
+    parser = feed_in_chunks("Here is the answer:\n```json\n" + ANSWER + "\n```")
+    assert parser.error is None
+    assert parser.is_complete()
+
+def test_long_text_before_the_object_aborts():
+    parser = feed_in_chunks("x" * 50 + ANSWER, max_wrapping=20)
+    assert parser.error is not None
+    assert "Expecting '{'" in parser.error
+
+def test_repairable_defects_do_not_abort():
+    assert feed_in_chunks('{"code": "line 1\nline 2", "list": [1, 2,], "last": 1,}').error is None
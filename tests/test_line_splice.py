@@ -0,0 +1,21 @@
+from app_file_snapshot import FileSnapshot
+from app_line_splice import AppLineSplice
+
+SNAPSHOT = FileSnapshot("one\ntwo\r\nthree\nfour\nfive")
+
+def test_ranges_are_replaced_in_one_pass():
+    splice = AppLineSplice(SNAPSHOT, {(4, 5): "FOUR", (2, 2): "TWO\nTWO BIS"})
+    assert splice.text() == "one\nTWO\nTWO BIS\nthree\nFOUR\n"
+    assert splice.changed_ranges() == [(2, 3), (5, 5)]
+    assert splice.conflicts == []
+
+def test_without_replacement_the_text_is_unchanged():
+    assert AppLineSplice(SNAPSHOT, {}).text() == SNAPSHOT.text
+
+def test_overlapping_and_out_of_file_ranges_are_not_applied():
+    splice = AppLineSplice(SNAPSHOT, {(1, 2): "A", (2, 3): "B", (9, 10): "C", (3, 2): "D"})
+    assert splice.text() == "A\nthree\nfour\nfive"
+    assert len(splice.conflicts) == 3
+
+def test_a_range_past_the_last_line_is_clipped():
+    assert AppLineSplice(SNAPSHOT, {(5, 8): "FIVE"}).text() == "one\ntwo\r\nthree\nfour\nFIVE\n"
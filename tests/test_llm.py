@@ -0,0 +1,152 @@
+import json
+
+from app_llm import AppLLM
+from app_llm_schema import FIX_RESPONSE_SCHEMA
+from conftest import FakeLogger, FakeResponse, FakeTransport, completion
+
+FIX_ANSWER = {"updated": "yes", "comment": "fixed", "missing_information": "NA", "signature_impact": "NO", "exception_impact": "NO",
+              "enclosed_impact": "NO", "other_impact": "NO", "impact_comment": "NA", "code": "FIXED CODE"}
+
+def make_llm(config, *responses, **overrides):
+    config.update(overrides)
+    transport = FakeTransport(*responses)
+    return AppLLM(FakeLogger(), config, transport), transport
+
+def ask(llm, prompt="fix this", **kwargs):
+    return llm.ask_ai_model("R1", prompt, FIX_RESPONSE_SCHEMA, 100, "O1", use_cache=False, prompt_tokens=10, **kwargs)
+
+def test_a_rate_limited_call_is_charged_once_and_settled(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(429, headers={"Retry-After": "0"}),
+        FakeResponse(200, completion(FIX_ANSWER, total_tokens=15)),
+        MODEL_REQUESTS_PER_MINUTE=100, MODEL_TOKENS_PER_MINUTE=10000,
+    )
+    answer, status, tokens = ask(llm)
+    assert status == "success" and answer["code"] == "FIXED CODE"
+    assert len(transport.payloads) == 2
+    stats = llm.rate_limiter.stats()
+    assert stats["requests"] == 1
+    assert stats["rate_limited"] == 1  # the endpoint has no quota of its own
+    assert round(llm.rate_limiter.token_bucket) == 10000 - 15
+
+def test_a_failed_call_gives_back_its_estimate(config):
+    llm, _ = make_llm(config, FakeResponse(400, {"error": "bad request"}), MODEL_TOKENS_PER_MINUTE=10000)
+    answer, status, _ = ask(llm)
+    assert answer is None and status.startswith("HTTP 400")
+    assert round(llm.rate_limiter.token_bucket) == 10000
+    endpoint = llm.router.default_route.pool.endpoints[0]
+    assert endpoint.rate_limiter.stats()["requests"] == 1
+
+def test_an_endpoint_with_its_own_quota_keeps_its_429_to_itself(config):
+    llm, _ = make_llm(
+        config,
+        FakeResponse(429, headers={"Retry-After": "0"}),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_ENDPOINTS='[{"url": "http://model.test/v1", "requests_per_minute": 1000}]',
+    )
+    assert ask(llm)[1] == "success"
+    assert llm.rate_limiter.stats()["rate_limited"] == 0
+    assert llm.router.default_route.pool.endpoints[0].rate_limiter.stats()["rate_limited"] == 1
+
+def test_a_route_rejecting_structured_output_falls_back_to_the_prompt_instructions(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(400, {"error": "response_format is not supported"}),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_RESPONSE_FORMAT="json_schema",
+    )
+    assert ask(llm)[1] == "success"
+    rejected, retried = transport.payloads
+    assert rejected["response_format"]["type"] == "json_schema" and "GUIDELINES" not in rejected["messages"][0]["content"]
+    assert "response_format" not in retried and "GUIDELINES" in retried["messages"][0]["content"]
+    endpoint = llm.router.default_route.pool.endpoints[0]
+    assert endpoint.text_until > 0
+
+    assert ask(llm, prompt="fix that")[1] == "success"
+    assert "response_format" not in transport.payloads[2] and "GUIDELINES" in transport.payloads[2]["messages"][0]["content"]
+
+def test_structured_output_is_retried_once_the_fallback_expires(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(400, {"error": "response_format is not supported"}),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_RESPONSE_FORMAT="json_schema",
+        MODEL_RESPONSE_FORMAT_RETRY_IN_SECONDS=0,
+    )
+    assert ask(llm)[1] == "success"
+    assert llm.router.default_route.response_format == "json_schema"
+    assert ask(llm, prompt="fix that")[1] == "success"
+    assert transport.payloads[2]["response_format"]["type"] == "json_schema"
+
+def test_only_the_endpoint_rejecting_structured_output_falls_back(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_RESPONSE_FORMAT="json_schema",
+        MODEL_ENDPOINTS='[{"name": "east", "url": "http://east.test/v1"}, {"name": "west", "url": "http://west.test/v1"}]',
+    )
+    east, west = llm.router.default_route.pool.endpoints
+    east.text_until = float("inf")
+    east.ejected_until = float("inf")
+    assert ask(llm)[1] == "success"
+    assert transport.payloads[0]["response_format"]["type"] == "json_schema"
+
+def test_a_text_route_gets_the_instructions_left_out_of_the_prompts(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_RESPONSE_FORMAT="json_schema",
+        MODEL_ROUTES='[{"name": "small", "model": "gpt-4o-mini", "tasks": ["fix"], "response_format": "text"}]',
+    )
+    assert ask(llm, task="fix")[1] == "success"
+    assert transport.payloads[0]["model"] == "gpt-4o-mini"
+    assert "response_format" not in transport.payloads[0] and "GUIDELINES" in transport.payloads[0]["messages"][0]["content"]
+
+def stream_lines(text, size=7):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': text[i:i + size]}}]})}" for i in range(0, len(text), size)]
+    return lines + [f"data: {json.dumps({'choices': [], 'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}})}", "data: [DONE]"]
+
+def test_a_fenced_streamed_answer_is_repaired_locally(config):
+    fenced = "```json\n" + json.dumps(FIX_ANSWER) + "\n```"
+    llm, transport = make_llm(config, FakeResponse(200, lines=stream_lines(fenced)), MODEL_STREAMING=True)
+    answer, status, _ = ask(llm)
+    assert status == "success" and answer["code"] == "FIXED CODE"
+    assert len(transport.payloads) == 1
+    assert llm.stream_stats()["completed"] == 1
+    assert llm.json_repair.stats()["strip_code_fence"] == 1
+
+def test_a_broken_streamed_answer_is_aborted_and_reprompted(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(200, lines=stream_lines('{"updated": "yes" "code": "' + "x" * 100)),
+        FakeResponse(200, lines=stream_lines(json.dumps(FIX_ANSWER))),
+        MODEL_STREAMING=True,
+    )
+    answer, status, _ = ask(llm)
+    assert status == "success"
+    assert len(transport.payloads) == 2
+    assert llm.stream_stats()["aborted_invalid"] == 1
+
+def test_a_body_that_is_not_a_completion_is_reprompted(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(200, "<html>gateway error</html>"),
+        FakeResponse(200, completion(FIX_ANSWER)),
+    )
+    answer, status, _ = ask(llm)
+    assert status == "success" and answer["code"] == "FIXED CODE"
+    assert "<html>gateway error</html>" in transport.payloads[1]["messages"][0]["content"]
+
+def test_a_prompt_too_large_for_the_first_route_goes_to_the_next_one(config):
+    llm, transport = make_llm(
+        config,
+        FakeResponse(200, completion(FIX_ANSWER)),
+        FakeResponse(200, completion(FIX_ANSWER)),
+        MODEL_ROUTES='[{"name": "small", "model": "gpt-4o-mini", "max_prompt_tokens": 50}]',
+    )
+    for prompt in ("fix this " * 100, "fix this"):
+        assert llm.ask_ai_model("R1", prompt, FIX_RESPONSE_SCHEMA, 100, "O1", use_cache=False, task="fix")[1] == "success"
+    assert [payload["model"] for payload in transport.payloads] == ["gpt-4o", "gpt-4o-mini"]
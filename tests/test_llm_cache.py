@@ -0,0 +1,78 @@
+import pytest
+
+import app_cache
+from app_llm_cache import AppLLMCache
+from conftest import FakeClock, FakeMongo
+
+MESSAGES = [{"role": "user", "content": "fix this"}]
+TOKENS = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(app_cache, "time", clock)
+    return clock
+
+def make_cache(config, mongo_db=None, **overrides):
+    config.update({"LLM_CACHE_ENABLED": True, "LLM_CACHE_TTL_IN_SECONDS": 60, "LLM_CACHE_SIZE": 10, **overrides})
+    return AppLLMCache(mongo_db or FakeMongo(), config)
+
+def test_the_key_covers_the_model_the_messages_and_max_tokens():
+    key = AppLLMCache.make_key("gpt-4o", MESSAGES, 100)
+    assert key == AppLLMCache.make_key("gpt-4o", [dict(MESSAGES[0])], 100)
+    assert key != AppLLMCache.make_key("gpt-4o-mini", MESSAGES, 100)
+    assert key != AppLLMCache.make_key("gpt-4o", [{"role": "user", "content": "fix that"}], 100)
+    assert key != AppLLMCache.make_key("gpt-4o", MESSAGES, 200)
+
+def test_a_stored_completion_is_served_from_memory(config, clock):
+    cache = make_cache(config)
+    cache.set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    assert cache.get("k") == ({"code": "x"}, TOKENS)
+    assert cache.stats()["memory_hits"] == 1 and cache.stats()["stores"] == 1
+
+def test_the_persistent_tier_is_shared_and_promoted_to_memory(config, clock):
+    mongo_db = FakeMongo()
+    make_cache(config, mongo_db).set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    document = mongo_db.get_collection(AppLLMCache.COLLECTION_NAME).find_one({"_id": "k"})
+    assert document["model"] == "gpt-4o" and document["createdAt"] is not None
+
+    other = make_cache(config, mongo_db)  # another instance, or the same one after a restart
+    assert other.get("k") == ({"code": "x"}, TOKENS)
+    assert other.get("k") == ({"code": "x"}, TOKENS)
+    stats = other.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
+
+def test_memory_entries_expire_and_mongo_expires_documents_by_ttl(config, clock):
+    mongo_db = FakeMongo()
+    cache = make_cache(config, mongo_db)
+    cache.set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    assert mongo_db.get_collection(AppLLMCache.COLLECTION_NAME).indexes == [("createdAt", {"expireAfterSeconds": 60})]
+
+    clock.now += 61
+    mongo_db.get_collection(AppLLMCache.COLLECTION_NAME).delete_many({})  # removed by the TTL index
+    assert cache.get("k") is None
+    assert cache.stats()["misses"] == 1 and cache.stats()["memory"]["expirations"] == 1
+
+def test_use_cache_false_neither_reads_nor_writes(config, clock):
+    mongo_db = FakeMongo()
+    cache = make_cache(config, mongo_db)
+    cache.set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    assert cache.get("k", use_cache=False) is None
+    cache.set("k2", "gpt-4o", {"code": "y"}, TOKENS, use_cache=False)
+    assert cache.get("k2") is None
+    assert mongo_db.get_collection(AppLLMCache.COLLECTION_NAME).find_one({"_id": "k2"}) is None
+    assert cache.stats()["bypassed"] == 1
+
+def test_a_disabled_cache_stores_nothing(config, clock):
+    cache = make_cache(config, LLM_CACHE_ENABLED=False)
+    cache.set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    assert cache.get("k") is None and cache.stats()["stores"] == 0
+
+def test_a_mongo_failure_is_a_miss(config, clock):
+    class FailingMongo:
+        def get_collection(self, name):
+            raise ConnectionError("mongo down")
+    cache = make_cache(config, FailingMongo())
+    cache.set("k", "gpt-4o", {"code": "x"}, TOKENS)
+    assert cache.get("k") == ({"code": "x"}, TOKENS)  # the memory tier still works
+    assert cache.get("other") is None and cache.stats()["misses"] == 1
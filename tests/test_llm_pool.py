@@ -0,0 +1,102 @@
+import pytest
+
+import app_llm_pool
+from app_llm_pool import AppLLMEndpoint, AppLLMPool
+from conftest import FakeClock
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(app_llm_pool, "time", clock)
+    return clock
+
+@pytest.fixture
+def weights(monkeypatch):
+    # Selection weights of the last draw; the draw itself returns the best scored endpoint
+    drawn = {}
+    def choices(population, weights):
+        drawn.clear()
+        drawn.update({endpoint.name: weight for endpoint, weight in zip(population, weights)})
+        return [max(zip(population, weights), key=lambda pair: pair[1])[0]]
+    monkeypatch.setattr(app_llm_pool.random, "choices", choices)
+    return drawn
+
+def make_pool(count=2, **settings):
+    endpoints = [AppLLMEndpoint(f"e{index + 1}", f"http://e{index + 1}.test/v1", "key") for index in range(count)]
+    settings = {"ewma_alpha": 0.5, "eject_error_rate": 1.1, "eject_consecutive_errors": 3, "eject_seconds": 30, "max_eject_seconds": 100, **settings}
+    return AppLLMPool("default", endpoints, **settings), endpoints
+
+def test_consecutive_errors_eject_the_endpoint_with_a_doubling_delay(clock, weights):
+    pool, (failing, healthy) = make_pool()
+    for _ in range(3):
+        pool.record(failing, 0.1, error=True)
+    assert failing.ejected_until == clock.now + 30
+    assert all(pool.select() is healthy for _ in range(5))
+
+    # Re-admitted on probation: the next failure ejects it again, for twice as long
+    clock.now += 30
+    assert pool.select() in (failing, healthy) and "e1" in weights
+    pool.record(failing, 0.1, error=True)
+    assert failing.ejected_until == clock.now + 60
+
+    # The delay is capped
+    clock.now += 60
+    pool.record(failing, 0.1, error=True)
+    assert failing.ejected_until == clock.now + 100
+    assert failing.counters["ejected"] == 3
+
+def test_a_success_on_probation_clears_the_ejections(clock, weights):
+    pool, (failing, _) = make_pool()
+    for _ in range(3):
+        pool.record(failing, 0.1, error=True)
+    clock.now += 30
+    pool.record(failing, 0.1)
+    assert not failing.probation and failing.ejections == 0 and failing.consecutive_errors == 0
+
+    pool.record(failing, 0.1, error=True)
+    assert failing.ejected_until <= clock.now
+
+def test_the_error_rate_ejects_an_endpoint_failing_intermittently(clock, weights):
+    pool, (failing, _) = make_pool(eject_error_rate=0.7, eject_consecutive_errors=10)
+    pool.record(failing, 0.1, error=True)  # error rate 0.5
+    pool.record(failing, 0.1)  # 0.25
+    pool.record(failing, 0.1, error=True)  # 0.625
+    assert failing.ejected_until <= clock.now
+    pool.record(failing, 0.1, error=True)  # 0.8125
+    assert failing.ejected_until == clock.now + 30
+
+def test_a_single_endpoint_is_never_ejected(clock):
+    pool, (only,) = make_pool(count=1)
+    for _ in range(5):
+        pool.record(only, 0.1, error=True)
+    assert only.ejected_until == 0.0 and pool.select() is only
+
+def test_every_endpoint_ejected_gives_the_one_back_first(clock):
+    pool, (first, second) = make_pool()
+    for _ in range(3):
+        pool.record(first, 0.1, error=True)
+    clock.now += 10
+    for _ in range(3):
+        pool.record(second, 0.1, error=True)
+    assert pool.select() is first
+
+def test_healthy_and_fast_endpoints_are_preferred(clock, weights):
+    pool, (erring, healthy, slow) = make_pool(count=3)
+    pool.record(erring, 0.1, error=True)
+    pool.record(healthy, 0.1)
+    pool.record(slow, 1.0)
+    assert pool.select() is healthy
+    assert weights["e2"] == pytest.approx(2 * weights["e1"])  # error rate 0.5
+    assert weights["e2"] == pytest.approx(10 * weights["e3"])  # ten times the latency
+
+def test_recent_rate_limits_lower_the_share_until_the_window_ends(clock, weights):
+    pool, (limited, other) = make_pool(rate_limit_window=60)
+    pool.record(limited, rate_limited=True)
+    pool.record(limited, rate_limited=True)
+    assert limited.error_ewma == 0.0 and limited.consecutive_errors == 0  # a 429 is not an error
+    assert pool.select() is other
+    assert weights["e2"] == pytest.approx(3 * weights["e1"])
+
+    clock.now += 61
+    pool.select()
+    assert weights["e1"] == pytest.approx(weights["e2"])
@@ -0,0 +1,50 @@
+import json
+
+from app_llm_router import AppLLMRouter
+
+SMALL_ROUTE = {"name": "small", "model": "gpt-4o-mini", "url": "http://small.test/v1", "tasks": ["dependent", "cleanup"],
+               "max_prompt_tokens": 4000, "max_output_tokens": 8000, "response_format": "json_schema"}
+
+def make_router(config, *routes, **overrides):
+    config.update(MODEL_ROUTES=json.dumps(list(routes)), **overrides)
+    return AppLLMRouter(config)
+
+def test_routes_are_parsed_and_the_default_route_comes_last(config):
+    router = make_router(config, SMALL_ROUTE, {"model": "gpt-4.1"})
+    small, unnamed, default = router.routes
+    assert (small.name, small.model_name, small.tasks, small.max_prompt_tokens) == ("small", "gpt-4o-mini", ("dependent", "cleanup"), 4000)
+    assert (small.max_input_tokens, small.max_output_tokens, small.response_format) == (100000, 8000, "json_schema")
+    assert small.pool.endpoints[0].url == "http://small.test/v1"
+    assert (unnamed.name, unnamed.tasks, unnamed.response_format) == ("route2", ("fix", "dependent", "cleanup"), "text")
+    assert unnamed.pool.endpoints[0].url == config["MODEL_URL"]
+    assert default is router.default_route and default.model_name == "gpt-4o"
+
+def test_no_routes_leaves_the_default_route_only(config):
+    assert make_router(config).routes[0].name == "default"
+    config["MODEL_ROUTES"] = " "
+    router = AppLLMRouter(config)
+    assert router.routes == [router.default_route]
+
+def test_prompt_limit_and_budget_span_the_routes_of_the_task(config):
+    router = make_router(config, SMALL_ROUTE)
+    # Every route of the task accepts a prompt up to the limit, at least one up to the budget
+    assert router.prompt_limit("dependent", 1000) == 4000 - 1
+    assert router.prompt_budget("dependent", 1000) == 100000 - 1000 - 1
+    assert router.prompt_limit("fix", 1000) == router.prompt_budget("fix", 1000) == 100000 - 1000 - 1
+    # Only the default route can produce 10000 tokens
+    assert router.prompt_budget("cleanup", 10000) == 100000 - 10000 - 1
+    assert router.prompt_budget("cleanup", 16000) == -1
+
+def test_calls_go_to_the_first_route_accepting_them(config):
+    router = make_router(config, SMALL_ROUTE)
+    assert router.route("dependent", 3999, 1000).name == "small"
+    assert router.route("dependent", 4000, 1000).name == "default"  # a large prompt
+    assert router.route("cleanup", 100, 9000).name == "default"  # a large answer
+    assert router.route("fix", 100, 1000).name == "default"  # not a task of the small route
+    calls = {route["name"]: route["calls"] for route in router.stats()}
+    assert calls["small"]["dependent"] == 1 and calls["default"] == {"fix": 1, "dependent": 1, "cleanup": 1}
+
+def test_a_call_no_route_accepts_is_refused_but_routed_to_the_default(config):
+    router = make_router(config, SMALL_ROUTE)
+    assert not router.accepts("fix", 99500, 1000)
+    assert router.route("fix", 99500, 1000) is router.default_route
@@ -0,0 +1,75 @@
+from app_dependent_checks import AppDependentChecks
+from app_file_edits import AppEditAccumulator, AppFileBarrier
+from app_file_snapshot import FileSnapshot
+from app_pipeline import AppPipeline, AppPipelineStage, AppPipelineStats
+
+SNAPSHOT = FileSnapshot("a\nb\nc\nd\n")
+
+def pipeline(*handlers, workers=2):
+    return AppPipeline("test", [AppPipelineStage(f"s{index}", handler, workers, 1) for index, handler in enumerate(handlers)], AppPipelineStats())
+
+def test_items_flow_through_every_stage():
+    result = pipeline(lambda item: [item + 1], lambda item: [item * 10, item * 100]).run(range(5))
+    assert sorted(result) == sorted([value for item in range(5) for value in ((item + 1) * 10, (item + 1) * 100)])
+
+def test_a_failing_handler_hands_its_item_back():
+    def handler(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return [item]
+    run = pipeline(lambda item: [item], handler)
+    assert sorted(run.run(range(5))) == [0, 1, 2, 4]
+    [(stage, item, error)] = run.failed
+    assert (stage, item, str(error)) == ("s1", 3, "bad item")
+    assert run.stats.stats()["stages"]["s1"]["failed"] == 1
+
+def test_resumed_items_enter_at_their_stage():
+    seen = []
+    run = pipeline(lambda item: seen.append(item) or [item], lambda item: [item * 2])
+    assert sorted(run.run([1], resumed=[("s1", 5)])) == [2, 10]
+    assert seen == [1]
+
+def edits(*files):
+    accumulator = AppEditAccumulator()
+    for filefullname, object_id in files:
+        accumulator.add(filefullname, SNAPSHOT, 1, 1, "x", object_id)
+    return accumulator
+
+def test_the_barrier_holds_a_file_until_every_object_that_may_change_it_is_done():
+    barrier = AppFileBarrier(3)
+    barrier.register(0, ["a", "b"])
+    barrier.register(1, ["b"])
+    assert barrier.complete(0, edits(("a", "O0"), ("b", "O0"))) == []  # object 2 not registered yet
+    barrier.register(2, ["c"])
+    assert barrier.complete(2, edits(("c", "O2"))) == [("a", [0]), ("c", [2])]
+    assert barrier.complete(1, AppEditAccumulator()) == [("b", [0])]
+    assert barrier.is_complete(1)
+
+def test_the_barrier_gives_the_objects_of_a_file_in_input_order():
+    barrier = AppFileBarrier(2)
+    barrier.register(0, ["a"])
+    barrier.register(1, ["a"])
+    assert barrier.complete(1, edits(("a", "O1"))) == []
+    assert barrier.complete(0, edits(("a", "O0"))) == [("a", [0, 1])]
+    assert barrier.complete(0, edits(("a", "O0"))) == []
+
+def test_a_caller_of_several_objects_is_checked_once_after_the_last_of_them():
+    checks = AppDependentChecks(2)
+    checks.register(0, [{"object_id": 7}, {"object_id": 8}], request=None)
+    checks.register(1, [{"object_id": 7}], request=None)
+    ready, completed = checks.fixed(0, {"7": "info 0"})
+    assert [check.object_id for check in ready] == [] and completed == []  # 8 has no impact, 7 waits for object 1
+    ready, completed = checks.fixed(1, {"7": "info 1"})
+    [check] = ready
+    assert check.object_id == "7" and check.owner == 0 and [index for index, _ in check.parent_infos] == [0, 1]
+    assert completed == []
+    assert checks.checked(check) == [0, 1]
+    assert [check.object_id for check in checks.owned(0)] == ["7"] and checks.owned(1) == []
+
+def test_an_edit_of_a_released_file_is_reported_late():
+    barrier = AppFileBarrier(2)
+    barrier.register(0, ["a"])
+    barrier.register(1, ["b"])
+    assert barrier.complete(0, edits(("a", "O0"))) == [("a", [0])]
+    assert barrier.complete(1, edits(("a", "O1"), ("b", "O1"))) == [("b", [1])]
+    assert barrier.late_files(0) == [] and barrier.late_files(1) == ["a"]
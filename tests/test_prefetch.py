@@ -0,0 +1,96 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from app_prefetch import AppImagingPrefetcher
+
+FILE = "\n".join(f"line {number}" for number in range(1, 21)) + "\n"
+
+class FakeImaging:
+    # Metadata of an object with three callers, the first one slowest to resolve
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+
+    def __count(self, kind, object_id):
+        with self.lock:
+            self.calls.append((kind, str(object_id)))
+
+    def get_source_locations(self, tenant, application, object_id):
+        self.__count("source-locations", object_id)
+        if str(object_id).startswith("c"):
+            time.sleep({"c1": 0.06, "c2": 0.03, "c3": 0.0}[object_id])
+        location = {"filePath": f"src/{object_id}.java", "fileId": 1, "startLine": 2, "endLine": 3}
+        return 200, {"typeId": "method", "mangling": f"{object_id}()", "sourceLocations": [location], "external": "false"}, f"url/{object_id}"
+
+    def get_callers(self, tenant, application, object_id):
+        self.__count("callers", object_id)
+        return 200, [{"id": "c1", "linkType": "call"}, {"id": "c2", "linkType": "call"}, {"id": "c3", "linkType": "call"}], "url/callers"
+
+    def get_callees(self, tenant, application, object_id):
+        self.__count("callees", object_id)
+        return 200, [], "url/callees"
+
+    def get_file(self, object_type, tenant, application, file_id, request_id):
+        self.__count("file", file_id)
+        return FILE
+
+def make_prefetcher(imaging=None):
+    return AppImagingPrefetcher(imaging or FakeImaging(), "T", "A", "R1", 4)
+
+def test_concurrent_callers_share_one_fetch():
+    prefetcher = make_prefetcher()
+    started, release = threading.Event(), threading.Event()
+    fetches = []
+    def fetch(tenant, application, object_id):
+        fetches.append(object_id)
+        started.set()
+        release.wait(5)
+        return 200, {"id": object_id}, "url"
+
+    call_once = prefetcher._AppImagingPrefetcher__call_once
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        first = executor.submit(call_once, "callers", 7, fetch)
+        started.wait(5)
+        waiting = [executor.submit(call_once, "callers", "7", fetch) for _ in range(2)]
+        release.set()
+        results = [first.result()] + [future.result() for future in waiting]
+    assert fetches == [7]
+    assert all(result is results[0] for result in results)
+    assert call_once("callees", 7, fetch)[1] == {"id": 7} and fetches == [7, 7]
+
+def test_a_failed_fetch_is_raised_to_every_caller():
+    prefetcher = make_prefetcher()
+    def fetch(tenant, application, object_id):
+        raise ConnectionError("imaging down")
+    call_once = prefetcher._AppImagingPrefetcher__call_once
+    for _ in range(2):
+        try:
+            call_once("callers", 7, fetch)
+        except ConnectionError:
+            pass
+        else:
+            raise AssertionError("the failure of the fetch was not raised")
+
+def test_callers_are_returned_in_their_original_order():
+    imaging = FakeImaging()
+    prefetcher = make_prefetcher(imaging)
+    context = prefetcher.get_context("o1")
+    assert context["obj_code"] == "line 2\nline 3"
+    assert [status for status, _ in context["impacts"]] == ["success"] * 3
+    assert [row["object_id"] for _, row in context["impacts"]] == ["c1", "c2", "c3"]
+    prefetcher.close()
+
+def test_an_object_shared_by_several_objects_is_fetched_once():
+    imaging = FakeImaging()
+    prefetcher = make_prefetcher(imaging)
+    prefetcher.prefetch(["o1", "o1", "c1"])
+    prefetcher.get_context("o1")
+    prefetcher.get_context("c1")
+    assert imaging.calls.count(("source-locations", "c1")) == 1
+    assert imaging.calls.count(("file", "1")) == 1
+    prefetcher.close()
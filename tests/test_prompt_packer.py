@@ -0,0 +1,57 @@
+from app_prompt_packer import AppPromptItem, AppPromptPacker
+from app_token_counter import AppTokenCounter
+from app_tokenizer import AppApproximateEncoding
+
+def make_items():
+    # 100 tokens at their first level, 10 at the second one
+    return [
+        AppPromptItem("parent", 2, ["p" * 400, "P" * 40]),
+        AppPromptItem("caller 1", 1, ["a" * 400, "A" * 40]),
+        AppPromptItem("caller 2", 1, ["b" * 400, "B" * 40]),
+    ]
+
+def render(kept):
+    return "TASK\n" + "\n".join(text for _, text in kept)
+
+def pack(budget, items=None):
+    encoding = AppApproximateEncoding()
+    packer = AppPromptPacker(AppTokenCounter(encoding, 100))
+    prompt, tokens, report = packer.pack(items or make_items(), render, budget)
+    # The count can only over-estimate the exact one
+    assert tokens >= len(encoding.encode(prompt))
+    return prompt, tokens, report, packer
+
+def test_a_prompt_under_the_budget_is_left_as_is():
+    prompt, tokens, report, packer = pack(1000)
+    assert report is None and tokens > 300
+    assert prompt == render([(item, item.levels[0]) for item in make_items()])
+    assert packer.stats()["trimmed"] == 0
+
+def test_the_last_item_of_the_lowest_rank_is_reduced_first():
+    _, tokens, report, _ = pack(250)
+    assert report["reduced"] == ["caller 2"] and report["dropped"] == []
+    assert tokens <= 250
+
+    _, tokens, report, _ = pack(150)
+    assert report["reduced"] == ["caller 1", "caller 2"] and report["dropped"] == []
+    assert tokens <= 150
+
+def test_every_item_is_reduced_before_the_first_one_is_dropped():
+    _, tokens, report, _ = pack(50)
+    assert report["reduced"] == ["parent", "caller 1", "caller 2"] and report["dropped"] == []
+    assert tokens <= 50
+
+    prompt, tokens, report, _ = pack(25)
+    assert report["dropped"] == ["caller 2"] and report["reduced"] == ["parent", "caller 1"]
+    assert "B" not in prompt and tokens <= 25
+
+def test_a_prompt_whose_mandatory_part_is_over_the_budget_is_reported_unfit():
+    prompt, tokens, report, packer = pack(0)
+    assert prompt == "TASK\n"
+    assert report["dropped"] == ["parent", "caller 1", "caller 2"]
+    assert report["tokens_after"] == tokens > report["budget"] == 0
+    stats = packer.stats()
+    assert stats["unfit"] == 1 and stats["dropped_items"] == 3 and stats["saved_tokens"] == report["tokens_before"] - tokens
+
+def test_normalize_removes_the_indentation_and_the_blank_line_runs():
+    assert AppPromptPacker.normalize("\n    def f():  \n\n\n        return 1\n\n") == "def f():\n\n    return 1"
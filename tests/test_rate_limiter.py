@@ -0,0 +1,54 @@
+import time
+
+from app_rate_limiter import AppRateLimiter
+
+def test_disabled_limits_never_wait():
+    limiter = AppRateLimiter(0, 0)
+    for _ in range(100):
+        assert limiter.acquire(10000) == 0.0
+    assert limiter.stats()["requests"] == 100
+
+def test_request_bucket_is_drawn_and_refilled():
+    limiter = AppRateLimiter(6000, 0)  # 100 requests per second
+    limiter.request_bucket = 1
+    assert limiter.acquire() == 0.0
+    assert limiter.wait_time() > 0
+    waited = limiter.acquire()
+    assert 0 < waited < 0.1
+    assert limiter.stats()["throttled"] == 1
+
+def test_token_bucket_is_settled_with_the_real_usage():
+    limiter = AppRateLimiter(0, 1000)
+    limiter.acquire(600)
+    assert round(limiter.token_bucket) == 400
+    limiter.settle(600, 100)
+    assert round(limiter.token_bucket) == 900
+    limiter.settle(100, 0)
+    assert limiter.token_bucket <= 1000  # never above the quota
+
+def test_a_call_larger_than_the_quota_still_goes_through():
+    limiter = AppRateLimiter(0, 100)
+    assert limiter.acquire(1000) == 0.0
+
+def test_an_oversized_call_is_settled_against_what_it_drew():
+    limiter = AppRateLimiter(0, 100)
+    limiter.acquire(1000)
+    assert round(limiter.token_bucket) == 0
+    limiter.settle(1000, 900)
+    assert round(limiter.token_bucket) == -800  # the real usage is owed, not offset by the part never drawn
+
+def test_rate_limited_blocks_every_caller():
+    limiter = AppRateLimiter(0, 0)
+    limiter.on_rate_limited(0.05)
+    assert limiter.wait_time() > 0
+    start_time = time.monotonic()
+    limiter.wait_unblocked()
+    assert time.monotonic() - start_time >= 0.04
+    assert limiter.stats()["rate_limited"] == 1
+
+def test_parse_retry_after():
+    assert AppRateLimiter.parse_retry_after("3") == 3.0
+    assert AppRateLimiter.parse_retry_after("-1") == 0.0
+    assert AppRateLimiter.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert AppRateLimiter.parse_retry_after("soon") is None
+    assert AppRateLimiter.parse_retry_after(None) is None
@@ -0,0 +1,31 @@
+import pytest
+
+from app_syntax_validator import AppSyntaxValidator
+
+@pytest.fixture
+def validator(config):
+    return AppSyntaxValidator(config)
+
+def test_a_valid_python_file_needs_no_cleanup(validator):
+    assert validator.check("import os\n\nprint(os.sep)\n", "Python", "a.py") == []
+
+def test_a_python_syntax_error_is_reported(validator):
+    problems = validator.check("def f(:\n    pass\n", "", "a.py")
+    assert len(problems) == 1 and problems[0].startswith("line 1")
+
+def test_a_missing_python_import_is_reported(validator):
+    assert validator.check("print(json.dumps({}))\n", "Python", "a.py") == ["unresolved import json (line 1)"]
+
+def test_json_and_xml_are_parsed(validator):
+    assert validator.check('{"a": 1}', "", "a.json") == []
+    assert validator.check("<a><b></a>", "", "a.xml")
+
+@pytest.mark.parametrize("technology, file_name", [("Java", "a.java"), ("C#", "a.cs"), ("", "a.js"), ("", "a.cpp"), ("COBOL", "a.cbl")])
+def test_technologies_without_a_parser_always_go_to_the_model(validator, technology, file_name):
+    assert validator.check("line 1\nline 2\n int x = ; foo(\n)", technology, file_name) is None
+    assert sum(counters["unsupported"] for counters in validator.stats()["technologies"].values()) == 1
+
+@pytest.mark.parametrize("value, enabled", [(True, True), ("True", True), ("1", True), ("False", False), ("false", False), ("0", False), (False, False)])
+def test_the_enabled_setting_accepts_strings(config, value, enabled):
+    config["CLEANUP_VALIDATION_ENABLED"] = value
+    assert AppSyntaxValidator(config).enabled is enabled
@@ -0,0 +1,14 @@
+import os
+
+import app_tokenizer
+from app_tokenizer import AppTokenizer
+
+def test_a_relative_cache_dir_is_resolved_from_the_module(config, monkeypatch):
+    monkeypatch.chdir("/")
+    config["TIKTOKEN_CACHE_DIR"] = "cache/tiktoken"
+    tokenizer = AppTokenizer("gpt-4o", config)
+    assert tokenizer.cache_dir == os.path.join(os.path.dirname(os.path.abspath(app_tokenizer.__file__)), "cache", "tiktoken")
+
+def test_an_absolute_cache_dir_is_kept(config, tmp_path):
+    config["TIKTOKEN_CACHE_DIR"] = str(tmp_path)
+    assert AppTokenizer("gpt-4o", config).cache_dir == str(tmp_path)
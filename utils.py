@@ -44,19 +44,3 @@ def generate_unique_alphanumeric(request_id, app_logger: AppLogger, length = 24)
 #         # Catch and print any errors that occur.
 #         print(f"An error occurred: {e}")
 #         app_logger.log_error("fix_common_json_issues", e)
-
-def replace_lines(app_logger: AppLogger, lines, replacements, request_id):
-    try:
-        # Make a copy of the original lines to work with
-        modified_lines = lines[:]
-        
-        # Sort the replacements by starting line in reverse order
-        # to avoid shifting issues when replacing lines
-        for (start, end), replacement_lines in sorted(replacements.items(), reverse=True):
-            modified_lines[int(start)-1:int(end)] = replacement_lines
-        
-        return modified_lines
-    except Exception as e:
-        # Catch and print any errors that occur.
-        print(f"An error occurred: {e}")
-        app_logger.log_error("replace_lines", e, request_id)